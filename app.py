@@ -1,55 +1,79 @@
 import io
-import re
+import json
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
 import pandas as pd
 import streamlit as st
 from converter import (
+    DEFAULT_FEED,
+    PRICE_TABLE_DIR,
+    SHOPIFY_IMPORT_MAX_BYTES,
+    ConversionReport,
+    FingerprintStore,
+    HandleRegistry,
+    MemoryLRUCache,
+    PriceTable,
+    cache_key,
+    content_hash,
     convert_etsy_to_shopify,
+    convert_incremental,
     convert_tiktok_to_shopify,
+    dedupe_handles,
+    lean_shopify_frame,
+    list_price_tables,
+    preview_shopify,
+    price_table_path,
+    read_etsy_csv,
+    read_tiktok,
+    write_shopify_csv_parts,
 )
+from images import IMAGE_CACHE_DB, ImageCheckCache, check_shopify_images
+from jobs import PREVIEW_ROWS, JobManager
+
+FINGERPRINT_DB = os.path.join(os.path.expanduser("~"), ".shopify_converter", "fingerprints.sqlite")
+
+RESULT_CACHE_MB = 512   # tổng RAM cho file đã parse + kết quả convert, dùng chung mọi session
+UPLOAD_WORKERS = 4      # số file upload convert cùng lúc trong một job
+JOB_POLL_SECONDS = 1.0  # chu kỳ rerun để cập nhật thanh tiến độ khi job còn chạy
+
+rerun = getattr(st, "rerun", None) or st.experimental_rerun
+
+
+@st.cache_resource
+def result_cache() -> MemoryLRUCache:
+    return MemoryLRUCache(RESULT_CACHE_MB * 1024 * 1024)
+
+
+@st.cache_resource
+def job_manager() -> JobManager:
+    return JobManager()
+
+
+def reset_form() -> None:
+    job = job_manager().get(st.session_state.pop("job_id", None))
+    if job is not None:
+        job.cancel()
+
+
+@st.cache_resource(max_entries=64, show_spinner=False)
+def compiled_price_table(text: str) -> PriceTable:
+    """Bảng giá dán vào → PriceTable dựng một lần cho mỗi nội dung, dùng chung mọi session."""
+    return PriceTable.from_text(text)
+
+
+@st.cache_resource(max_entries=64, show_spinner=False)
+def saved_price_table(name: str, mtime: float) -> PriceTable:
+    return PriceTable.load(name)   # mtime trong key → file bị ghi đè thì nạp lại
+
 
 st.set_page_config(page_title="Etsy/TikTok → Shopify Converter", page_icon="🛒", layout="centered")
 
 st.title("🛒 Etsy/TikTok → Shopify Converter")
 st.caption("Chọn nguồn dữ liệu, nhập Vendor & % Markup → Convert → Tải CSV cho Shopify")
 
-# ===== Helpers =====
-def parse_price_map(text: str) -> dict:
-    """
-    Nhận các format dòng:
-      - 8 x 12\" - 20 x 30cm (US$28.99)
-      - 11x14 : 34.99
-      - A3 / 29.7 x 42cm - 35.99
-      - Digital Download (US$11.99)
-    Trả về: {label: price_str}
-    """
-    price_map = {}
-    for raw in str(text or "").splitlines():
-        line = raw.strip()
-        if not line:
-            continue
-        # giá trong ngoặc
-        m = re.search(r"\((?:US?\$)?\s*([0-9][0-9\.,]*)\)\s*$", line, re.I)
-        price = None
-        label = None
-        if m:
-            price = m.group(1)
-            label = re.sub(r"\((?:US?\$)?\s*[0-9][0-9\.,]*\)\s*$", "", line).strip(" -:\t")
-        else:
-            # theo ": số" hoặc "- số" ở cuối
-            m2 = re.search(r"[:\-]\s*([0-9][0-9\.,]*)\s*$", line)
-            if m2:
-                price = m2.group(1)
-                label = re.sub(r"[:\-]\s*[0-9][0-9\.,]*\s*$", "", line).strip(" -:\t")
-            else:
-                # fallback: "label   số"
-                m3 = re.search(r"(.*\S)\s+([0-9][0-9\.,]*)\s*$", line)
-                if m3:
-                    label = m3.group(1).strip()
-                    price = m3.group(2)
-        if label and price:
-            price_map[label] = price
-    return price_map
-
 # ===== Sidebar =====
 with st.sidebar:
     st.header("⚙️ Cấu hình")
@@ -65,10 +89,52 @@ with st.sidebar:
                "11 x 14\" - 27 x 35cm (US$34.99)\n"
                "Digital Download (US$11.99)\n"
                "A3 / 29.7 x 42cm - 35.99")
+    saved_tables = list_price_tables()
+    table_choice = st.selectbox("Bảng giá đã lưu", ["(dán bảng giá bên dưới)"] + saved_tables,
+                                help=f"Bảng giá dùng chung cho nhiều shop, lưu tại {PRICE_TABLE_DIR}")
     price_map_text = st.text_area("Dán bảng giá theo biến thể (Option1)", height=180,
-                                  placeholder='8 x 12" - 20 x 30cm (US$28.99)')
+                                  placeholder='8 x 12" - 20 x 30cm (US$28.99)',
+                                  disabled=table_choice in saved_tables)
+    if table_choice in saved_tables:
+        price_table = saved_price_table(table_choice, os.path.getmtime(price_table_path(table_choice)))
+        st.caption(f"📒 {table_choice}: {len(price_table)} nhãn")
+    else:
+        price_table = compiled_price_table(price_map_text) if price_map_text.strip() else None
+        if price_table:
+            save_name = st.text_input("Lưu bảng giá này với tên", value="", placeholder="vd: poster-sizes")
+            if st.button("💾 Lưu bảng giá", disabled=not save_name.strip()):
+                try:
+                    price_table.save(save_name.strip())
+                    st.success(f"Đã lưu bảng giá '{save_name.strip()}' ({len(price_table)} nhãn)")
+                except (OSError, ValueError) as e:
+                    st.error(f"Không lưu được bảng giá: {e}")
     apply_markup_on_map = st.checkbox("Áp dụng Markup (%) lên giá đã map", value=False)
 
+    st.markdown("---")
+    st.subheader("📦 File output")
+    split_mb = st.number_input("Chia file tối đa (MB)", value=SHOPIFY_IMPORT_MAX_BYTES / (1024 * 1024), min_value=0.0,
+                               step=1.0, help="Shopify giới hạn 15MB mỗi file import. 0 = không chia. "
+                                              "Một handle không bao giờ bị tách sang 2 file.")
+    compression = st.selectbox("Nén", ["Không nén", "zip", "gzip"])
+    lean_dtypes = st.checkbox("Kiểu dữ liệu gọn (tiết kiệm RAM)", value=True,
+                              help="Cột lặp nhiều (Vendor, Status, Option, Inventory, giá) lưu dạng category, "
+                                   "cờ True/False dạng boolean. CSV ghi ra không đổi.")
+
+    st.markdown("---")
+    st.subheader("🖼️ Ảnh")
+    check_images = st.checkbox("Kiểm tra link ảnh sau khi convert", value=False,
+                               help="Chuẩn hoá URL, bỏ ảnh trùng trong cùng sản phẩm, gửi HEAD song song tới từng link. "
+                                    "Kết quả được cache nên lần sau nhanh hơn.")
+    drop_broken_images = st.checkbox("Bỏ ảnh lỗi khỏi output", value=False, disabled=not check_images)
+
+    st.markdown("---")
+    st.subheader("🔁 Incremental")
+    incremental = st.checkbox("Chỉ xuất listing mới / thay đổi so với lần trước", value=False,
+                              help="Fingerprint từng handle (nội dung + tham số convert) được lưu sau mỗi lần convert. "
+                                   "Đổi markup/vendor/bảng giá → xuất lại toàn bộ.")
+    feed = st.text_input("Tên feed (shop)", value=DEFAULT_FEED, disabled=not incremental,
+                         help="Mỗi shop / nguồn một tên riêng để so đúng lần trước.")
+
     st.markdown("---")
     st.write("**Mặc định Shopify** (đã theo yêu cầu):")
     st.code("""
@@ -80,59 +146,269 @@ Inventory Policy = continue (hết vẫn cho đặt)
 """, language="markdown")
 
 # ===== File uploader =====
+# Nhiều file → convert song song, gộp thành một file import (handle trùng giữa các file tự đổi tên)
 if source == "Etsy CSV":
-    uploaded = st.file_uploader("Tải lên file CSV export từ Etsy", type=["csv"], accept_multiple_files=False)
+    uploaded = st.file_uploader("Tải lên file CSV export từ Etsy (chọn được nhiều file)", type=["csv"],
+                                accept_multiple_files=True)
 else:
-    uploaded = st.file_uploader("Tải lên file CSV/XLSX export từ TikTok Shop", type=["csv", "xlsx"], accept_multiple_files=False)
+    uploaded = st.file_uploader("Tải lên file CSV/XLSX export từ TikTok Shop (chọn được nhiều file)",
+                                type=["csv", "xlsx"], accept_multiple_files=True)
+uploaded = list(uploaded or [])
 
 col_btn1, col_btn2 = st.columns([1, 1])
 
-if col_btn1.button("🚀 Convert", use_container_width=True, disabled=(uploaded is None)):
-    if uploaded is None:
-        st.warning("Vui lòng tải file lên trước.")
-        st.stop()
 
-    variant_price_map = parse_price_map(price_map_text) if price_map_text.strip() else None
-
-    try:
-        if source == "Etsy CSV":
-            df_out = convert_etsy_to_shopify(
-                uploaded,
-                vendor_text=vendor,
-                markup_pct=markup_pct,
-                variant_price_map=variant_price_map,
-                apply_markup_on_map=apply_markup_on_map,
-                compare_at_markup_pct=compare_at_markup_pct,
-            )
-            base_name = (uploaded.name or "etsy").rsplit('.', 1)[0]
-            out_name = f"shopify_import_from_etsy__{base_name}.csv"
-        else:
-            df_out = convert_tiktok_to_shopify(
-                uploaded,
-                vendor_text=vendor,
-                markup_pct=markup_pct,
-                compare_at_markup_pct=compare_at_markup_pct,
-            )
-            base_name = (uploaded.name or "tiktok").rsplit('.', 1)[0]
-            out_name = f"shopify_import_from_tiktok__{base_name}.csv"
+def convert_upload(upload, src_key: str, params: dict, report_params: dict, incremental_feed, progress=None,
+                   lean: bool = False):
+    """
+    Một file upload: đọc (cache) → convert / incremental → (lean) dtype gọn trước khi vào cache.
+    Trả (rows Shopify, báo cáo, delta, có dùng cache không). Fingerprint incremental chưa được lưu:
+    run_conversion lưu sau khi đã ghi xong output.
+    """
+    report = ConversionReport(src_key, file=upload.name, **report_params)
+    # Cache theo hash nội dung file: file đã parse dùng lại khi đổi tham số, kết quả dùng lại khi không đổi gì
+    cache = result_cache()
+    upload_hash = content_hash(upload)
+    with report.stage("read"):
+        source_df = cache.get_or_compute(
+            cache_key("input", src_key, upload_hash),
+            lambda: read_etsy_csv(upload) if src_key == "etsy" else read_tiktok(upload),
+        )
+    output_key = cache_key("output", src_key, upload_hash, params, lean)
+    cached = None if incremental_feed else cache.get(output_key)
+    delta = None
+    if incremental_feed:
+        with FingerprintStore(FINGERPRINT_DB) as store:
+            df_out, delta = convert_incremental(source_df, src_key, store, feed=incremental_feed, commit=False,
+                                                report=report, progress=progress, **params)
+        if lean:
+            df_out = lean_shopify_frame(df_out, report)
+    elif cached is not None:
+        df_out, counts = cached
+        report.params["from_cache"] = True
+        report.add(**counts)
+    else:
+        convert = convert_etsy_to_shopify if src_key == "etsy" else convert_tiktok_to_shopify
+        df_out = convert(source_df, report=report, progress=progress, **params)
+        if lean:
+            df_out = lean_shopify_frame(df_out, report)
+        cache.put(output_key, (df_out, dict(report.counts)))
+    return df_out, report, delta, cached is not None
+
+
+def run_conversion(uploads: list, src_key: str, params: dict, report_params: dict, incremental_feed, output: dict,
+                   image_check=None, lean: bool = False, progress=None, preview=None, workdir: str = "") -> dict:
+    """
+    Chạy trong thread của JobManager: (preview nhanh từ đầu file đầu tiên) → convert các file song song → gộp
+    theo thứ tự upload (handle trùng giữa các file được đổi tên bởi HandleRegistry) → (tuỳ chọn) kiểm tra
+    link ảnh → ghi part vào workdir của job. Kết quả chỉ giữ PREVIEW_ROWS dòng đầu, output nằm trên đĩa.
+    """
+    if preview is not None and not incremental_feed:
+        try:
+            preview(preview_shopify(uploads[0], src_key, n_rows=PREVIEW_ROWS, **params))
+        except Exception:
+            pass   # preview chỉ để xem trước, lỗi thật (nếu có) sẽ hiện khi convert cả file
+    names = [u.name or src_key for u in uploads]
+    feeds = [None] * len(uploads)
+    if incremental_feed:
+        feeds = [incremental_feed if len(uploads) == 1 else f"{incremental_feed}:{n.rsplit('.', 1)[0]}" for n in names]
+    done, total = [0] * len(uploads), [0] * len(uploads)
+    lock = threading.Lock()
 
-        st.success("✅ Convert thành công! Xem preview & tải xuống bên dưới.")
-        st.write("### Preview (tối đa 200 dòng)")
-        st.dataframe(df_out.head(200), use_container_width=True)
+    def file_progress(i):
+        if progress is None:
+            return None
 
-        csv_bytes = df_out.to_csv(index=False).encode("utf-8-sig")
+        def report_progress(d, t, rows=None):
+            with lock:
+                done[i], total[i] = d, t
+                progress(sum(done), sum(total), rows)
+        return report_progress
+
+    with ThreadPoolExecutor(max_workers=min(len(uploads), UPLOAD_WORKERS)) as pool:
+        futures = [pool.submit(convert_upload, u, src_key, params, report_params, f, file_progress(i), lean)
+                   for i, (u, f) in enumerate(zip(uploads, feeds))]
+        try:
+            results = [fut.result() for fut in futures]
+        except BaseException:
+            for fut in futures:
+                fut.cancel()
+            raise
+
+    registry = HandleRegistry()
+    owners = [f"{i}:{n}" for i, n in enumerate(names)]   # tên file có thể trùng → thêm số thứ tự
+    frames = dedupe_handles([r[0] for r in results], owners, registry)
+    labels = names if len(set(names)) == len(names) else owners
+    renamed = {n: registry.renamed[o] for n, o in zip(labels, owners) if registry.renamed.get(o)}
+    broken = {}
+    if image_check is not None:
+        with ImageCheckCache(IMAGE_CACHE_DB) as image_cache:
+            for i, r in enumerate(results):
+                frames[i], summary = check_shopify_images(frames[i], cache=image_cache, report=r[1], **image_check)
+                broken.update(summary["broken"])
+
+    base_name = names[0].rsplit('.', 1)[0] + (f"__{len(names)}_files" if len(names) > 1 else "")
+    out_name = f"shopify_import_from_{src_key}__{base_name}.csv"
+    # Ghi ra đĩa theo khối (không giữ cả text lẫn bytes CSV trong RAM), chia part theo giới hạn Shopify.
+    # File nằm trong workdir của job, JobManager dọn khi job hết hạn.
+    parts = write_shopify_csv_parts(frames, os.path.join(workdir, out_name), report=results[0][1], **output)
+    if incremental_feed:
+        # Chỉ lưu fingerprint khi output đã ghi xong: lỗi ở bước trước → lần sau các listing vẫn nằm trong delta
+        with FingerprintStore(FINGERPRINT_DB) as store:
+            for feed, r in zip(feeds, results):
+                store.save(feed, r[2]["fingerprints"], r[2]["removed"])
+    if output["compression"] == "zip":
+        downloads = [(parts[0]["file"], "application/zip")]
+    else:
+        mime = "application/gzip" if output["compression"] == "gzip" else "text/csv"
+        downloads = [(p["file"], mime) for p in parts]
+    deltas = {n: r[2] for n, r in zip(labels, results) if r[2] is not None}
+    head = pd.concat([f.head(PREVIEW_ROWS) for f in frames], ignore_index=True).head(PREVIEW_ROWS)
+    return dict(df_out=head, reports=[r[1] for r in results], deltas=deltas, cached=all(r[3] for r in results),
+                renamed=renamed, broken=broken, image_check=image_check, parts=parts, downloads=downloads,
+                base_name=base_name)
+
+
+def show_result(res: dict) -> None:
+    reports, deltas, parts, base_name = res["reports"], res["deltas"], res["parts"], res["base_name"]
+    st.success(f"✅ Convert thành công{f' {len(reports)} file' if len(reports) > 1 else ''}! "
+               "Xem preview & tải xuống bên dưới."
+               + (" (⚡ dùng lại kết quả đã convert)" if res["cached"] else ""))
+    for name, delta in deltas.items():
+        label = f" {name}" if len(deltas) > 1 else ""
+        st.info(f"🔁 Incremental{label}: {len(delta['new'])} handle mới, {len(delta['changed'])} thay đổi, "
+                f"{delta['unchanged']} giữ nguyên (bỏ qua), {len(delta['removed'])} không còn trong file.")
+        if delta["removed"]:
+            st.download_button(
+                label=f"⬇️ Danh sách {len(delta['removed'])} handle đã gỡ{label} (xử lý tay trên Shopify)",
+                data="\n".join(delta["removed"]),
+                file_name=f"removed_handles__{name.rsplit('.', 1)[0]}.txt",
+                mime="text/plain",
+            )
+    if res["renamed"]:
+        st.warning("🔀 Handle trùng giữa các file đã được đổi tên (thêm -2, -3…): "
+                   + "; ".join(f"{name}: {len(m)} handle" for name, m in res["renamed"].items()))
         st.download_button(
-            label="⬇️ Tải CSV cho Shopify",
-            data=csv_bytes,
-            file_name=out_name,
+            label="⬇️ Danh sách handle đã đổi tên (CSV)",
+            data=pd.DataFrame(
+                [(name, old, new) for name, m in res["renamed"].items() for old, new in m.items()],
+                columns=["File", "Handle gốc", "Handle mới"],
+            ).to_csv(index=False),
+            file_name=f"renamed_handles__{base_name}.csv",
             mime="text/csv",
-            use_container_width=True,
         )
-    except Exception as e:
-        st.error(f"❌ Lỗi khi convert: {e}")
+    if res["broken"]:
+        action = "đã bỏ khỏi output" if res["image_check"]["drop_broken"] else "vẫn giữ trong output"
+        st.warning(f"🖼️ {len(res['broken'])} link ảnh lỗi ({action}).")
+        st.download_button(
+            label="⬇️ Danh sách link ảnh lỗi",
+            data="".join(f"{url}\t{why}\n" for url, why in res["broken"].items()),
+            file_name=f"broken_images__{base_name}.txt",
+            mime="text/plain",
+        )
+    elif res["image_check"] is not None:
+        st.info("🖼️ Tất cả link ảnh đều truy cập được (ảnh trùng trong cùng sản phẩm đã được bỏ).")
+    st.write(f"### Preview (tối đa {PREVIEW_ROWS} dòng)")
+    st.dataframe(res["df_out"], use_container_width=True)
+
+    if len(parts) > 1:
+        st.info(f"Output được chia thành {len(parts)} file: "
+                + ", ".join(f"{p['name']} ({p['rows']} dòng)" for p in parts))
+    for path, mime in res["downloads"]:
+        if not os.path.exists(path):
+            st.warning("File output đã hết hạn, vui lòng convert lại.")
+            break
+        with open(path, "rb") as fh:
+            st.download_button(
+                label=f"⬇️ Tải {os.path.basename(path)}",
+                data=fh.read(),
+                file_name=os.path.basename(path),
+                mime=mime,
+                use_container_width=True,
+            )
+
+    with st.expander("📊 Chi tiết hiệu năng (thời gian từng bước, bộ nhớ, cache)"):
+        for report in reports:
+            rss = f" • Peak RSS: {report.peak_rss_mb:.0f}MB" if report.peak_rss_mb is not None else ""
+            if len(reports) > 1:
+                st.write(f"**{report.params.get('file', '')}**")
+            st.caption(f"Tổng: {report.total_seconds:.2f}s{rss}")
+            st.dataframe(report.stages_frame(), use_container_width=True, hide_index=True)
+            st.write("**Số lượng**", report.counts)
+            if report.memory:
+                st.write(f"**Bộ nhớ output**: {report.memory['before_bytes'] / 2**20:.1f}MB → "
+                         f"{report.memory['after_bytes'] / 2**20:.1f}MB (dtype gọn)")
+                st.dataframe(report.memory_frame(), use_container_width=True, hide_index=True)
+        st.write("**Cache slugify/token**", reports[-1].cache)
+        st.write("**Cache file / kết quả (app)**", result_cache().stats())
+        st.download_button(
+            label="⬇️ Tải báo cáo JSON",
+            data=reports[0].to_json() if len(reports) == 1 else
+            json.dumps([r.to_dict() for r in reports], ensure_ascii=False, indent=2),
+            file_name=f"{base_name}__report.json",
+            mime="application/json",
+        )
+
+
+if col_btn1.button("🚀 Convert", use_container_width=True, disabled=not uploaded):
+    if not uploaded:
+        st.warning("Vui lòng tải file lên trước.")
+        st.stop()
+
+    src_key = "etsy" if source == "Etsy CSV" else "tiktok"
+    params = dict(vendor_text=vendor, markup_pct=markup_pct, compare_at_markup_pct=compare_at_markup_pct)
+    if src_key == "etsy":
+        params.update(variant_price_map=price_table or None, apply_markup_on_map=apply_markup_on_map)
+    # Chụp nội dung upload: widget có thể đổi/xoá file trong lúc job còn chạy
+    uploads = []
+    for f in uploaded:
+        upload = io.BytesIO(f.getvalue())
+        upload.name = f.name
+        uploads.append(upload)
+    old = job_manager().get(st.session_state.get("job_id"))
+    if old is not None and old.running:
+        old.cancel()
+    job = job_manager().submit(
+        partial(
+            run_conversion,
+            uploads,
+            src_key,
+            params,
+            dict(markup_pct=markup_pct, compare_at_markup_pct=compare_at_markup_pct),
+            f"{src_key}:{feed.strip() or DEFAULT_FEED}" if incremental else None,
+            dict(max_bytes=int(split_mb * 1024 * 1024) or None,
+                 compression=None if compression == "Không nén" else compression),
+            dict(drop_broken=drop_broken_images) if check_images else None,
+            lean=lean_dtypes,
+        ),
+        label=uploaded[0].name if len(uploaded) == 1 else f"{len(uploaded)} file",
+    )
+    st.session_state["job_id"] = job.id
+    st.session_state["job_unit"] = "listing" if src_key == "etsy" else "sản phẩm"
+
+# ===== Job nền: tiến độ / huỷ / kết quả (giữ qua các lần rerun) =====
+job = job_manager().get(st.session_state.get("job_id"))
+if job is not None and job.running:
+    unit = st.session_state.get("job_unit", "")
+    st.progress(job.fraction, text=f"⏳ Đang convert {job.label}: {job.done}/{job.total or '?'} {unit} "
+                                   f"({job.elapsed():.0f}s)")
+    if st.button("⛔ Huỷ convert"):
+        job.cancel()
+    partial_rows = job.preview()
+    if len(partial_rows):
+        st.write(f"### Preview tạm ({len(partial_rows)} dòng đầu)")
+        st.dataframe(partial_rows, use_container_width=True)
+    time.sleep(JOB_POLL_SECONDS)
+    rerun()
+elif job is not None and job.status == "done":
+    show_result(job.result)
+elif job is not None and job.status == "error":
+    st.error(f"❌ Lỗi khi convert: {job.error}")
+elif job is not None and job.status == "cancelled":
+    st.warning(f"⛔ Đã huỷ convert {job.label} ({job.done}/{job.total}).")
 
 with col_btn2:
-    st.button("🧹 Reset form", use_container_width=True, on_click=lambda: st.experimental_rerun())
+    st.button("🧹 Reset form", use_container_width=True, on_click=reset_form)
 
 st.markdown("---")
 st.caption("Built with ❤️ for POD workflows • Streamlit app")
@@ -0,0 +1,388 @@
+# bench.py — benchmark converter trên catalog Etsy/TikTok giả lập (deterministic)
+#
+#   python bench.py                              # 1k, 10k, 100k variants, mọi stage
+#   python bench.py --scales 1k,1M --stages etsy_convert,tiktok_convert
+#   python bench.py --save-baseline              # ghi kết quả làm baseline (theo máy)
+#   python bench.py --tolerance 0.2              # so baseline, chậm/tốn RAM hơn 20% → regression, exit 1
+#
+# Baseline mặc định là bench_baselines.json đi kèm repo; chưa có file thì lần chạy đầu ghi ra làm baseline.
+# Mỗi (stage, scale) chạy trong một process riêng; RSS báo cáo là phần tăng thêm so với mức ngay sau setup
+# (input đã đọc sẵn không tính vào stage).
+import argparse
+import gc
+import json
+import os
+import random
+import subprocess
+import sys
+import tempfile
+import time
+from typing import List, Dict, Any, Optional
+
+import pandas as pd
+
+import converter
+
+DEFAULT_SCALES = "1k,10k,100k"
+DEFAULT_BASELINE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "bench_baselines.json")
+DEFAULT_WORK_DIR = os.path.join(tempfile.gettempdir(), "shopify_bench")
+MIN_REGRESSION_S = 0.05   # chênh lệch dưới mức này coi là nhiễu (stage rất nhanh)
+MIN_REGRESSION_MB = 5.0   # tương tự cho RSS tăng thêm
+
+# ================= Generator dữ liệu giả lập =================
+POSTER_SIZES = ['5 x 7"', '8 x 10"', '8 x 12" - 20 x 30cm', '11 x 14" - 27 x 35cm', '12 x 16"', '16 x 20"',
+                '18 x 24"', '24 x 36"', 'A4 / 21 x 29.7cm', 'A3 / 29.7 x 42cm', 'A2 / 42 x 59.4cm', '50 x 70cm']
+APPAREL_SIZES = ["XS", "S", "M", "L", "XL", "2XL", "3XL", "3T", "4T", "Kids 5-6"]
+COLORS = ["Black", "White", "Navy", "Heather Grey", "Sand", "Forest Green", "Maroon", "Pink"]
+FRAMES = ["Unframed", "Black Frame", "White Frame", "Oak Frame"]
+DIGITAL_OPTIONS = ["Digital Download", "Printable PDF", "PNG", "JPG"]
+NOUNS = ["Poster", "Print", "Wall Art", "T-Shirt", "Hoodie", "Mug", "Canvas", "Sticker", "Planner", "Card"]
+ADJECTIVES = ["Vintage", "Minimalist", "Boho", "Retro", "Custom", "Personalized", "Funny", "Floral", "Abstract",
+              "Botanical", "Nursery", "Mid Century"]
+LOREM = (
+    "Lorem ipsum dolor sit amet, consectetur adipiscing elit, sed do eiusmod tempor incididunt ut labore et dolore "
+    "magna aliqua. <p>Ut enim ad minim veniam, quis nostrud exercitation ullamco laboris nisi ut aliquip ex ea "
+    "commodo consequat.</p>\nDuis aute irure dolor in reprehenderit in voluptate velit esse cillum dolore eu fugiat "
+    "nulla pariatur, \"excepteur\" sint occaecat cupidatat non proident.\n• Kích thước: xem bảng size • Chất liệu: "
+    "giấy mỹ thuật 230gsm, mực pigment — không phai màu.\n"
+) * 40
+
+
+def _description(rnd: random.Random, lo: int, hi: int) -> str:
+    start = rnd.randrange(0, 2000)
+    return LOREM[start:start + rnd.randint(lo, hi)]
+
+
+def _price(rnd: random.Random) -> str:
+    p = rnd.choice([9.99, 12.5, 19.99, 24.0, 28.99, 34.99, 49.95, 89.0, 1234.56])
+    return rnd.choice([f"{p:.2f}", f"{p:.2f}", f"US${p:.2f}", f"{p:,.2f}".replace(",", "X").replace(".", ",").replace("X", ".")])
+
+
+def _token(v: str) -> str:
+    return "".join(ch for ch in v.upper() if ch.isalnum())[:8]
+
+
+def gen_etsy_export(n_variants: int, seed: int = 0) -> pd.DataFrame:
+    """
+    Etsy listings export với ≥ n_variants biến thể (Option1 × Option2) sau khi convert.
+    Trộn poster (size + digital), áo (size × màu), digital-only; mô tả dài; 1–20 ảnh; SKU khớp token size.
+    """
+    rnd = random.Random(seed)
+    rows: List[Dict[str, Any]] = []
+    total = 0
+    i = 0
+    while total < n_variants:
+        kind = rnd.random()
+        if kind < 0.45:      # poster: size (+ Digital Download), đôi khi khung
+            opt1 = rnd.sample(POSTER_SIZES, rnd.randint(2, 8))
+            if rnd.random() < 0.4:
+                opt1.append(rnd.choice(DIGITAL_OPTIONS))
+            opt2 = rnd.sample(FRAMES, rnd.randint(2, 4)) if rnd.random() < 0.3 else []
+            names = ("Size", "Frame")
+        elif kind < 0.85:    # áo: size × màu
+            opt1 = rnd.sample(APPAREL_SIZES, rnd.randint(3, 7))
+            opt2 = rnd.sample(COLORS, rnd.randint(1, 5))
+            names = ("Size", "Color")
+        else:                # digital-only
+            opt1 = rnd.sample(DIGITAL_OPTIONS, rnd.randint(1, 3))
+            opt2 = []
+            names = ("Format", "")
+        prefix = f"{rnd.choice(['PST', 'TEE', 'DGT'])}{i}"
+        if rnd.random() < 0.8:
+            skus = ",".join(f"{prefix}-{_token(v)}" for v in opt1 if not converter.is_digital_like(v))
+        else:
+            skus = ""
+        row = {
+            "TITLE": f"{rnd.choice(ADJECTIVES)} {rnd.choice(ADJECTIVES)} {rnd.choice(NOUNS)} #{i}",
+            "DESCRIPTION": _description(rnd, 300, 3000),
+            "PRICE": _price(rnd),
+            "CURRENCY_CODE": "USD",
+            "QUANTITY": rnd.randint(1, 999),
+            "TAGS": ",".join(rnd.sample(ADJECTIVES, 5)),
+            "MATERIALS": "paper,ink",
+            "VARIATION 1 TYPE": names[0],
+            "VARIATION 1 NAME": names[0],
+            "VARIATION 1 VALUES": ",".join(opt1),
+            "VARIATION 2 TYPE": names[1] if opt2 else "",
+            "VARIATION 2 NAME": names[1] if opt2 else "",
+            "VARIATION 2 VALUES": ",".join(opt2),
+            "SKU": skus,
+            "LISTING ID": 1000000000 + i,
+        }
+        for k in range(1, rnd.randint(1, 20) + 1):
+            row[f"IMAGE{k}"] = f"https://i.etsystatic.com/{seed}/r/il/{i:x}/{k}/il_fullxfull.jpg"
+        rows.append(row)
+        total += len(opt1) * max(len(opt2), 1)
+        i += 1
+    image_cols = [f"IMAGE{k}" for k in range(1, 21)]
+    cols = [c for c in rows[0] if not c.startswith("IMAGE")] + image_cols
+    return pd.DataFrame(rows, columns=cols)
+
+
+def gen_tiktok_export(n_variants: int, seed: int = 0) -> pd.DataFrame:
+    """
+    TikTok Shop export: mỗi dòng một SKU, các dòng cùng Product ID là một sản phẩm.
+    Size × màu hoặc digital (PDF/PNG); mô tả dài lặp lại mỗi dòng; Main Image + tối đa 19 ảnh trong cột Images.
+    """
+    rnd = random.Random(seed)
+    rows: List[Dict[str, Any]] = []
+    p = 0
+    while len(rows) < n_variants:
+        pid = str(1729000000000000000 + p)
+        name = f"{rnd.choice(ADJECTIVES)} {rnd.choice(NOUNS)} {p}"
+        desc = _description(rnd, 200, 1500)
+        if rnd.random() < 0.15:
+            combos = [(v, "") for v in rnd.sample(DIGITAL_OPTIONS, rnd.randint(1, 3))]
+            names = ("Format", "")
+        else:
+            sizes = rnd.sample(APPAREL_SIZES, rnd.randint(1, 5))
+            colors = rnd.sample(COLORS, rnd.randint(1, 4))
+            combos = [(s, c) for s in sizes for c in colors]
+            names = ("Size", "Color")
+        imgs = [f"https://p16-oec-va.ibyteimg.com/{seed}/{p:x}/{k}.jpeg" for k in range(rnd.randint(1, 20))]
+        for o1, o2 in combos:
+            rows.append({
+                "Product ID": pid,
+                "Product Name": name,
+                "Product description": desc,
+                "SKU ID": str(1730000000000000000 + len(rows)),
+                "Seller SKU": f"TT{p}-{_token(o1)}-{_token(o2)}" if rnd.random() < 0.9 else "",
+                "Variant 1 Name": names[0],
+                "Variant 1 Value": o1,
+                "Variant 2 Name": names[1] if o2 else "",
+                "Variant 2 Value": o2,
+                "SKU Price": _price(rnd),
+                "Quantity": rnd.randint(0, 500),
+                "Main Image": imgs[0],
+                "Images": ",".join(imgs[1:]),
+            })
+        p += 1
+    return pd.DataFrame(rows)
+
+
+def parse_scale(text: str) -> int:
+    """'1k' → 1000, '1M' → 1000000, '2500' → 2500."""
+    text = text.strip().lower()
+    mult = {"k": 1000, "m": 1000000}.get(text[-1:], 1)
+    return int(float(text[:-1] if mult > 1 else text) * mult)
+
+
+def ensure_inputs(n_variants: int, seed: int, work_dir: str) -> Dict[str, str]:
+    """Sinh (một lần) file Etsy/TikTok CSV cho scale này trong work_dir."""
+    os.makedirs(work_dir, exist_ok=True)
+    paths = {
+        "etsy": os.path.join(work_dir, f"etsy_{n_variants}_{seed}.csv"),
+        "tiktok": os.path.join(work_dir, f"tiktok_{n_variants}_{seed}.csv"),
+    }
+    for source, gen in (("etsy", gen_etsy_export), ("tiktok", gen_tiktok_export)):
+        if not os.path.exists(paths[source]):
+            tmp = paths[source] + ".tmp"
+            gen(n_variants, seed).to_csv(tmp, index=False)
+            os.replace(tmp, paths[source])
+    return paths
+
+# ================= Stage =================
+# Mỗi stage: (setup, run). setup(paths) đọc sẵn input (không tính giờ), run(data) trả số item đã xử lý.
+
+def _setup_etsy_values(paths, col):
+    etsy = converter.read_etsy_csv(paths["etsy"])
+    return etsy[col].tolist()
+
+
+def _setup_tokens(paths):
+    etsy = converter.read_etsy_csv(paths["etsy"])
+    opts = [v for cell in etsy["VARIATION 1 VALUES"] for v in converter.split_list_field(cell)]
+    skus = [s for cell in etsy["SKU"] for s in converter.split_list_field(cell)]
+    return opts, skus
+
+
+def _run_tokens(data):
+    opts, skus = data
+    converter.clear_normalizer_cache()
+    for v in opts:
+        converter.option1_token(v)
+    for s in skus:
+        converter.sku_token(s)
+    return len(opts) + len(skus)
+
+
+def _run_sku_matcher(data):
+    etsy = data
+    n = 0
+    for cell_opts, cell_skus in zip(etsy["VARIATION 1 VALUES"], etsy["SKU"]):
+        skus = converter.split_list_field(cell_skus)
+        if not skus:
+            continue
+        matcher = converter.SkuMatcher(skus)
+        for opt in converter.split_list_field(cell_opts):
+            matcher.match(opt)
+            n += 1
+    return n
+
+
+def _run_write(paths):
+    with tempfile.TemporaryDirectory() as tmp:
+        parts = converter.write_shopify_csv_parts(
+            converter.iter_etsy_to_shopify(paths["etsy"]), os.path.join(tmp, "out.csv"),
+            max_bytes=converter.SHOPIFY_IMPORT_MAX_BYTES,
+        )
+    return sum(p["rows"] for p in parts)
+
+
+STAGES = {
+    "etsy_read": (lambda paths: paths, lambda paths: len(converter.read_etsy_csv(paths["etsy"]))),
+    "etsy_convert": (lambda paths: paths, lambda paths: len(converter.convert_etsy_to_shopify(paths["etsy"]))),
+    "etsy_stream_write": (lambda paths: paths, _run_write),
+    "tiktok_read": (lambda paths: paths, lambda paths: len(converter.read_tiktok(paths["tiktok"]))),
+    "tiktok_convert": (lambda paths: paths, lambda paths: len(converter.convert_tiktok_to_shopify(paths["tiktok"]))),
+    "parse_price": (lambda paths: _setup_etsy_values(paths, "PRICE"),
+                    lambda prices: len([converter.parse_price(p) for p in prices])),
+    "parse_price_series": (lambda paths: _setup_etsy_values(paths, "PRICE"),
+                           lambda prices: len(converter.parse_price_series(prices))),
+    "tokens": (_setup_tokens, _run_tokens),
+    "sku_matcher": (lambda paths: converter.read_etsy_csv(paths["etsy"]), _run_sku_matcher),
+}
+
+
+def _proc_rss_mb() -> Dict[str, float]:
+    """VmRSS (hiện tại) / VmHWM (peak) của process, MB; rỗng nếu không có /proc (macOS, Windows)."""
+    try:
+        with open("/proc/self/status", encoding="ascii") as fh:
+            fields = dict(line.split(":", 1) for line in fh if ":" in line)
+        return {k: round(int(fields[k].split()[0]) / 1024, 1) for k in ("VmRSS", "VmHWM")}
+    except (OSError, KeyError, ValueError):
+        return {}
+
+
+def _reset_peak_rss() -> bool:
+    """Đặt lại peak RSS (VmHWM) về RSS hiện tại (Linux ≥ 4.0) → peak đo sau đó không gồm phần setup."""
+    try:
+        with open("/proc/self/clear_refs", "w") as fh:
+            fh.write("5")
+        return bool(_proc_rss_mb())
+    except OSError:
+        return False
+
+
+def run_stage(stage: str, paths: Dict[str, str], repeat: int = 1) -> Dict[str, Any]:
+    """
+    Chạy stage trong process hiện tại (lấy thời gian tốt nhất sau repeat lần).
+    rss_mb: peak RSS lúc chạy trừ mức RSS ngay sau setup. Không đặt lại được peak (ngoài Linux)
+    thì lấy peak sau setup làm mức gốc → chỉ thấy phần vượt quá peak của setup.
+    """
+    setup, run = STAGES[stage]
+    data = setup(paths)
+    gc.collect()
+    exact = _reset_peak_rss()
+    setup_rss = _proc_rss_mb()["VmRSS"] if exact else converter.peak_rss_mb()
+    best, items = float("inf"), 0
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        items = run(data)
+        best = min(best, time.perf_counter() - t0)
+    peak = _proc_rss_mb()["VmHWM"] if exact else converter.peak_rss_mb()
+    return {
+        "wall_s": round(best, 4),
+        "items": items,
+        "throughput": round(items / best, 1) if best > 0 else None,
+        "setup_rss_mb": setup_rss,
+        "peak_rss_mb": peak,
+        "rss_mb": round(max(peak - setup_rss, 0.0), 1) if peak is not None and setup_rss is not None else None,
+    }
+
+
+def run_stage_subprocess(stage: str, paths: Dict[str, str], repeat: int) -> Dict[str, Any]:
+    cmd = [sys.executable, os.path.abspath(__file__), "--child", stage,
+           "--etsy", paths["etsy"], "--tiktok", paths["tiktok"], "--repeat", str(repeat)]
+    proc = subprocess.run(cmd, capture_output=True, text=True)
+    if proc.returncode != 0:
+        raise RuntimeError(f"stage {stage} lỗi:\n{proc.stderr.strip()}")
+    return json.loads(proc.stdout.strip().splitlines()[-1])
+
+# ================= Baseline =================
+def load_baselines(path: str) -> Dict[str, Any]:
+    if not os.path.exists(path):
+        return {}
+    with open(path, encoding="utf-8") as fh:
+        return json.load(fh)
+
+
+def compare(result: Dict[str, Any], base: Optional[Dict[str, Any]], tolerance: float, rss_tolerance: float) -> List[str]:
+    """Trả danh sách cảnh báo regression (rỗng nếu ổn hoặc chưa có baseline)."""
+    if not base:
+        return []
+    flags = []
+    if base.get("wall_s") and result["wall_s"] - base["wall_s"] > max(base["wall_s"] * tolerance, MIN_REGRESSION_S):
+        flags.append(f"wall {result['wall_s']:.3f}s vs {base['wall_s']:.3f}s (+{result['wall_s'] / base['wall_s'] - 1:.0%})")
+    if base.get("rss_mb") is not None and result.get("rss_mb") is not None and \
+            result["rss_mb"] - base["rss_mb"] > max(base["rss_mb"] * rss_tolerance, MIN_REGRESSION_MB):
+        flags.append(f"RSS +{result['rss_mb']:.0f}MB vs +{base['rss_mb']:.0f}MB")
+    return flags
+
+
+def build_parser() -> argparse.ArgumentParser:
+    ap = argparse.ArgumentParser(description="Benchmark Etsy/TikTok → Shopify converter")
+    ap.add_argument("--scales", default=DEFAULT_SCALES, help="số variant, vd 1k,10k,100k,1M")
+    ap.add_argument("--stages", default="all", help=f"all hoặc danh sách: {','.join(STAGES)}")
+    ap.add_argument("--seed", type=int, default=0)
+    ap.add_argument("--repeat", type=int, default=1, help="chạy lại mỗi stage n lần, lấy lần nhanh nhất")
+    ap.add_argument("--work-dir", default=DEFAULT_WORK_DIR, help="nơi lưu file input đã sinh")
+    ap.add_argument("--baseline", default=DEFAULT_BASELINE, help="file JSON baseline")
+    ap.add_argument("--save-baseline", action="store_true", help="ghi kết quả lần này vào baseline")
+    ap.add_argument("--tolerance", type=float, default=0.25, help="ngưỡng chậm hơn baseline (0.25 = 25%%)")
+    ap.add_argument("--rss-tolerance", type=float, default=0.25)
+    ap.add_argument("--json", metavar="FILE", help="ghi toàn bộ kết quả ra JSON")
+    # Nội bộ: chạy một stage trong process con
+    ap.add_argument("--child", help=argparse.SUPPRESS)
+    ap.add_argument("--etsy", help=argparse.SUPPRESS)
+    ap.add_argument("--tiktok", help=argparse.SUPPRESS)
+    return ap
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    args = build_parser().parse_args(argv)
+    if args.child:
+        print(json.dumps(run_stage(args.child, {"etsy": args.etsy, "tiktok": args.tiktok}, args.repeat)))
+        return 0
+
+    stages = list(STAGES) if args.stages == "all" else [s.strip() for s in args.stages.split(",") if s.strip()]
+    unknown = [s for s in stages if s not in STAGES]
+    if unknown:
+        print(f"Stage không tồn tại: {', '.join(unknown)}", file=sys.stderr)
+        return 2
+    baselines = load_baselines(args.baseline)
+    first_run = not os.path.exists(args.baseline)
+    results: Dict[str, Any] = {}
+    regressions = 0
+
+    print(f"{'stage':<20}{'variants':>10}{'wall (s)':>11}{'items/s':>13}{'RSS +':>11}  vs baseline")
+    for scale in [parse_scale(s) for s in args.scales.split(",") if s.strip()]:
+        paths = ensure_inputs(scale, args.seed, args.work_dir)
+        for stage in stages:
+            key = f"{stage}@{scale}"
+            res = run_stage_subprocess(stage, paths, args.repeat)
+            results[key] = res
+            flags = compare(res, baselines.get(key), args.tolerance, args.rss_tolerance)
+            regressions += bool(flags)
+            base = baselines.get(key)
+            note = "⚠️ REGRESSION: " + "; ".join(flags) if flags else (
+                f"{res['wall_s'] / base['wall_s']:.2f}x" if base and base.get("wall_s") else "—")
+            rss = f"{res['rss_mb']:.0f}MB" if res.get("rss_mb") is not None else "n/a"
+            print(f"{stage:<20}{scale:>10}{res['wall_s']:>11.3f}{res['throughput'] or 0:>13,.0f}{rss:>11}  {note}", flush=True)
+
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as fh:
+            json.dump(results, fh, indent=2)
+    if args.save_baseline or first_run:
+        baselines.update(results)
+        with open(args.baseline, "w", encoding="utf-8") as fh:
+            json.dump(baselines, fh, indent=2, sort_keys=True)
+        print(f"{'Chưa có baseline → đã' if first_run and not args.save_baseline else 'Đã'} lưu baseline → {args.baseline}")
+    if regressions:
+        print(f"{regressions} stage chậm hơn baseline.", file=sys.stderr)
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
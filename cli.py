@@ -0,0 +1,386 @@
+# cli.py — convert hàng loạt không cần Streamlit
+import argparse
+import glob
+import json
+import os
+import sys
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from typing import List, Dict, Any, Optional
+
+import pandas as pd
+
+from converter import (
+    NORMALIZER_CACHE_SIZE,
+    OUTPUT_COMPRESSIONS,
+    ConversionReport,
+    FingerprintStore,
+    HandleRegistry,
+    PriceTable,
+    check_source_schema,
+    configure_normalizer_cache,
+    configure_schemas,
+    convert_etsy_to_shopify,
+    convert_incremental,
+    convert_tiktok_to_shopify,
+    dedupe_handles,
+    detect_source_type,
+    etsy_to_catalog,
+    iter_etsy_to_shopify,
+    lean_shopify_frame,
+    tiktok_to_catalog,
+    write_shopify_csv_parts,
+)
+from images import IMAGE_CACHE_DB, IMAGE_CACHE_TTL, ImageCheckCache, check_shopify_images
+from shopify_push import PUSH_CONCURRENCY, SHOPIFY_API_VERSION, push_shopify_frame
+
+SOURCE_EXTS = (".csv", ".xlsx", ".xls")
+CATALOG_FORMATS = ("json", "parquet")
+
+
+def collect_inputs(patterns: List[str]) -> List[str]:
+    """Thư mục / glob / file → danh sách file nguồn (giữ thứ tự, bỏ trùng)."""
+    found: List[str] = []
+    for pat in patterns:
+        if os.path.isdir(pat):
+            paths = sorted(os.path.join(pat, f) for f in os.listdir(pat))
+        else:
+            paths = sorted(glob.glob(pat)) or [pat]
+        for p in paths:
+            if os.path.isfile(p) and p.lower().endswith(SOURCE_EXTS) and p not in found:
+                found.append(p)
+    return found
+
+
+def output_name(path: str, source: str) -> str:
+    base = os.path.basename(path).rsplit(".", 1)[0]
+    return f"shopify_import_from_{source}__{base}.csv"
+
+
+def convert_file(path: str, source: str, options: Dict[str, Any], out_path: Optional[str] = None,
+                 tiktok_cache_dir: Optional[str] = None, output: Optional[Dict[str, Any]] = None,
+                 delta_db: Optional[str] = None, feed: Optional[str] = None,
+                 images: Optional[Dict[str, Any]] = None, lean: bool = False):
+    """
+    Chạy trong worker process. source = 'etsy' | 'tiktok'.
+    out_path có → ghi thẳng ra đĩa (output = max_bytes / compression), kết quả là danh sách part; không có → DataFrame.
+    delta_db có → chỉ convert handle mới/đổi (chưa lưu fingerprint, process chính lưu sau khi ghi xong).
+    images có → chuẩn hoá / dedupe / kiểm tra Image Src (cache, ttl, drop_broken, broken_path) trước khi ghi.
+    lean → DataFrame giữ lại dùng dtype gọn (category / boolean), báo cáo có thêm bộ nhớ từng cột.
+    Trả (kết quả, báo cáo ConversionReport dạng dict, delta hoặc None).
+    """
+    output = output or {}
+    report = ConversionReport(source, file=path)
+    delta = None
+    if delta_db:
+        with FingerprintStore(delta_db) as store:
+            df, delta = convert_incremental(path, source, store, feed=feed, cache_dir=tiktok_cache_dir,
+                                            commit=False, report=report, **options)
+    elif source == "etsy":
+        if out_path and not images and not output.get("max_bytes"):
+            # Chia file cần gom dòng cùng handle (title trùng nằm rải rác) → chỉ stream khi ghi một file
+            rows = iter_etsy_to_shopify(path, report=report, **options)
+            return write_shopify_csv_parts(rows, out_path, report=report, **output), report.to_dict(), None
+        df = convert_etsy_to_shopify(path, report=report, **options)
+    else:
+        df = convert_tiktok_to_shopify(
+            path,
+            vendor_text=options.get("vendor_text", ""),
+            markup_pct=options.get("markup_pct", 0.0),
+            compare_at_markup_pct=options.get("compare_at_markup_pct", 0.0),
+            cache_dir=tiktok_cache_dir,
+            report=report,
+        )
+    if lean:
+        df = lean_shopify_frame(df, report)
+    if images:
+        df = check_images(df, images, report)
+    if out_path:
+        return write_shopify_csv_parts(df, out_path, report=report, **output), report.to_dict(), delta
+    return df, report.to_dict(), delta
+
+
+def export_catalog(path: str, source: str, options: Dict[str, Any], out_path: str, fmt: str,
+                   tiktok_cache_dir: Optional[str] = None):
+    """
+    Chạy trong worker process: nguồn → CatalogTable → JSON (out_path.json) hoặc Parquet
+    (out_path.products/.variants/.images.parquet). Trả (danh sách file, báo cáo dạng dict, None).
+    """
+    report = ConversionReport(source, file=path, format=fmt)
+    with report.stage("catalog"):
+        if source == "etsy":
+            catalog = etsy_to_catalog(path, **options)
+        else:
+            catalog = tiktok_to_catalog(
+                path,
+                vendor_text=options.get("vendor_text", ""),
+                markup_pct=options.get("markup_pct", 0.0),
+                compare_at_markup_pct=options.get("compare_at_markup_pct", 0.0),
+                cache_dir=tiktok_cache_dir,
+            )
+    with report.stage("write"):
+        if fmt == "json":
+            catalog.to_json(out_path + ".json")
+            paths = [out_path + ".json"]
+        else:
+            paths = catalog.to_parquet(out_path)
+    report.add(products=len(catalog), variants=len(catalog.variants["product"]),
+               images=len(catalog.images["product"]))
+    return paths, report.finish().to_dict(), None
+
+
+def check_images(df, images: Dict[str, Any], report: ConversionReport):
+    with ImageCheckCache(images["cache"], ttl=images["ttl"]) as cache:
+        df, summary = check_shopify_images(df, cache=cache, drop_broken=images["drop_broken"], report=report)
+    if summary["broken"] and images.get("broken_path"):
+        os.makedirs(os.path.dirname(images["broken_path"]) or ".", exist_ok=True)
+        with open(images["broken_path"], "w", encoding="utf-8") as fh:
+            fh.writelines(f"{url}\t{why}\n" for url, why in summary["broken"].items())
+    return df
+
+
+def init_worker(cache_size: int, schema_file: Optional[str]) -> None:
+    configure_normalizer_cache(cache_size)
+    configure_schemas(schema_file)
+
+
+def check_inputs(inputs: List[str], source: str) -> int:
+    """Kiểm tra header mọi input trước khi convert (chỉ đọc dòng header) → số file lỗi."""
+    bad = 0
+    for path in inputs:
+        try:
+            problems = check_source_schema(path, None if source == "auto" else source)
+        except Exception as e:
+            problems = [str(e)]
+        if problems:
+            bad += 1
+            print(f"❌ {path}: " + "; ".join(problems), file=sys.stderr)
+    return bad
+
+
+def feed_name(path: str, source: str, feed: Optional[str], n_inputs: int) -> str:
+    base = os.path.basename(path).rsplit(".", 1)[0]
+    if feed:
+        return feed if n_inputs == 1 else f"{feed}:{base}"
+    return f"{source}:{base}"
+
+
+def describe_parts(parts: List[Dict[str, Any]]) -> str:
+    files = list(dict.fromkeys(p["file"] for p in parts))   # zip: một file nhiều part
+    rows = sum(p["rows"] for p in parts)
+    suffix = f", {len(parts)} part" if len(parts) > 1 else ""
+    shown = ", ".join(files) if len(files) <= 3 else f"{files[0]} … {files[-1]}"
+    return f"{shown} ({rows} dòng{suffix})"
+
+
+def commit_deltas(delta_db: str, deltas: Dict[str, Any], out_ref: str) -> None:
+    """Output đã ghi xong → lưu fingerprint; handle đã gỡ ghi ra removed_handles__*.txt cạnh output."""
+    out_dir = os.path.dirname(out_ref) if out_ref.lower().endswith(".csv") else out_ref
+    with FingerprintStore(delta_db) as store:
+        for path, (feed, delta) in deltas.items():
+            store.save(feed, delta["fingerprints"], delta["removed"])
+            if delta["removed"]:
+                base = os.path.basename(path).rsplit(".", 1)[0]
+                removed_path = os.path.join(out_dir or ".", f"removed_handles__{base}.txt")
+                with open(removed_path, "w", encoding="utf-8") as fh:
+                    fh.write("\n".join(delta["removed"]) + "\n")
+                print(f"🗑️  {len(delta['removed'])} handle không còn trong {path} → {removed_path}")
+
+
+def build_parser() -> argparse.ArgumentParser:
+    ap = argparse.ArgumentParser(description="Etsy/TikTok → Shopify CSV (batch)")
+    ap.add_argument("inputs", nargs="+", help="file, thư mục hoặc glob (vd 'exports/*.csv')")
+    ap.add_argument("--source", choices=["auto", "etsy", "tiktok"], default="auto")
+    ap.add_argument("--vendor", default="")
+    ap.add_argument("--markup", type=float, default=0.0, help="Markup price (%%)")
+    ap.add_argument("--compare-at", type=float, default=0.0, help="Compare-at markup (%%)")
+    ap.add_argument("--price-map", help="file text bảng giá theo Option1 (cùng format với ô dán trong app)")
+    ap.add_argument("--price-table", metavar="NAME",
+                    help="bảng giá đã lưu (tên trong ~/.shopify_converter/price_tables hoặc file .json)")
+    ap.add_argument("--save-price-table", metavar="NAME", help="lưu bảng giá từ --price-map với tên NAME để dùng lại")
+    ap.add_argument("--apply-markup-on-map", action="store_true")
+    ap.add_argument("-o", "--out-dir", default="shopify_out", help="thư mục ghi mỗi input một CSV")
+    ap.add_argument("--format", choices=("csv",) + CATALOG_FORMATS, default="csv",
+                    help="csv: file import Shopify | json: product lồng biến thể + ảnh | "
+                         "parquet: ba bảng products / variants / images")
+    ap.add_argument("--merge", metavar="FILE",
+                    help="gộp tất cả vào một CSV thay vì mỗi file một CSV (handle trùng giữa các file → thêm -2, -3…)")
+    ap.add_argument("--split-mb", type=float, default=0,
+                    help="chia output thành nhiều file ≤ N MB, không tách handle (Shopify giới hạn 15MB; 0 = không chia)")
+    ap.add_argument("--compress", choices=[c for c in OUTPUT_COMPRESSIONS if c], help="nén output: gzip | zip")
+    ap.add_argument("--delta-db", metavar="FILE",
+                    help="incremental: SQLite fingerprint, chỉ xuất handle mới/đổi so với lần chạy trước")
+    ap.add_argument("--feed", help="tên feed trong --delta-db (mặc định: nguồn + tên file input)")
+    ap.add_argument("--schema", metavar="FILE",
+                    help="mapping cột tự khai báo cho template export mới (JSON, xem SchemaRegistry.load_mappings)")
+    ap.add_argument("--check-schema", action="store_true",
+                    help="kiểm tra header mọi input trước; có file thiếu cột bắt buộc → dừng, không convert")
+    ap.add_argument("--check-images", action="store_true",
+                    help="chuẩn hoá + bỏ ảnh trùng trong handle, kiểm tra link ảnh (HEAD song song); "
+                         "link lỗi ghi ra broken_images__*.txt")
+    ap.add_argument("--drop-broken-images", action="store_true", help="cùng --check-images: bỏ luôn ảnh lỗi khỏi output")
+    ap.add_argument("--image-cache", metavar="FILE", default=IMAGE_CACHE_DB, help="SQLite cache kết quả kiểm tra ảnh")
+    ap.add_argument("--image-cache-hours", type=float, default=IMAGE_CACHE_TTL / 3600,
+                    help="kết quả kiểm tra ảnh cũ hơn N giờ thì kiểm tra lại")
+    ap.add_argument("--push", action="store_true",
+                    help="đẩy product lên Shopify Admin API sau khi convert (vẫn ghi CSV như thường)")
+    ap.add_argument("--shop-url", help="vd https://my-shop.myshopify.com (hoặc URL mock server khi test)")
+    ap.add_argument("--token", default=os.environ.get("SHOPIFY_ACCESS_TOKEN", ""),
+                    help="Admin API access token (mặc định: biến môi trường SHOPIFY_ACCESS_TOKEN)")
+    ap.add_argument("--api-version", default=SHOPIFY_API_VERSION)
+    ap.add_argument("--push-concurrency", type=int, default=PUSH_CONCURRENCY)
+    ap.add_argument("--push-checkpoint", metavar="FILE",
+                    help="file ghi product đã đẩy xong (theo shop + nội dung); chạy lại → bỏ qua product không đổi, "
+                         "product đã có trên shop được cập nhật (mặc định: push_checkpoint.jsonl trong thư mục output)")
+    ap.add_argument("--lean-dtypes", action="store_true",
+                    help="giữ rows trong RAM với dtype category / boolean (đỡ tốn bộ nhớ khi --merge / --push); "
+                         "CSV không đổi")
+    ap.add_argument("--report", metavar="FILE", help="ghi báo cáo hiệu năng (JSON, mỗi input một mục)")
+    ap.add_argument("-j", "--jobs", type=int, default=os.cpu_count() or 1, help="số process (mặc định: số core)")
+    ap.add_argument("--xlsx-cache", metavar="DIR", help="cache Parquet cho XLSX TikTok (bỏ qua parse XLSX khi chạy lại)")
+    ap.add_argument("--cache-size", type=int, default=NORMALIZER_CACHE_SIZE,
+                    help="LRU cache cho slugify/token mỗi process (0 = tắt)")
+    return ap
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    args = build_parser().parse_args(argv)
+    inputs = collect_inputs(args.inputs)
+    if not inputs:
+        print("Không tìm thấy file nguồn (.csv/.xlsx).", file=sys.stderr)
+        return 2
+
+    try:
+        configure_schemas(args.schema)
+    except (OSError, ValueError, KeyError) as e:
+        print(f"Không nạp được mapping cột {args.schema}: {e}", file=sys.stderr)
+        return 2
+    if args.check_schema:
+        bad = check_inputs(inputs, args.source)
+        if bad:
+            print(f"{bad}/{len(inputs)} file không khớp schema — chưa convert file nào.", file=sys.stderr)
+            return 2
+        print(f"✅ Header {len(inputs)} file hợp lệ")
+
+    price_map = None
+    if args.price_map:
+        with open(args.price_map, encoding="utf-8") as fh:
+            price_map = PriceTable.from_text(fh.read()) or None
+        if args.save_price_table and price_map is not None:
+            print(f"💾 Bảng giá ({len(price_map)} nhãn) → {price_map.save(args.save_price_table)}")
+    elif args.price_table:
+        try:
+            price_map = PriceTable.load(args.price_table)
+        except (OSError, ValueError) as e:
+            print(f"Không nạp được bảng giá {args.price_table}: {e}", file=sys.stderr)
+            return 2
+    options = dict(
+        vendor_text=args.vendor,
+        markup_pct=args.markup,
+        variant_price_map=price_map,
+        apply_markup_on_map=args.apply_markup_on_map,
+        compare_at_markup_pct=args.compare_at,
+    )
+    output = dict(max_bytes=int(args.split_mb * 1024 * 1024) or None, compression=args.compress)
+    if args.format != "csv" and (args.merge or args.delta_db or args.check_images):
+        print("--format json/parquet không dùng cùng --merge / --delta-db / --check-images.", file=sys.stderr)
+        return 2
+    if args.push and (args.format != "csv" or not args.shop_url or not args.token):
+        print("--push cần --shop-url, --token (hoặc SHOPIFY_ACCESS_TOKEN) và --format csv.", file=sys.stderr)
+        return 2
+    if not args.merge:
+        os.makedirs(args.out_dir, exist_ok=True)
+
+    results: Dict[str, Any] = {}
+    reports: Dict[str, Any] = {}
+    deltas: Dict[str, Any] = {}
+    pushes: Dict[str, Any] = {}
+    failed = 0
+    workers = max(1, min(args.jobs, len(inputs)))
+    with ProcessPoolExecutor(max_workers=workers, initializer=init_worker,
+                             initargs=(args.cache_size, args.schema)) as pool:
+        futures = {}
+        for path in inputs:
+            try:
+                source = args.source if args.source != "auto" else detect_source_type(path)
+            except Exception as e:
+                failed += 1
+                print(f"❌ {path}: {e}", file=sys.stderr)
+                continue
+            out_path = None if args.merge else os.path.join(args.out_dir, output_name(path, source))
+            feed = feed_name(path, source, args.feed, len(inputs))
+            images = None
+            if args.check_images:
+                base = os.path.basename(path).rsplit(".", 1)[0]
+                out_dir = os.path.dirname(args.merge) if args.merge else args.out_dir
+                images = dict(cache=args.image_cache, ttl=args.image_cache_hours * 3600,
+                              drop_broken=args.drop_broken_images,
+                              broken_path=os.path.join(out_dir or ".", f"broken_images__{base}.txt"))
+            if args.format != "csv":
+                out_path = out_path.rsplit(".", 1)[0]
+                fut = pool.submit(export_catalog, path, source, options, out_path, args.format, args.xlsx_cache)
+            else:
+                # --push: worker trả DataFrame, process chính ghi CSV rồi giữ lại frame để đẩy
+                fut = pool.submit(convert_file, path, source, options, None if args.push else out_path,
+                                  args.xlsx_cache, output, args.delta_db, feed, images, args.lean_dtypes)
+            futures[fut] = (path, source, out_path, feed)
+        for fut in as_completed(futures):
+            path, source, out_path, feed = futures[fut]
+            try:
+                res, reports[path], delta = fut.result()
+            except Exception as e:
+                failed += 1
+                print(f"❌ {path}: {e}", file=sys.stderr)
+                continue
+            if args.push and out_path:
+                pushes[path] = res
+                res = write_shopify_csv_parts(res, out_path, **output)
+            results[path] = res
+            if delta is not None:
+                deltas[path] = (feed, delta)
+                print(f"🔁 {path}: {len(delta['new'])} mới, {len(delta['changed'])} đổi, "
+                      f"{delta['unchanged']} giữ nguyên, {len(delta['removed'])} đã gỡ")
+            counts = reports[path]["counts"]
+            if counts.get("images_broken"):
+                print(f"🖼️  {path}: {counts['images_broken']}/{counts['images_unique']} link ảnh lỗi "
+                      f"→ broken_images__{os.path.basename(path).rsplit('.', 1)[0]}.txt")
+            if out_path and args.format != "csv":
+                print(f"✅ {path} → {', '.join(res)} ({source})")
+            elif out_path:
+                print(f"✅ {path} → {describe_parts(res)} ({source})")
+
+    if args.merge:
+        merged = [p for p in inputs if p in results]   # giữ thứ tự input → đổi tên handle ổn định
+        registry = HandleRegistry()
+        frames = dedupe_handles([results[p] for p in merged], merged, registry)
+        parts = write_shopify_csv_parts(frames, args.merge, **output)
+        print(f"✅ Gộp {len(frames)} file → {describe_parts(parts)}")
+        for path, renamed in registry.renamed.items():
+            if renamed:
+                print(f"🔀 {path}: {len(renamed)} handle trùng file khác → đổi tên (vd {next(iter(renamed.items()))})")
+        if args.push:
+            pushes = {args.merge: pd.concat(frames, ignore_index=True)} if frames else {}
+    if pushes:
+        checkpoint = args.push_checkpoint or os.path.join(
+            os.path.dirname(args.merge) if args.merge else args.out_dir, "push_checkpoint.jsonl")
+        for path, df in pushes.items():
+            stats = push_shopify_frame(df, args.shop_url, args.token, checkpoint_path=checkpoint,
+                                       api_version=args.api_version, concurrency=args.push_concurrency)
+            print(f"🚀 {path}: {stats['pushed']}/{stats['total']} product ({stats['created']} tạo mới, "
+                  f"{stats['updated']} cập nhật) trong {stats['seconds']}s "
+                  f"({stats['products_per_sec']} product/s, {stats['requests']} request, {stats['retries']} thử lại, "
+                  f"{stats['throttled']} lần 429), bỏ qua {stats['skipped']} không đổi, lỗi {len(stats['failed'])}")
+            for handle, err in list(stats["failed"].items())[:10]:
+                print(f"   ❌ {handle}: {err}", file=sys.stderr)
+            failed += bool(stats["failed"])
+            if path in reports:
+                reports[path]["push"] = stats
+    if deltas:
+        commit_deltas(args.delta_db, deltas, args.merge or args.out_dir)
+    if args.report:
+        with open(args.report, "w", encoding="utf-8") as fh:
+            json.dump([reports[p] for p in inputs if p in reports], fh, ensure_ascii=False, indent=2)
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
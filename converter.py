@@ -1,9 +1,28 @@
 # converter.py
+import gzip
+import hashlib
+import io
+import json
 import math
+import os
+import sys
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import contextmanager
+from functools import lru_cache, partial
 import numpy as np
 import pandas as pd
 import re
-from typing import List, Dict, Any, Optional
+import sqlite3
+import zipfile
+from typing import List, Dict, Any, Optional, Iterable, Iterator
+
+try:
+    import resource   # chỉ có trên Unix
+except ImportError:
+    resource = None
 
 # ===== Shopify default config =====
 DEFAULT_PUBLISHED = False
@@ -34,25 +53,30 @@ def is_digital_like(v) -> bool:
     return str(v).strip().lower() in DIGITAL_LIKE
 
 # ================= Helpers =================
-def slugify(text: str) -> str:
+def _slugify_raw(text: str) -> str:
     text = str(text or "").strip().lower()
     text = re.sub(r"[^\w\s-]", "", text)
     text = re.sub(r"[\s_-]+", "-", text)
     text = re.sub(r"^-+|-+$", "", text)
     return text[:100]
 
+def slugify(text: str) -> str:
+    return _normalize("slugify", text)
+
 def split_list_field(val) -> List[str]:
     if pd.isna(val):
         return []
     return [s.strip() for s in str(val).split(",") if str(s).strip()]
 
+PRICE_TOKEN_RE = re.compile(r"[+-]?[0-9][0-9\.,]*")
+
 def parse_price(value):
     if value is None or (isinstance(value, float) and math.isnan(value)):
         return np.nan
     s = str(value).strip()
     if s == "":
         return np.nan
-    m = re.search(r"[+-]?[0-9][0-9\.,]*", s)
+    m = PRICE_TOKEN_RE.search(s)
     if not m:
         try:
             return float(s)
@@ -96,17 +120,100 @@ def calc_compare_at(price_value, discount_pct: float):
         return ""  # tránh chia cho 0 (>=100% không hợp lệ)
     return round(p / (1.0 - d), 2)
 
+# ===== Price engine (vector hoá) =====
+# Cùng kết quả với parse_price / apply_markup / calc_compare_at nhưng xử lý cả cột một lần.
+def _float_or_nan(s) -> float:
+    try:
+        return float(s)
+    except Exception:
+        return np.nan
+
+def _map_unique(values: pd.Series, fn) -> pd.Series:
+    """Gọi fn một lần cho mỗi giá trị khác nhau (giá thường lặp lại rất nhiều)."""
+    if values.empty:
+        return pd.Series(np.nan, index=values.index, dtype=float)
+    codes, uniques = pd.factorize(values, use_na_sentinel=False)
+    mapped = np.array([fn(u) for u in uniques], dtype=float)
+    return pd.Series(mapped[codes], index=values.index, dtype=float)
+
+def _round2(x: np.ndarray) -> np.ndarray:
+    """round(x, 2) như Python cho cả mảng; ca sát nửa (x*100 ≈ k + .5) thì tính lại bằng round()."""
+    x = np.asarray(x, dtype=float)
+    with np.errstate(invalid="ignore"):
+        x100 = x * 100.0
+        out = np.round(x, 2)
+        frac = np.abs(x100 - np.floor(x100) - 0.5)
+        unsure = np.isfinite(x) & ((frac <= 1e-9 * np.maximum(1.0, np.abs(x100))) | (np.abs(x) >= 1e13))
+    if unsure.any():
+        out[unsure] = [round(float(v), 2) for v in x[unsure]]
+    return out
+
+def parse_price_series(values) -> pd.Series:
+    """
+    parse_price cho cả cột (Series/list/ndarray) → Series float, NaN nếu không đọc được.
+    Hỗ trợ cả '1.234,56' và '1,234.56'.
+    """
+    s = values if isinstance(values, pd.Series) else pd.Series(values)
+    index = s.index
+    s = s.reset_index(drop=True)
+    if s.dtype.kind in "iuf":
+        out = s.astype(float)
+        # str(float) ra dạng mũ (1e+16, 5e-05) → parse_price đọc khác; tính lại từng giá trị
+        with np.errstate(invalid="ignore"):
+            a = np.abs(out.to_numpy())
+            odd = (a >= 1e16) | ((a < 1e-4) & (a != 0))
+        if odd.any():
+            out = out.copy()
+            out[odd] = [parse_price(v) for v in out[odd]]
+        return out.set_axis(index)
+
+    out = pd.Series(np.nan, index=s.index, dtype=float)
+    obj = s.astype(object)
+    present = obj.notna()
+    if not present.any():
+        return out.set_axis(index)
+    text = obj[present]
+    if s.dtype == object:
+        text = text.map(str)
+    text = text.astype(object).str.strip()
+
+    token = text.str.extract(f"({PRICE_TOKEN_RE.pattern})", expand=False)
+    matched = token.notna()
+    tok = token[matched]
+    if not tok.empty:
+        eu = (tok.str.contains(",", regex=False) & tok.str.contains(".", regex=False)
+              & (tok.str.rfind(",") > tok.str.rfind(".")))
+        tok = tok.str.replace(",", "", regex=False).where(
+            ~eu, tok.str.replace(".", "", regex=False).str.replace(",", ".", regex=False))
+        out[tok.index] = _map_unique(tok, _float_or_nan)
+    rest = text[~matched]
+    if not rest.empty:
+        out[rest.index] = _map_unique(rest, _float_or_nan)
+    return out.set_axis(index)
+
+def apply_markup_series(prices, markup_pct: float) -> pd.Series:
+    """apply_markup cho cả cột; NaN ở chỗ bản scalar trả ''."""
+    p = parse_price_series(prices)
+    try:
+        factor = 1 + float(markup_pct) / 100.0
+    except Exception:
+        return pd.Series(np.nan, index=p.index, dtype=float)
+    return pd.Series(_round2(p.to_numpy() * factor), index=p.index)
+
+def calc_compare_at_series(prices, discount_pct: float) -> pd.Series:
+    """calc_compare_at cho cả cột; NaN ở chỗ bản scalar trả ''."""
+    p = parse_price_series(prices)
+    if discount_pct is None or float(discount_pct) <= 0:
+        return pd.Series(np.nan, index=p.index, dtype=float)
+    d = float(discount_pct) / 100.0
+    if d >= 1.0:
+        return pd.Series(np.nan, index=p.index, dtype=float)
+    return pd.Series(_round2(p.to_numpy() / (1.0 - d)), index=p.index)
+
+def price_cells(prices: pd.Series) -> pd.Series:
+    """Series float → ô CSV: NaN thành '' như các hàm scalar."""
+    return prices.astype(object).where(prices.notna(), "")
 
-def _finalize(df_rows: List[Dict[str, Any]]) -> pd.DataFrame:
-    if not df_rows:
-        return pd.DataFrame(columns=SHOPIFY_BASE_COLS)
-    all_keys = list({k for row in df_rows for k in row.keys()})
-    ordered = [*SHOPIFY_BASE_COLS, *[k for k in all_keys if k not in SHOPIFY_BASE_COLS]]
-    df = pd.DataFrame(df_rows)
-    for k in ordered:
-        if k not in df.columns:
-            df[k] = ""
-    return df[ordered]
 
 # ===== Token matcher =====
 TOKEN_PATTERNS = [
@@ -117,7 +224,7 @@ TOKEN_PATTERNS = [
 ]
 TOKEN_RE = re.compile("|".join(TOKEN_PATTERNS), re.I)
 
-def option1_token(val: str) -> str:
+def _option1_token_raw(val: str) -> str:
     s = str(val or "").upper().strip()
     m = TOKEN_RE.search(s)
     if m:
@@ -125,7 +232,7 @@ def option1_token(val: str) -> str:
     parts = re.findall(r"[A-Z0-9]+", s)
     return parts[-1] if parts else s
 
-def sku_token(sku: str) -> str:
+def _sku_token_raw(sku: str) -> str:
     s = str(sku or "").upper()
     if "_" in s:
         tail = s.split("_")[-1]
@@ -139,7 +246,1499 @@ def sku_token(sku: str) -> str:
     parts = re.findall(r"[A-Z0-9]+", s)
     return parts[-1] if parts else s
 
+def option1_token(val: str) -> str:
+    return _normalize("option1_token", val)
+
+def sku_token(sku: str) -> str:
+    return _normalize("sku_token", sku)
+
+# ===== Cache cho slugify / option1_token / sku_token =====
+# Vài trăm nhãn size / SKU lặp lại hàng triệu lần mỗi catalog → nhớ kết quả, giới hạn bằng LRU.
+NORMALIZER_CACHE_SIZE = 65536
+_NORMALIZERS = {
+    "slugify": _slugify_raw,
+    "option1_token": _option1_token_raw,
+    "sku_token": _sku_token_raw,
+}
+_normalizer_cache: Dict[str, Any] = {}
+
+def configure_normalizer_cache(maxsize: Optional[int] = NORMALIZER_CACHE_SIZE) -> None:
+    """Đặt kích thước cache cho mỗi hàm (0 = tắt, None = không giới hạn); xoá kết quả và thống kê cũ."""
+    for name, fn in _NORMALIZERS.items():
+        _normalizer_cache[name] = fn if maxsize == 0 else lru_cache(maxsize=maxsize, typed=True)(fn)
+
+def clear_normalizer_cache() -> None:
+    for fn in _normalizer_cache.values():
+        if hasattr(fn, "cache_clear"):
+            fn.cache_clear()
+
+def normalizer_cache_stats() -> Dict[str, Dict[str, Any]]:
+    """{tên hàm: {hits, misses, maxsize, currsize, hit_rate}}."""
+    stats = {}
+    for name, fn in _normalizer_cache.items():
+        if hasattr(fn, "cache_info"):
+            info = fn.cache_info()
+            hits, misses, maxsize, currsize = info.hits, info.misses, info.maxsize, info.currsize
+        else:
+            hits, misses, maxsize, currsize = 0, 0, 0, 0
+        total = hits + misses
+        stats[name] = {
+            "hits": hits, "misses": misses, "maxsize": maxsize, "currsize": currsize,
+            "hit_rate": round(hits / total, 4) if total else 0.0,
+        }
+    return stats
+
+def _normalize(name: str, value) -> str:
+    try:
+        return _normalizer_cache[name](value)
+    except TypeError:   # giá trị không hash được → tính thẳng
+        return _NORMALIZERS[name](value)
+
+configure_normalizer_cache()
+
+SKU_INDEX_MIN_TOKENS = 32   # ít token hơn mức này thì không dựng index chuỗi con
+
+class SkuMatcher:
+    """
+    Ghép SKU cho các Option1 của một listing, cùng thứ tự ưu tiên như trước:
+    token trùng khớp → token chứa nhau (token đầu tiên chưa dùng) → theo vị trí (SKU đầu tiên chưa dùng).
+    Token SKU được index (kể cả chuỗi con) nên mỗi lần tra chỉ tốn theo độ dài token, không quét cả danh sách.
+    """
+
+    def __init__(self, skus: List[str], skus_by_pos: Optional[List[str]] = None):
+        self._by_token: Dict[str, str] = {}
+        self._ordinal: Dict[str, int] = {}      # token → thứ tự xuất hiện đầu tiên
+        for s in skus:
+            tk = sku_token(s)
+            if tk not in self._ordinal:
+                self._ordinal[tk] = len(self._ordinal)
+            self._by_token[tk] = s              # SKU sau đè SKU trước, như dict cũ
+        self._values = [self._by_token[tk] for tk in self._ordinal]
+        self._containing: Optional[Dict[str, List[int]]] = None   # chuỗi con → các token chứa nó
+        self._cursor: Dict[str, int] = {}
+        self._by_pos = list(skus if skus_by_pos is None else skus_by_pos)
+        self._pos_cursor = 0
+        self.used = set()
+
+    def _build_index(self) -> Dict[str, List[int]]:
+        index: Dict[str, List[int]] = {}
+        for i, tk in enumerate(self._ordinal):
+            subs = {tk[a:b] for a in range(len(tk)) for b in range(a + 1, len(tk) + 1)}
+            subs.add("")
+            for sub in subs:
+                index.setdefault(sub, []).append(i)
+        return index
+
+    def _first_containing(self, tok: str) -> Optional[str]:
+        """Token đầu tiên (theo thứ tự) mà `tk in tok or tok in tk` và SKU chưa dùng."""
+        if len(self._values) <= SKU_INDEX_MIN_TOKENS:   # listing nhỏ: quét thẳng rẻ hơn dựng index
+            for tk, val in zip(self._ordinal, self._values):
+                if (tk in tok or tok in tk) and val not in self.used:
+                    return val
+            return None
+        if self._containing is None:
+            self._containing = self._build_index()
+        best = None
+        # tok nằm trong tk: duyệt danh sách đã sort, con trỏ bỏ qua các SKU đã dùng (used chỉ tăng)
+        cands = self._containing.get(tok)
+        if cands:
+            k = self._cursor.get(tok, 0)
+            while k < len(cands) and self._values[cands[k]] in self.used:
+                k += 1
+            self._cursor[tok] = k
+            if k < len(cands):
+                best = cands[k]
+        # tk nằm trong tok: tra từng chuỗi con của tok
+        subs = {tok[a:b] for a in range(len(tok)) for b in range(a + 1, len(tok) + 1)}
+        subs.add("")
+        for sub in subs:
+            i = self._ordinal.get(sub)
+            if i is not None and (best is None or i < best) and self._values[i] not in self.used:
+                best = i
+        return None if best is None else self._values[best]
+
+    def _next_by_pos(self) -> str:
+        while self._pos_cursor < len(self._by_pos) and self._by_pos[self._pos_cursor] in self.used:
+            self._pos_cursor += 1
+        return self._by_pos[self._pos_cursor] if self._pos_cursor < len(self._by_pos) else ""
+
+    def match(self, option) -> str:
+        """SKU cho một giá trị Option1 ('' nếu hết SKU); SKU trả về được đánh dấu đã dùng."""
+        tok = option1_token(option)
+        sku = self._by_token.get(tok)
+        if sku is None:
+            sku = self._first_containing(tok)
+        if sku is None:
+            sku = self._next_by_pos()
+        self.used.add(sku)
+        return sku
+
+# ================= Cache kết quả (giới hạn bộ nhớ, LRU) =================
+RESULT_CACHE_MAX_BYTES = 512 * 1024 * 1024
+
+def approx_nbytes(obj) -> int:
+    """Ước lượng bộ nhớ: DataFrame/Series tính deep, tuple/list/dict cộng dồn, còn lại sys.getsizeof."""
+    if isinstance(obj, pd.DataFrame):
+        return int(obj.memory_usage(index=True, deep=True).sum())
+    if isinstance(obj, pd.Series):
+        return int(obj.memory_usage(index=True, deep=True))
+    if isinstance(obj, (tuple, list)):
+        return sys.getsizeof(obj) + sum(approx_nbytes(v) for v in obj)
+    if isinstance(obj, dict):
+        return sys.getsizeof(obj) + sum(approx_nbytes(k) + approx_nbytes(v) for k, v in obj.items())
+    return sys.getsizeof(obj)
+
+def cache_key(*parts) -> str:
+    """Key ổn định từ các phần (chuỗi, số, dict bảng giá...): dict không phụ thuộc thứ tự key."""
+    payload = json.dumps(parts, sort_keys=True, ensure_ascii=False, default=str)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+class MemoryLRUCache:
+    """
+    Cache LRU giới hạn theo tổng dung lượng (ước lượng lúc put bằng sizeof):
+    vượt max_bytes → bỏ mục lâu không dùng nhất; mục lớn hơn max_bytes không được cache.
+    Thread-safe (Streamlit chạy mỗi session trên một thread). Giá trị trả ra dùng chung — không sửa tại chỗ.
+    """
+
+    def __init__(self, max_bytes: int = RESULT_CACHE_MAX_BYTES, sizeof=approx_nbytes):
+        self.max_bytes = int(max_bytes)
+        self._sizeof = sizeof
+        self._items: "OrderedDict[str, tuple]" = OrderedDict()   # key → (value, nbytes)
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.hits = self.misses = self.evictions = 0
+
+    def get(self, key: str, default=None):
+        with self._lock:
+            item = self._items.get(key)
+            if item is None:
+                self.misses += 1
+                return default
+            self._items.move_to_end(key)
+            self.hits += 1
+            return item[0]
+
+    def put(self, key: str, value) -> bool:
+        nbytes = self._sizeof(value)
+        with self._lock:
+            old = self._items.pop(key, None)
+            if old is not None:
+                self._bytes -= old[1]
+            if nbytes > self.max_bytes:
+                return False
+            self._items[key] = (value, nbytes)
+            self._bytes += nbytes
+            while self._bytes > self.max_bytes:
+                _, (_, freed) = self._items.popitem(last=False)
+                self._bytes -= freed
+                self.evictions += 1
+            return True
+
+    def get_or_compute(self, key: str, compute):
+        """Có trong cache → trả luôn; không thì compute(), cache lại rồi trả."""
+        value = self.get(key)
+        if value is None:
+            value = compute()
+            self.put(key, value)
+        return value
+
+    def discard(self, key: str) -> None:
+        with self._lock:
+            old = self._items.pop(key, None)
+            if old is not None:
+                self._bytes -= old[1]
+
+    def clear(self) -> None:
+        with self._lock:
+            self._items.clear()
+            self._bytes = 0
+
+    def __contains__(self, key: str) -> bool:
+        return key in self._items
+
+    def __len__(self) -> int:
+        return len(self._items)
+
+    def stats(self) -> Dict[str, Any]:
+        total = self.hits + self.misses
+        return {
+            "entries": len(self._items), "bytes": self._bytes, "max_bytes": self.max_bytes,
+            "hits": self.hits, "misses": self.misses, "evictions": self.evictions,
+            "hit_rate": round(self.hits / total, 4) if total else 0.0,
+        }
+
+# ================= Price map (dán từ UI / file) =================
+PRICE_PAREN_RE = re.compile(r"\((?:US?\$)?\s*([0-9][0-9\.,]*)\)\s*$", re.I)
+PRICE_SEP_RE = re.compile(r"[:\-]\s*([0-9][0-9\.,]*)\s*$")
+PRICE_TRAIL_RE = re.compile(r"(.*\S)\s+([0-9][0-9\.,]*)\s*$")
+
+def parse_price_map(text: str) -> dict:
+    """
+    Nhận các format dòng:
+      - 8 x 12\" - 20 x 30cm (US$28.99)
+      - 11x14 : 34.99
+      - A3 / 29.7 x 42cm - 35.99
+      - Digital Download (US$11.99)
+    Trả về: {label: price_str}
+    """
+    price_map = {}
+    for raw in str(text or "").splitlines():
+        line = raw.strip()
+        if not line:
+            continue
+        # giá trong ngoặc
+        m = PRICE_PAREN_RE.search(line)
+        price = None
+        label = None
+        if m:
+            price = m.group(1)
+            label = line[:m.start()].strip(" -:\t")
+        else:
+            # theo ": số" hoặc "- số" ở cuối
+            m2 = PRICE_SEP_RE.search(line)
+            if m2:
+                price = m2.group(1)
+                label = line[:m2.start()].strip(" -:\t")
+            else:
+                # fallback: "label   số"
+                m3 = PRICE_TRAIL_RE.search(line)
+                if m3:
+                    label = m3.group(1).strip()
+                    price = m3.group(2)
+        if label and price:
+            price_map[label] = price
+    return price_map
+
+PRICE_TABLE_VERSION = 1
+PRICE_TABLE_DIR = os.path.join(os.path.expanduser("~"), ".shopify_converter", "price_tables")
+PRICE_TABLE_NAME_RE = re.compile(r"^[\w.\- ]+$")
+
+class PriceTable:
+    """
+    Bảng giá theo Option1 đã biên dịch: dựng một lần, lưu / nạp theo tên, dùng chung cho nhiều shop.
+    Tra giá: khớp nguyên nhãn → khớp token (option1_token) → NaN (converter dùng PRICE + markup).
+    Truyền thẳng vào convert_* thay cho dict variant_price_map.
+    """
+
+    def __init__(self, exact: Dict[str, float], token: Dict[str, float], name: str = ""):
+        self.exact = dict(exact)
+        self.token = dict(token)
+        self.name = name
+        self.fingerprint = hashlib.sha1(json.dumps(
+            [PRICE_TABLE_VERSION, sorted(self.exact.items()), sorted(self.token.items())], ensure_ascii=False,
+        ).encode("utf-8")).hexdigest()
+
+    @classmethod
+    def from_mapping(cls, price_map: Optional[Dict[str, Any]], name: str = "") -> "PriceTable":
+        """{nhãn: giá} (giá dạng chuỗi/số như parse_price_map trả về) → bảng; giá không đọc được bị bỏ."""
+        exact, token = {}, {}
+        for k, v in (price_map or {}).items():
+            price_val = _norm_price(v)
+            if price_val is None:
+                continue
+            k_str = str(k).strip()
+            exact[k_str] = price_val
+            tk = option1_token(k_str)
+            if tk:
+                token[tk] = price_val
+        return cls(exact, token, name)
+
+    @classmethod
+    def from_text(cls, text: str, name: str = "") -> "PriceTable":
+        return cls.from_mapping(parse_price_map(text), name)
+
+    def __len__(self) -> int:
+        return len(self.exact)
+
+    def __bool__(self) -> bool:
+        return bool(self.exact or self.token)
+
+    def __repr__(self) -> str:   # dùng trong cache_key / fingerprint incremental → chỉ phụ thuộc nội dung
+        return f"PriceTable({self.fingerprint})"
+
+    def __eq__(self, other) -> bool:
+        return isinstance(other, PriceTable) and other.fingerprint == self.fingerprint
+
+    def __hash__(self) -> int:
+        return hash(self.fingerprint)
+
+    def lookup(self, option1) -> float:
+        price = self.exact.get(option1)
+        if price is not None:
+            return price
+        tk = option1_token(option1)
+        return self.token.get(tk, np.nan) if tk else np.nan
+
+    def lookup_array(self, option1: np.ndarray) -> np.ndarray:
+        """lookup cho cả mảng, mỗi nhãn khác nhau tra một lần."""
+        if not len(option1):
+            return np.empty(0, dtype=float)
+        codes, uniques = pd.factorize(pd.Series(option1, dtype=object), use_na_sentinel=False)
+        return np.array([self.lookup(u) for u in uniques], dtype=float)[codes]
+
+    # ----- Lưu / nạp -----
+    def to_dict(self) -> Dict[str, Any]:
+        return {"version": PRICE_TABLE_VERSION, "name": self.name, "exact": self.exact, "token": self.token}
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> "PriceTable":
+        if data.get("version") != PRICE_TABLE_VERSION:
+            raise ValueError(f"Bảng giá version {data.get('version')} không hỗ trợ (cần {PRICE_TABLE_VERSION})")
+        return cls(data["exact"], data["token"], data.get("name", ""))
+
+    def save(self, name: Optional[str] = None, folder: Optional[str] = None) -> str:
+        """Ghi JSON vào folder (mặc định PRICE_TABLE_DIR) với tên name → đường dẫn file."""
+        path = price_table_path(name or self.name, folder)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        self.name = name or self.name
+        tmp = path + ".tmp"
+        with open(tmp, "w", encoding="utf-8") as fh:
+            json.dump(self.to_dict(), fh, ensure_ascii=False)
+        os.replace(tmp, path)
+        return path
+
+    @classmethod
+    def load(cls, name_or_path: str, folder: Optional[str] = None) -> "PriceTable":
+        """Nạp theo tên (trong folder) hoặc theo đường dẫn file .json."""
+        path = name_or_path if name_or_path.lower().endswith(".json") else price_table_path(name_or_path, folder)
+        with open(path, encoding="utf-8") as fh:
+            return cls.from_dict(json.load(fh))
+
+def price_table_path(name: str, folder: Optional[str] = None) -> str:
+    if not name or not PRICE_TABLE_NAME_RE.match(name):
+        raise ValueError(f"Tên bảng giá không hợp lệ: {name!r} (chỉ chữ, số, khoảng trắng, . _ -)")
+    return os.path.join(folder or PRICE_TABLE_DIR, f"{name}.json")
+
+def list_price_tables(folder: Optional[str] = None) -> List[str]:
+    folder = folder or PRICE_TABLE_DIR
+    if not os.path.isdir(folder):
+        return []
+    return sorted(f[:-5] for f in os.listdir(folder) if f.endswith(".json"))
+
+def as_price_table(variant_price_map) -> Optional[PriceTable]:
+    """dict / PriceTable / None → PriceTable (None nếu không có giá nào dùng được)."""
+    if variant_price_map is None:
+        return None
+    table = variant_price_map if isinstance(variant_price_map, PriceTable) else PriceTable.from_mapping(variant_price_map)
+    return table if table else None
+
+# ================= Đọc file nguồn =================
+# Sniff header → chỉ đọc cột cần (usecols) → mọi cột dạng chuỗi (SKU/ID không bị thành float)
+# → engine pyarrow/C; engine python chỉ dùng khi file hỏng (mô tả nhiều dòng lỗi quote...).
+ETSY_FIELDS = {
+    "TITLE", "DESCRIPTION", "PRICE", "SKU", "LISTING ID", "VENDOR",
+    "VARIATION 1 NAME", "VARIATION 1 TYPE", "VARIATION 1 VALUES",
+    "VARIATION 2 NAME", "VARIATION 2 TYPE", "VARIATION 2 VALUES",
+}
+
+def _csv_engines() -> List[str]:
+    try:
+        import pyarrow  # noqa: F401
+        return ["pyarrow", "c", "python"]
+    except ImportError:
+        return ["c", "python"]
+
+def _read_csv_pyarrow(src, usecols: Optional[List[str]] = None) -> pd.DataFrame:
+    """
+    pyarrow.csv với mọi cột là string ngay lúc parse: pd.read_csv(engine='pyarrow', dtype=str) vẫn suy kiểu số
+    trước rồi mới đổi sang chuỗi → '007' thành '7', '0012.50' thành '12.5'. Ô NaN giống engine C (na_values mặc định).
+    """
+    import pyarrow as pa
+    from pyarrow import csv as pa_csv
+    from pandas._libs.parsers import STR_NA_VALUES
+
+    header = sniff_csv_header(src)
+    if len(set(header)) != len(header):
+        raise ValueError("duplicate column names")   # để engine C tự đặt tên x.1, x.2...
+    _rewind(src)
+    if hasattr(src, "read"):
+        data = src.read()
+    else:
+        with open(src, "rb") as fh:
+            data = fh.read()
+    if isinstance(data, str):
+        data = data.encode("utf-8")
+    table = pa_csv.read_csv(
+        pa.BufferReader(data),
+        parse_options=pa_csv.ParseOptions(newlines_in_values=True),
+        convert_options=pa_csv.ConvertOptions(
+            column_types={c: pa.string() for c in header},
+            include_columns=usecols,
+            null_values=sorted(STR_NA_VALUES),
+            strings_can_be_null=True,
+            quoted_strings_can_be_null=True,
+        ),
+    )
+    return table.to_pandas()
+
+def _seekable(src):
+    """Nguồn phải đọc lại được nhiều lần (sniff header rồi đọc thật)."""
+    if isinstance(src, (str, os.PathLike)) or hasattr(src, "seek"):
+        return src
+    return io.BytesIO(src.read())
+
+def _rewind(src) -> None:
+    if hasattr(src, "seek"):
+        src.seek(0)
+
+def _source_name(src) -> str:
+    return str(getattr(src, "name", "") or (src if isinstance(src, (str, os.PathLike)) else "")).lower()
+
+def sniff_csv_header(src) -> List[str]:
+    """Chỉ đọc dòng header của CSV."""
+    _rewind(src)
+    try:
+        cols = pd.read_csv(src, nrows=0, dtype=str).columns
+    except ValueError:
+        _rewind(src)
+        cols = pd.read_csv(src, nrows=0, dtype=str, engine="python").columns
+    _rewind(src)
+    return [str(c) for c in cols]
+
+def read_csv_fast(src, usecols: Optional[List[str]] = None) -> pd.DataFrame:
+    """read_csv dtype=str, thử lần lượt pyarrow → C → python."""
+    error = None
+    for engine in _csv_engines():
+        _rewind(src)
+        try:
+            if engine == "pyarrow":
+                return _read_csv_pyarrow(src, usecols)
+            return pd.read_csv(src, engine=engine, dtype=str, usecols=usecols)
+        except ValueError as e:   # ParserError / ArrowInvalid đều là ValueError
+            error = e
+    raise error
+
+def iter_csv_chunks(src, usecols: Optional[List[str]] = None, chunksize: int = 5000) -> Iterator[pd.DataFrame]:
+    """
+    Đọc CSV theo chunk bằng engine C; nếu hỏng giữa chừng thì đọc lại bằng engine python
+    và bỏ qua các dòng đã yield. Index liên tục qua các chunk.
+    """
+    done = 0
+    try:
+        _rewind(src)
+        with pd.read_csv(src, engine="c", dtype=str, usecols=usecols, chunksize=chunksize) as reader:
+            for chunk in reader:
+                yield chunk
+                done += len(chunk)
+        return
+    except ValueError:
+        pass
+    _rewind(src)
+    with pd.read_csv(src, engine="python", dtype=str, usecols=usecols, chunksize=chunksize) as reader:
+        for chunk in reader:
+            if done >= len(chunk):
+                done -= len(chunk)
+                continue
+            yield chunk.iloc[done:]
+            done = 0
+
+def _etsy_usecols(header: List[str]) -> Optional[List[str]]:
+    return list(SCHEMAS.resolve("etsy", header)["columns"]) or None
+
+def _etsy_rename(columns) -> List[str]:
+    """Tên cột sau khi đọc → tên chuẩn (upper) theo schema; cột ngoài schema chỉ strip + upper."""
+    mapping = SCHEMAS.resolve("etsy", list(columns))["columns"]
+    return [mapping.get(c, str(c).strip().upper()) for c in columns]
+
+def _project_frame(df: pd.DataFrame, usecols: Optional[List[str]]) -> pd.DataFrame:
+    """DataFrame đã parse sẵn → chỉ giữ cột cần như khi đọc file (không copy dữ liệu, không sửa df gốc)."""
+    return df.loc[:, usecols] if usecols else df.copy(deep=False)
+
+def read_etsy_csv(file_like_or_path) -> pd.DataFrame:
+    """
+    Etsy CSV → DataFrame header đã upper, chỉ các cột converter dùng.
+    Nhận cả DataFrame đã đọc sẵn (vd từ cache; nên là chuỗi như read_csv dtype=str) → chỉ chuẩn hoá header.
+    """
+    if isinstance(file_like_or_path, pd.DataFrame):
+        etsy = _project_frame(file_like_or_path, _etsy_usecols(list(file_like_or_path.columns)))
+    else:
+        src = _seekable(file_like_or_path)
+        etsy = read_csv_fast(src, usecols=_etsy_usecols(sniff_csv_header(src)))
+    etsy.columns = _etsy_rename(etsy.columns)
+    return etsy
+
+def iter_etsy_csv(file_like_or_path, chunksize: int) -> Iterator[pd.DataFrame]:
+    if isinstance(file_like_or_path, pd.DataFrame):
+        for a in range(0, len(file_like_or_path), chunksize):
+            yield read_etsy_csv(file_like_or_path.iloc[a:a + chunksize])
+        return
+    src = _seekable(file_like_or_path)
+    for etsy in iter_csv_chunks(src, usecols=_etsy_usecols(sniff_csv_header(src)), chunksize=chunksize):
+        etsy.columns = _etsy_rename(etsy.columns)
+        yield etsy
+
+def _tiktok_usecols(header: List[str]) -> Optional[List[str]]:
+    cols = SCHEMAS.resolve("tiktok", [str(c).strip() for c in header])
+    needed = {c for k, c in cols.items() if k != "images" and c is not None} | set(cols["images"])
+    keep = [raw for raw in header if str(raw).strip() in needed]
+    return keep or None
+
+def _mangle(names: List[str]) -> List[str]:
+    """Tên cột như pandas đặt: ô trống → 'Unnamed: i', trùng → 'x.1', 'x.2'..."""
+    seen: Dict[str, int] = {}
+    out = []
+    for i, n in enumerate(names):
+        n = f"Unnamed: {i}" if n == "" else str(n)
+        k = seen.get(n, 0)
+        seen[n] = k + 1
+        out.append(n if k == 0 else f"{n}.{k}")
+    return out
+
+def _xlsx_cell(v):
+    """Giá trị ô như pandas đọc bằng openpyxl: trống → '', số nguyên dạng float → int."""
+    if v is None:
+        return ""
+    if isinstance(v, float) and v.is_integer():
+        return int(v)
+    return v
+
+def _read_xls(src, nrows: Optional[int] = None) -> pd.DataFrame:
+    """.xls đời cũ: openpyxl không mở được → pd.read_excel (cần xlrd), tên cột dạng chuỗi."""
+    _rewind(src)
+    df = pd.read_excel(src, dtype=str, nrows=nrows)
+    _rewind(src)
+    df.columns = [str(c) for c in df.columns]
+    return df
+
+def read_xlsx_projected(src, select, max_rows: Optional[int] = None) -> pd.DataFrame:
+    """
+    Đọc sheet đầu của XLSX bằng openpyxl read-only, đi từng dòng và chỉ giữ các cột
+    select(header) trả về → không dựng cả workbook trong bộ nhớ. Mọi cột dạng chuỗi như read_excel(dtype=str).
+    max_rows: chỉ đọc chừng ấy dòng dữ liệu đầu (xem trước). File .xls: đọc qua read_excel rồi chiếu cột.
+    """
+    if _source_name(src).endswith(".xls"):
+        df = _read_xls(src, nrows=max_rows)
+        return _project_frame(df, select(list(df.columns)))
+    from openpyxl import load_workbook
+    from pandas.io.parsers import TextParser
+
+    _rewind(src)
+    wb = load_workbook(src, read_only=True, data_only=True, keep_links=False)
+    try:
+        ws = wb.worksheets[0]
+        ws.reset_dimensions()
+        rows = ws.iter_rows(values_only=True)
+        header_raw = [_xlsx_cell(v) for v in next(rows, ())]
+        while header_raw and header_raw[-1] == "":
+            header_raw.pop()
+        wanted = set(select(_mangle(header_raw)) or _mangle(header_raw))
+        keep = [i for i, n in enumerate(_mangle(header_raw)) if n in wanted]
+
+        data = [[header_raw[i] for i in keep]]
+        last_with_data = 0
+        for row in rows:
+            if max_rows is not None and len(data) > max_rows:
+                break
+            if row.count(None) != len(row):
+                last_with_data = len(data)
+            data.append([_xlsx_cell(row[i]) if i < len(row) else "" for i in keep])
+    finally:
+        wb.close()
+    del data[last_with_data + 1:]          # bỏ các dòng trống cuối sheet
+    if len(data) == 1:
+        return pd.DataFrame(columns=data[0])
+    return TextParser(data, header=0, dtype=str).read()
+
+def sniff_xlsx_header(src) -> List[str]:
+    """Header sheet đầu của XLSX (tên cột như read_xlsx_projected), không đọc phần dữ liệu."""
+    if _source_name(src).endswith(".xls"):
+        return list(_read_xls(src, nrows=0).columns)
+    from openpyxl import load_workbook
+
+    _rewind(src)
+    wb = load_workbook(src, read_only=True, data_only=True, keep_links=False)
+    try:
+        ws = wb.worksheets[0]
+        ws.reset_dimensions()
+        header = [_xlsx_cell(v) for v in next(ws.iter_rows(values_only=True), ())]
+    finally:
+        wb.close()
+    _rewind(src)
+    while header and header[-1] == "":
+        header.pop()
+    return _mangle(header)
+
+def sniff_header(src) -> List[str]:
+    """Header của file nguồn CSV hoặc XLSX (theo tên file)."""
+    src = _seekable(src)
+    if _source_name(src).endswith((".xlsx", ".xls")):
+        return sniff_xlsx_header(src)
+    return sniff_csv_header(src)
+
+def content_hash(src) -> str:
+    """sha256 nội dung file (đường dẫn hoặc file-like, đọc theo khối rồi tua lại)."""
+    h = hashlib.sha256()
+    if isinstance(src, (str, os.PathLike)):
+        with open(src, "rb") as fh:
+            for block in iter(lambda: fh.read(1 << 20), b""):
+                h.update(block)
+    else:
+        _rewind(src)
+        for block in iter(lambda: src.read(1 << 20), b""):
+            h.update(block if isinstance(block, bytes) else block.encode("utf-8"))
+        _rewind(src)
+    return h.hexdigest()
+
+XLSX_CACHE_VERSION = "tt1"   # đổi khi đổi cách đọc → cache cũ tự hết hiệu lực
+
+def read_tiktok(file_like_or_path, cache_dir: Optional[str] = None, nrows: Optional[int] = None) -> pd.DataFrame:
+    """
+    TikTok CSV/XLSX → DataFrame header đã strip, chỉ các cột converter dùng, dạng chuỗi.
+    cache_dir: XLSX đã đọc được lưu thành Parquet theo hash nội dung + các cột được chọn (đổi mapping cột → đọc lại)
+    → lần sau (đổi markup...) bỏ qua parse XLSX.
+    Nhận cả DataFrame đã đọc sẵn → chỉ chiếu cột + strip header.
+    nrows: chỉ đọc chừng ấy dòng đầu (xem trước; không dùng / không ghi cache).
+    """
+    if isinstance(file_like_or_path, pd.DataFrame):
+        src = file_like_or_path if nrows is None else file_like_or_path.iloc[:nrows]
+        tt = _project_frame(src, _tiktok_usecols(list(src.columns)))
+        tt.columns = [str(c).strip() for c in tt.columns]
+        return tt
+    src = _seekable(file_like_or_path)
+    if _source_name(src).endswith(".csv"):
+        usecols = _tiktok_usecols(sniff_csv_header(src))
+        if nrows is None:
+            tt = read_csv_fast(src, usecols=usecols)
+        else:
+            chunks = iter_csv_chunks(src, usecols=usecols, chunksize=nrows)
+            tt = next(chunks, None)
+            chunks.close()
+            if tt is None:
+                tt = pd.DataFrame(columns=usecols or sniff_csv_header(src))
+        tt.columns = [str(c).strip() for c in tt.columns]
+        return tt
+    if nrows is not None:
+        tt = read_xlsx_projected(src, _tiktok_usecols, max_rows=nrows)
+        tt.columns = [str(c).strip() for c in tt.columns]
+        return tt
+
+    cache_path = None
+    if cache_dir:
+        # Cột được chiếu phụ thuộc mapping tự khai báo (SCHEMAS) → đưa danh sách cột chọn vào tên cache
+        header = sniff_xlsx_header(src)
+        selected = header_signature("tiktok", _tiktok_usecols(header) or header)[:16]
+        cache_path = os.path.join(cache_dir, f"{content_hash(src)}.{selected}.{XLSX_CACHE_VERSION}.parquet")
+        if os.path.exists(cache_path):
+            try:
+                return pd.read_parquet(cache_path)
+            except Exception:
+                pass   # cache hỏng / thiếu pyarrow → đọc lại XLSX
+    tt = read_xlsx_projected(src, _tiktok_usecols)
+    tt.columns = [str(c).strip() for c in tt.columns]
+    if cache_path:
+        try:
+            os.makedirs(cache_dir, exist_ok=True)
+            tmp = cache_path + ".tmp"
+            tt.to_parquet(tmp, index=False)
+            os.replace(tmp, cache_path)
+        except Exception:
+            pass   # không có engine parquet → chỉ bỏ qua cache
+    return tt
+
+# ================= Nhận diện nguồn =================
+ETSY_MARKERS = {"TITLE", "VARIATION 1 VALUES", "VARIATION 1 NAME", "IMAGE1", "LISTING ID"}
+TIKTOK_MARKERS = {"PRODUCT NAME", "PRODUCT ID", "SKU ID", "SELLER SKU", "VARIANT 1 VALUE", "MAIN IMAGE"}
+
+def detect_source_type(path) -> str:
+    """Đoán 'etsy' hay 'tiktok' theo đuôi file và header. XLSX luôn là TikTok."""
+    p = str(path).lower()
+    if p.endswith((".xlsx", ".xls")):
+        return "tiktok"
+    cols = {str(c).strip().upper() for c in sniff_csv_header(path)}
+    etsy_hits = len(cols & ETSY_MARKERS)
+    tiktok_hits = len(cols & TIKTOK_MARKERS)
+    if tiktok_hits > etsy_hits:
+        return "tiktok"
+    return "etsy"
+
+# ================= Schema cột: cache theo chữ ký header + mapping tự khai báo =================
+SCHEMA_VERSION = 1
+SCHEMA_CACHE_SIZE = 1024   # số layout header khác nhau giữ trong cache mỗi process
+TIKTOK_FIELDS = ("title", "desc", "price", "sku", "images", "opt1_name", "opt1_value",
+                 "opt2_name", "opt2_value", "product_id")
+SCHEMA_FIELDS = {"etsy": tuple(sorted(ETSY_FIELDS)) + ("images",), "tiktok": TIKTOK_FIELDS}
+SCHEMA_REQUIRED = {"etsy": ("TITLE",), "tiktok": ("title",)}
+
+class SchemaError(ValueError):
+    """Mapping cột không hợp lệ hoặc header thiếu cột bắt buộc."""
+
+def header_signature(source: str, header) -> str:
+    """Chữ ký layout: nguồn + danh sách tên cột theo thứ tự (hai file cùng template → cùng chữ ký)."""
+    payload = "\x1f".join([source] + [str(c) for c in header])
+    return hashlib.sha1(payload.encode("utf-8")).hexdigest()
+
+def _resolve_etsy_columns(header) -> Dict[str, Any]:
+    """Dò cột Etsy: header strip + upper khớp ETSY_FIELDS hoặc cột ảnh → {"columns": {cột gốc: tên chuẩn}}."""
+    norm = [str(c).strip().upper() for c in header]
+    images = set(_etsy_image_cols(norm))
+    return {"columns": {raw: n for raw, n in zip(header, norm) if n in ETSY_FIELDS or n in images}}
+
+class SchemaRegistry:
+    """
+    Mapping cột đã dò cho từng layout header (LRU theo header_signature) + mapping do người dùng khai báo
+    cho template mới. Mapping người dùng: {field: tên cột} (Etsy: field là tên chuẩn như TITLE; "images" là
+    danh sách cột theo thứ tự ảnh, thay cho ảnh dò tự động); áp khi header có đủ các cột được nêu,
+    đè lên kết quả dò tự động, mapping khai báo sau được ưu tiên.
+    Schema trả ra dùng chung giữa các lần gọi — không sửa tại chỗ.
+    """
+
+    def __init__(self, maxsize: int = SCHEMA_CACHE_SIZE):
+        self.maxsize = maxsize
+        self._cache: "OrderedDict[str, tuple]" = OrderedDict()
+        self._custom: Dict[str, List[tuple]] = {src: [] for src in SCHEMA_FIELDS}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    # ----- Mapping người dùng -----
+    def register(self, source: str, mapping: Dict[str, Any], name: str = "") -> None:
+        if source not in SCHEMA_FIELDS:
+            raise SchemaError(f"Nguồn không hỗ trợ: {source!r}")
+        unknown = [f for f in mapping if f not in SCHEMA_FIELDS[source]]
+        if unknown:
+            raise SchemaError(f"Mapping {name or source}: field không tồn tại {unknown} "
+                              f"(hợp lệ: {', '.join(SCHEMA_FIELDS[source])})")
+        mapping = dict(mapping)
+        if "images" in mapping:
+            imgs = mapping["images"]
+            mapping["images"] = [imgs] if isinstance(imgs, str) else list(imgs or [])
+        with self._lock:
+            self._custom[source].append((name or f"{source}-{len(self._custom[source]) + 1}", mapping))
+            self._cache.clear()
+
+    def mappings(self, source: str) -> List[tuple]:
+        return list(self._custom[source])
+
+    def clear_mappings(self) -> None:
+        with self._lock:
+            self._custom = {src: [] for src in SCHEMA_FIELDS}
+            self._cache.clear()
+
+    def load_mappings(self, path: str) -> int:
+        """JSON: {"mappings": [{"source": "tiktok", "name": "...", "columns": {field: cột}}, ...]} → số mapping."""
+        with open(path, encoding="utf-8") as fh:
+            data = json.load(fh)
+        items = data.get("mappings", []) if isinstance(data, dict) else data
+        for m in items:
+            self.register(m["source"], m["columns"], m.get("name", ""))
+        return len(items)
+
+    def save_mappings(self, path: str) -> None:
+        items = [{"source": src, "name": name, "columns": m} for src in self._custom for name, m in self._custom[src]]
+        with open(path, "w", encoding="utf-8") as fh:
+            json.dump({"version": SCHEMA_VERSION, "mappings": items}, fh, ensure_ascii=False, indent=2)
+
+    # ----- Dò + cache -----
+    @staticmethod
+    def _mapping_columns(mapping: Dict[str, Any]) -> List[str]:
+        return [c for f, c in mapping.items() if f != "images" and c] + list(mapping.get("images", []))
+
+    def _detect(self, source: str, header: List[Any]) -> tuple:
+        names = {str(c) for c in header}
+        custom = next(((name, m) for name, m in reversed(self._custom[source])
+                       if all(c in names for c in self._mapping_columns(m))), None)
+        if source == "tiktok":
+            schema = _resolve_tiktok_columns([str(c) for c in header])
+            if custom:
+                schema.update(custom[1])
+        else:
+            schema = _resolve_etsy_columns(header)
+            if custom:
+                fields = {f: c for f, c in custom[1].items() if f != "images"}
+                by_raw = {str(c): c for c in header}
+                extra = {by_raw[c]: f for f, c in fields.items() if c}
+                kept = {raw: n for raw, n in schema["columns"].items() if n not in fields}
+                if "images" in custom[1]:   # ảnh khai báo thay hẳn ảnh dò được, đặt tên lại IMAGE1..n theo thứ tự
+                    kept = {raw: n for raw, n in kept.items() if n in ETSY_FIELDS}
+                    extra.update({by_raw[c]: f"IMAGE{k + 1}" for k, c in enumerate(custom[1]["images"])})
+                kept.update(extra)
+                schema = {"columns": {raw: kept[raw] for raw in header if raw in kept}}
+        return schema, custom[0] if custom else None
+
+    def resolve(self, source: str, header) -> Dict[str, Any]:
+        """Schema cho header (etsy: {"columns": {cột gốc: tên chuẩn}}; tiktok: {field: cột, "images": [...]})."""
+        return self.explain(source, header)[0]
+
+    def explain(self, source: str, header) -> tuple:
+        """(schema, tên mapping người dùng đã áp hoặc None)."""
+        header = list(header)
+        sig = header_signature(source, header)
+        with self._lock:
+            entry = self._cache.get(sig)
+            if entry is not None:
+                self._cache.move_to_end(sig)
+                self.hits += 1
+                return entry
+        entry = self._detect(source, header)
+        with self._lock:
+            self.misses += 1
+            self._cache[sig] = entry
+            while len(self._cache) > self.maxsize:
+                self._cache.popitem(last=False)
+        return entry
+
+    def check(self, source: str, header) -> List[str]:
+        """Các vấn đề của header với schema hiện tại (rỗng = dùng được): thiếu field bắt buộc."""
+        schema, _ = self.explain(source, header)
+        if source == "tiktok":
+            present = {f for f in TIKTOK_FIELDS if schema.get(f)}
+        else:
+            present = set(schema["columns"].values())
+            present |= {"images"} if _etsy_image_cols(list(present)) else set()
+        return [f"thiếu cột cho field {f}" for f in SCHEMA_REQUIRED[source] if f not in present]
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {"layouts": len(self._cache), "hits": self.hits, "misses": self.misses,
+                    "mappings": sum(len(v) for v in self._custom.values())}
+
+SCHEMAS = SchemaRegistry()
+
+def configure_schemas(mapping_path: Optional[str] = None) -> None:
+    """Nạp mapping người dùng vào SCHEMAS (dùng làm initializer cho process pool)."""
+    SCHEMAS.clear_mappings()
+    if mapping_path:
+        SCHEMAS.load_mappings(mapping_path)
+
+def check_source_schema(path, source: Optional[str] = None) -> List[str]:
+    """Kiểm tra header một file nguồn trước khi convert (chỉ đọc header)."""
+    source = source or detect_source_type(path)
+    header = sniff_header(path)
+    if source == "tiktok":
+        header = [str(c).strip() for c in header]
+    return SCHEMAS.check(source, header)
+
+# ================= Đo đạc từng stage =================
+def peak_rss_mb() -> Optional[float]:
+    """Peak RSS của process (MB); None nếu hệ điều hành không hỗ trợ (Windows)."""
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return round(peak / (1024 * 1024 if sys.platform == "darwin" else 1024), 1)   # macOS: bytes, Linux: KB
+
+def current_rss_mb() -> Optional[float]:
+    """RSS hiện tại của process (MB) từ /proc/self/statm; None nếu không có /proc (macOS, Windows)."""
+    try:
+        with open("/proc/self/statm", encoding="ascii") as fh:
+            pages = int(fh.read().split()[1])
+        return round(pages * os.sysconf("SC_PAGE_SIZE") / 2**20, 1)
+    except (OSError, ValueError, IndexError, AttributeError):
+        return None
+
+class ConversionReport:
+    """
+    Báo cáo một lần convert — truyền report=ConversionReport(...) vào converter, được điền tại chỗ:
+    - stages: thời gian từng stage (cộng dồn nếu lặp lại, vd stream theo chunk) + RSS lúc stage xong và
+      RSS tăng/giảm trong stage (cộng dồn); peak_rss_mb là peak của cả process
+    - counts: dòng input, biến thể, dòng ảnh phụ, dòng output
+    - cache: hit/miss cache slugify/token trong lần convert này (chỉ process hiện tại, không gồm worker)
+    Chạy song song (workers > 1) thì phần bung rows chỉ có một stage 'expand'.
+    """
+
+    def __init__(self, source: str = "", **params):
+        self.source = source
+        self.params: Dict[str, Any] = dict(params)
+        self.stages: Dict[str, Dict[str, Any]] = {}
+        self.counts: Dict[str, int] = {}
+        self.cache: Dict[str, Dict[str, Any]] = {}
+        self.memory: Dict[str, Any] = {}
+        self.total_seconds = 0.0
+        self.peak_rss_mb = None
+        self._started = time.perf_counter()
+        self._mark = self._started
+        self._mark_rss = current_rss_mb()
+        self._cache_start = normalizer_cache_stats()
+
+    def lap(self, name: str) -> None:
+        """Cộng thời gian từ mốc trước tới giờ vào stage name, rồi đặt mốc mới."""
+        now, rss = time.perf_counter(), current_rss_mb()
+        st = self.stages.setdefault(name, {"seconds": 0.0, "calls": 0, "rss_mb": None, "rss_delta_mb": None})
+        st["seconds"] += now - self._mark
+        st["calls"] += 1
+        st["rss_mb"] = rss
+        if rss is not None and self._mark_rss is not None:
+            st["rss_delta_mb"] = round((st["rss_delta_mb"] or 0.0) + rss - self._mark_rss, 1)
+        self._mark, self._mark_rss = now, rss
+
+    def skip(self) -> None:
+        """Đặt lại mốc: khoảng thời gian (và RSS thay đổi) vừa qua không tính vào stage nào."""
+        self._mark, self._mark_rss = time.perf_counter(), current_rss_mb()
+
+    @contextmanager
+    def stage(self, name: str):
+        self.skip()
+        try:
+            yield self
+        finally:
+            self.lap(name)
+
+    def add(self, **counts) -> None:
+        for k, v in counts.items():
+            self.counts[k] = self.counts.get(k, 0) + int(v)
+
+    def finish(self) -> "ConversionReport":
+        """Chốt tổng thời gian, peak RSS, cache hit của lần convert. Gọi lại được (vd sau stage 'write')."""
+        self.total_seconds = time.perf_counter() - self._started
+        self.peak_rss_mb = peak_rss_mb()
+        for name, now in normalizer_cache_stats().items():
+            before = self._cache_start.get(name, {})
+            hits = max(0, now["hits"] - before.get("hits", 0))
+            misses = max(0, now["misses"] - before.get("misses", 0))
+            self.cache[name] = {
+                "hits": hits, "misses": misses,
+                "hit_rate": round(hits / (hits + misses), 4) if hits + misses else None,
+            }
+        return self
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "source": self.source,
+            "params": self.params,
+            "total_seconds": round(self.total_seconds, 4),
+            "peak_rss_mb": self.peak_rss_mb,
+            "stages": {k: {**v, "seconds": round(v["seconds"], 4)} for k, v in self.stages.items()},
+            "counts": self.counts,
+            "cache": self.cache,
+            "memory": self.memory,
+        }
+
+    def to_json(self, indent: Optional[int] = 2) -> str:
+        return json.dumps(self.to_dict(), ensure_ascii=False, indent=indent, default=str)
+
+    def stages_frame(self) -> pd.DataFrame:
+        """Bảng stage / giây / % tổng / số lần / RSS cuối stage / RSS tăng trong stage — để hiển thị."""
+        total = self.total_seconds or sum(v["seconds"] for v in self.stages.values()) or 1.0
+        return pd.DataFrame([
+            {"stage": k, "seconds": round(v["seconds"], 4), "share": f"{v['seconds'] / total:.1%}",
+             "calls": v["calls"], "rss_mb": v["rss_mb"], "rss_delta_mb": v["rss_delta_mb"]}
+            for k, v in self.stages.items()
+        ])
+
+    def memory_frame(self) -> pd.DataFrame:
+        """Bảng bộ nhớ từng cột output trước / sau lean_shopify_frame (MB) — để hiển thị."""
+        return pd.DataFrame([
+            {"column": c, "dtype": v["dtype"], "before_mb": round(v["before"] / 2**20, 3),
+             "after_mb": round(v["after"] / 2**20, 3)}
+            for c, v in self.memory.get("columns", {}).items()
+        ])
+
+def _lap(report: Optional[ConversionReport], name: str) -> None:
+    if report is not None:
+        report.lap(name)
+
+def _count_output(report: Optional[ConversionReport], rows_in: int, df: pd.DataFrame) -> None:
+    """Đếm từ kết quả (dùng được cả khi chạy song song): dòng ảnh phụ không có Status."""
+    if report is None:
+        return
+    variants = int(df["Status"].notna().sum()) if len(df) else 0
+    report.add(rows_in=rows_in, variants=variants, image_rows=len(df) - variants, rows_out=len(df))
+
+# ================= Ghép rows / chạy song song =================
+# Cột hằng của mọi dòng biến thể (dòng ảnh phụ để trống)
+VARIANT_DEFAULTS = {
+    "Published": DEFAULT_PUBLISHED,
+    "Variant Inventory Tracker": DEFAULT_INVENTORY_TRACKER,
+    "Variant Inventory Qty": DEFAULT_INVENTORY_QTY,
+    "Variant Inventory Policy": DEFAULT_INVENTORY_POLICY,
+    "Variant Fulfillment Service": DEFAULT_FULFILLMENT_SERVICE,
+    "Variant Requires Shipping": DEFAULT_REQUIRES_SHIPPING,
+    "Variant Taxable": DEFAULT_TAXABLE,
+    "Status": DEFAULT_STATUS,
+}
+
+class ShopifyRowBuilder:
+    """
+    Gom rows Shopify theo cột, không dict từng dòng:
+    - add_variants: một khối dòng biến thể, mỗi cột là mảng hoặc một giá trị hằng (chỉ lưu một lần)
+    - add_images: một khối dòng ảnh phụ (Handle / Image Src / Image Position)
+    build() xếp mỗi nhóm (handle) thành: các dòng biến thể rồi các dòng ảnh phụ, theo thứ tự nhóm.
+    Mã nhóm do caller đặt và không giảm trong từng khối.
+    """
+
+    def __init__(self):
+        self._variants: List[tuple] = []   # (group, {cột: mảng | hằng})
+        self._images: List[tuple] = []
+
+    def add_variants(self, group: np.ndarray, columns: Dict[str, Any]) -> None:
+        self._variants.append((np.asarray(group), {**VARIANT_DEFAULTS, **columns}))
+
+    def add_images(self, group: np.ndarray, handle: np.ndarray, src: np.ndarray, position: np.ndarray) -> None:
+        self._images.append((np.asarray(group), {"Handle": handle, "Image Src": src, "Image Position": position}))
+
+    def __len__(self) -> int:
+        return sum(len(g) for g, _ in self._variants) + sum(len(g) for g, _ in self._images)
+
+    def build(self) -> pd.DataFrame:
+        blocks = self._variants + self._images
+        total = len(self)
+        if total == 0:
+            return pd.DataFrame(columns=SHOPIFY_BASE_COLS)
+        order = np.argsort(np.concatenate([g for g, _ in blocks]), kind="stable")
+        cols = {}
+        for name in SHOPIFY_BASE_COLS:
+            out = np.full(total, np.nan, dtype=object)
+            start = 0
+            for g, block in blocks:
+                if name in block:
+                    out[start:start + len(g)] = block[name]
+                start += len(g)
+            cols[name] = out[order]
+        return pd.DataFrame(cols, columns=SHOPIFY_BASE_COLS)
+
+def _on_first(first: np.ndarray, group: np.ndarray, vals: np.ndarray, mask: Optional[np.ndarray] = None) -> np.ndarray:
+    """Giá trị cấp nhóm vals[group] chỉ đặt ở dòng đầu mỗi nhóm (mask theo nhóm nếu có), còn lại NaN."""
+    out = np.full(len(group), np.nan, dtype=object)
+    sel = first if mask is None else first & mask[group]
+    out[sel] = vals[group[sel]]
+    return out
+
+# Mô hình trung gian chung của hai converter: trường → cột Shopify
+CATALOG_PRODUCT_FIELDS = {"handle": "Handle", "title": "Title", "body": "Body (HTML)", "vendor": "Vendor"}
+CATALOG_VARIANT_FIELDS = {
+    "option1_name": "Option1 Name",
+    "option1_value": "Option1 Value",
+    "option2_name": "Option2 Name",
+    "option2_value": "Option2 Value",
+    "sku": "Variant SKU",
+    "price": "Variant Price",
+    "compare_at": "Variant Compare At Price",
+}
+CATALOG_IMAGE_FIELDS = ("src", "position")
+
+class CatalogTable:
+    """
+    Product / biến thể / ảnh lưu theo cột (mảng numpy), không object hay dict từng dòng:
+    - products: CATALOG_PRODUCT_FIELDS, mỗi trường là mảng dài n_products hoặc một giá trị hằng (lưu một lần)
+    - variants: "product" (chỉ số product, không giảm) + CATALOG_VARIANT_FIELDS
+    - images: "product" + src + position; ảnh position nhỏ nhất của mỗi product là ảnh chính
+    Hai converter cùng điền bảng này; to_shopify_rows / to_json / to_parquet là các đầu ra.
+    Product không có biến thể thì bị bỏ qua ở mọi đầu ra (như CSV Shopify trước đây).
+    """
+
+    def __init__(self, n_products: int, products: Dict[str, Any], variants: Dict[str, Any], images: Dict[str, Any]):
+        self.n_products = int(n_products)
+        self.products = {f: products.get(f, "") for f in CATALOG_PRODUCT_FIELDS}
+        v_product = np.asarray(variants["product"], dtype=np.int64)
+        self.variants = {"product": v_product,
+                         **{f: np.asarray(variants[f], dtype=object) for f in CATALOG_VARIANT_FIELDS}}
+        i_product = np.asarray(images["product"], dtype=np.int64)
+        i_position = np.asarray(images["position"], dtype=np.int64)
+        order = np.lexsort((i_position, i_product))
+        self.images = {"product": i_product[order],
+                       "src": np.asarray(images["src"], dtype=object)[order],
+                       "position": i_position[order]}
+
+    @classmethod
+    def empty(cls) -> "CatalogTable":
+        none = np.array([], dtype=object)
+        return cls(0, {}, {"product": none, **{f: none for f in CATALOG_VARIANT_FIELDS}},
+                   {"product": none, "src": none, "position": none})
+
+    @classmethod
+    def concat(cls, tables: List["CatalogTable"]) -> "CatalogTable":
+        """Nối các bảng theo thứ tự (vd các phần chạy song song); chỉ số product được dời."""
+        tables = [t for t in tables if t.n_products]
+        if not tables:
+            return cls.empty()
+        offsets = np.cumsum([0] + [t.n_products for t in tables])
+        products = {f: np.concatenate([t._product_col(f) for t in tables]) for f in CATALOG_PRODUCT_FIELDS}
+        variants = {f: np.concatenate([t.variants[f] for t in tables]) for f in CATALOG_VARIANT_FIELDS}
+        variants["product"] = np.concatenate([t.variants["product"] + o for t, o in zip(tables, offsets)])
+        images = {f: np.concatenate([t.images[f] for t in tables]) for f in CATALOG_IMAGE_FIELDS}
+        images["product"] = np.concatenate([t.images["product"] + o for t, o in zip(tables, offsets)])
+        return cls(offsets[-1], products, variants, images)
+
+    def __len__(self) -> int:
+        return len(np.unique(self.variants["product"]))
+
+    def __repr__(self) -> str:
+        return (f"CatalogTable({len(self)} products, {len(self.variants['product'])} variants, "
+                f"{len(self.images['product'])} images)")
+
+    def _product_col(self, field: str) -> np.ndarray:
+        vals = self.products[field]
+        if isinstance(vals, np.ndarray):
+            return vals
+        return np.full(self.n_products, vals, dtype=object)
+
+    def _main_images(self) -> tuple:
+        """(mask ảnh chính trong bảng images, src ảnh chính theo product, product có ảnh chính)."""
+        p = self.images["product"]
+        is_main = np.r_[True, p[1:] != p[:-1]] if len(p) else np.zeros(0, dtype=bool)
+        main_src = np.full(self.n_products, np.nan, dtype=object)
+        main_src[p[is_main]] = self.images["src"][is_main]
+        has_main = np.zeros(self.n_products, dtype=bool)
+        has_main[p[is_main]] = True
+        return is_main, main_src, has_main
+
+    def to_shopify_rows(self) -> pd.DataFrame:
+        """
+        Rows Shopify (chưa qua _finish_frame): mỗi product là các dòng biến thể rồi các dòng ảnh phụ;
+        Title / Body / ảnh chính chỉ ở dòng biến thể đầu.
+        """
+        group = self.variants["product"]
+        first = np.r_[True, group[1:] != group[:-1]] if len(group) else np.zeros(0, dtype=bool)
+        is_main, main_src, has_main = self._main_images()
+        handle = self._product_col("handle")
+        vendor = self.products["vendor"]
+
+        rows = ShopifyRowBuilder()
+        rows.add_variants(group, {
+            "Handle": handle[group],
+            "Title": _on_first(first, group, self._product_col("title")),
+            "Body (HTML)": _on_first(first, group, self._product_col("body")),
+            "Vendor": vendor[group] if isinstance(vendor, np.ndarray) else vendor,
+            **{col: self.variants[f] for f, col in CATALOG_VARIANT_FIELDS.items()},
+            "Image Src": _on_first(first, group, main_src, has_main),
+            "Image Position": _on_first(first, group, np.ones(self.n_products, dtype=object), has_main),
+        })
+        extra = ~is_main & np.isin(self.images["product"], group)
+        x_product = self.images["product"][extra]
+        rows.add_images(x_product, handle[x_product], self.images["src"][extra],
+                        self.images["position"][extra].astype(object))
+        return rows.build()
+
+    def to_frames(self) -> Dict[str, pd.DataFrame]:
+        """Ba bảng phẳng products / variants / images, nối nhau qua cột product (chỉ số product)."""
+        used = np.unique(self.variants["product"])
+        products = pd.DataFrame({"product": used, **{f: self._product_col(f)[used] for f in CATALOG_PRODUCT_FIELDS}})
+        variants = pd.DataFrame(self.variants)
+        keep = np.isin(self.images["product"], used)
+        images = pd.DataFrame({f: v[keep] for f, v in self.images.items()})
+        return {"products": products, "variants": variants, "images": images}
+
+    def to_records(self) -> List[Dict[str, Any]]:
+        """Product lồng biến thể + ảnh (ảnh chính đứng đầu); ô NaN → None."""
+        def clean(v):
+            return None if isinstance(v, float) and np.isnan(v) else v
+
+        used = np.unique(self.variants["product"])
+        cols = {f: self._product_col(f) for f in CATALOG_PRODUCT_FIELDS}
+        v_start = np.searchsorted(self.variants["product"], used, side="left")
+        v_end = np.searchsorted(self.variants["product"], used, side="right")
+        i_start = np.searchsorted(self.images["product"], used, side="left")
+        i_end = np.searchsorted(self.images["product"], used, side="right")
+        out = []
+        for k, p in enumerate(used):
+            rec = {f: clean(cols[f][p]) for f in CATALOG_PRODUCT_FIELDS}
+            rec["variants"] = [
+                {f: clean(self.variants[f][i]) for f in CATALOG_VARIANT_FIELDS}
+                for i in range(v_start[k], v_end[k])
+            ]
+            rec["images"] = [
+                {"src": self.images["src"][i], "position": int(self.images["position"][i])}
+                for i in range(i_start[k], i_end[k])
+            ]
+            out.append(rec)
+        return out
+
+    def to_json(self, path: Optional[str] = None, indent: Optional[int] = None) -> Optional[str]:
+        """JSON list product (xem to_records); path=None → trả về chuỗi."""
+        text = json.dumps(self.to_records(), ensure_ascii=False, indent=indent, default=str)
+        if path is None:
+            return text
+        with open(path, "w", encoding="utf-8") as f:
+            f.write(text)
+        return None
+
+    def to_parquet(self, prefix: str) -> List[str]:
+        """Ghi {prefix}.products / .variants / .images.parquet (cần pyarrow); trả về danh sách file."""
+        paths = []
+        for name, df in self.to_frames().items():
+            path = f"{prefix}.{name}.parquet"
+            df.astype({c: "string" for c in df.columns if df[c].dtype == object}).to_parquet(path, index=False)
+            paths.append(path)
+        return paths
+
+    def nbytes(self) -> int:
+        """Ước lượng bộ nhớ các mảng (không tính chuỗi Python được trỏ tới)."""
+        arrays = [v for v in self.products.values() if isinstance(v, np.ndarray)]
+        arrays += list(self.variants.values()) + list(self.images.values())
+        return int(sum(a.nbytes for a in arrays))
+
+UNSET_BLANK_COLS = ["Option2 Name", "Option2 Value", "Image Src", "Image Position"]
+PARALLEL_MIN_ROWS = 2000     # dưới mức này mỗi phần, spawn process tốn hơn lợi
+PROGRESS_BATCH_ROWS = 2000   # có callback progress → bung theo lô cỡ này để báo tiến độ / huỷ / preview
+
+class ConversionCancelled(Exception):
+    """Callback progress raise lỗi này để dừng convert giữa chừng (giữa hai lô)."""
+
+def _finish_frame(df: pd.DataFrame) -> pd.DataFrame:
+    """Cột không dòng nào đặt giá trị → '' cho cả cột; suy lại dtype sau khi ghép các phần."""
+    if df.empty:
+        return df
+    for c in UNSET_BLANK_COLS:
+        if df[c].isna().all():
+            df[c] = ""
+    return df.infer_objects()
+
+def _n_workers(workers: Optional[int]) -> int:
+    """None/0 → số core."""
+    if not workers:
+        return os.cpu_count() or 1
+    return max(1, int(workers))
+
+def _split_ranges(weights: np.ndarray, n_parts: int) -> List[tuple]:
+    """Chia 0..len(weights) thành n_parts đoạn liền nhau, tổng weights mỗi đoạn xấp xỉ bằng nhau."""
+    cum = np.cumsum(weights)
+    cuts = np.searchsorted(cum, cum[-1] * np.arange(1, n_parts) / n_parts, side="right")
+    bounds = np.unique(np.r_[0, cuts, len(weights)])
+    return list(zip(bounds[:-1], bounds[1:]))
+
+def _run_parts(fn, parts: List[Any], workers: int, on_part=None) -> List[pd.DataFrame]:
+    """
+    fn trên từng phần (process pool nếu workers > 1), kết quả giữ đúng thứ tự phần.
+    on_part(i, kết quả) gọi theo thứ tự sau mỗi phần xong; on_part raise → huỷ các phần chưa chạy.
+    """
+    out = []
+    if workers <= 1 or len(parts) <= 1:
+        for i, p in enumerate(parts):
+            out.append(fn(p))
+            if on_part is not None:
+                on_part(i, out[-1])
+        return out
+    pool = ProcessPoolExecutor(max_workers=min(workers, len(parts)))
+    try:
+        for i, res in enumerate(pool.map(fn, parts)):
+            out.append(res)
+            if on_part is not None:
+                on_part(i, res)
+    except BaseException:
+        pool.shutdown(wait=False, cancel_futures=True)
+        raise
+    pool.shutdown()
+    return out
+
 # ================= Etsy → Shopify =================
+def _norm_price(v):
+    p = parse_price(v)
+    return p if (p is not None and not (isinstance(p, float) and math.isnan(p))) else None
+
+ETSY_IMAGE_RE = re.compile(r"IMAGE\d{1,2}")
+
+def _etsy_image_cols(columns) -> List[str]:
+    image_cols = [c for c in columns if ETSY_IMAGE_RE.fullmatch(str(c).upper())]
+    if not image_cols:
+        image_cols = [c for c in columns if "IMAGE" in str(c).upper()]
+    return image_cols
+
+def _text(s: pd.Series) -> pd.Series:
+    """str(v) cho từng ô (không có NaN)."""
+    return s.astype(object).map(str)
+
+def _col(df: pd.DataFrame, key: str, default=""):
+    """row.get(key, default) cho cả cột, trả ndarray object."""
+    if key in df.columns:
+        return df[key].to_numpy(dtype=object)
+    return np.full(len(df), default, dtype=object)
+
+def _or(*cols):
+    """`a or b or c` từng dòng (NaN vẫn truthy như bản scalar)."""
+    out = cols[-1].copy()
+    for c in reversed(cols[:-1]):
+        truthy = np.fromiter((bool(v) for v in c), dtype=bool, count=len(c))
+        out = np.where(truthy, c, out)
+    return out
+
+def _explode_list_field(col: np.ndarray) -> pd.DataFrame:
+    """split_list_field cho cả cột → bảng dài (pos, val), giữ thứ tự từng dòng."""
+    s = pd.Series(col, dtype=object)
+    s = s[s.notna()]
+    if s.empty:
+        return pd.DataFrame({"pos": np.array([], dtype=np.int64), "val": np.array([], dtype=object)})
+    parts = _text(s).str.split(",").explode().str.strip()
+    parts = parts[parts.notna() & (parts != "")]
+    return pd.DataFrame({"pos": parts.index.to_numpy(dtype=np.int64), "val": parts.to_numpy(dtype=object)})
+
+def _is_digital_like_arr(vals: np.ndarray) -> np.ndarray:
+    return pd.Series(vals, dtype=object).map(str).str.strip().str.lower().isin(DIGITAL_LIKE).to_numpy()
+
+def _keep_mask(vals: np.ndarray) -> np.ndarray:
+    if not EXCLUDE_OPTIONS:
+        return np.ones(len(vals), dtype=bool)
+    return ~pd.Series(vals, dtype=object).map(str).str.strip().str.lower().isin(EXCLUDE_OPTIONS).to_numpy()
+
+def _group_bounds(pos: np.ndarray, n: int):
+    """pos đã sort → (start, count) cho từng listing 0..n-1."""
+    start = np.searchsorted(pos, np.arange(n), side="left")
+    stop = np.searchsorted(pos, np.arange(n), side="right")
+    return start, stop - start
+
+def _etsy_handles(etsy: pd.DataFrame) -> np.ndarray:
+    """Handle từng listing: slugify(TITLE), title rỗng → etsy-{idx+1} theo index gốc."""
+    title = _col(etsy, "TITLE", "")
+    return np.array([slugify(t) or f"etsy-{i+1}" for t, i in zip(title, etsy.index)], dtype=object)
+
+def _match_option_skus(opt1: List[str], opt1_all: List[str], skus_all: List[str]) -> List[str]:
+    """Map SKU theo Option1 (chỉ cho biến thể vật lý) — token, rồi chứa nhau, rồi theo vị trí."""
+    def keep(v): return str(v).strip().lower() not in EXCLUDE_OPTIONS
+    keep_mask1 = [keep(v) for v in opt1_all] if opt1_all else []
+    if opt1_all and len(skus_all) == len(opt1_all):
+        skus_by_pos = [s for s, k in zip(skus_all, keep_mask1) if k]
+    else:
+        skus_by_pos = skus_all[:len(opt1)]
+
+    matcher = SkuMatcher(skus_all, skus_by_pos)
+    return ["" if is_digital_like(o1) else matcher.match(o1) for o1 in opt1]   # digital → SKU rỗng
+
+def _expand_etsy(
+    etsy: pd.DataFrame,
+    image_cols: List[str],
+    vendor_text: str,
+    markup_pct: float,
+    price_table: Optional[PriceTable],
+    apply_markup_on_map: bool,
+    compare_at_markup_pct: float,
+    report: Optional[ConversionReport] = None,
+    as_catalog: bool = False,
+):
+    """
+    Bung các listing Etsy (header đã upper) thành rows Shopify theo cột:
+    explode Option1/Option2/SKU → cross-join → CatalogTable → rows (Title/Body/ảnh đầu ở dòng đầu mỗi handle).
+    Index của etsy dùng cho handle dự phòng etsy-{idx+1}. report: ghi thời gian từng bước.
+    as_catalog: trả về CatalogTable thay cho rows Shopify.
+    """
+    n = len(etsy)
+    if n == 0:
+        return CatalogTable.empty() if as_catalog else pd.DataFrame(columns=SHOPIFY_BASE_COLS)
+    handle = _etsy_handles(etsy)
+    etsy = etsy.reset_index(drop=True)
+
+    # ----- Cấp listing -----
+    title = _col(etsy, "TITLE", "")
+    desc = _col(etsy, "DESCRIPTION", "")
+    listing_id = _col(etsy, "LISTING ID", "")
+    opt1_name = _or(_col(etsy, "VARIATION 1 NAME"), _col(etsy, "VARIATION 1 TYPE"), np.full(n, "Option1", dtype=object))
+    opt2_name = _or(_col(etsy, "VARIATION 2 NAME"), _col(etsy, "VARIATION 2 TYPE"), np.full(n, "", dtype=object))
+    vendor = _or(np.full(n, vendor_text, dtype=object), _col(etsy, "VENDOR", ""), np.full(n, "", dtype=object))
+    opt1_name = np.array([str(v) for v in opt1_name], dtype=object)
+    opt2_truthy = np.array([bool(v) for v in opt2_name], dtype=bool)
+    opt2_name = np.array([str(v) if t else "" for v, t in zip(opt2_name, opt2_truthy)], dtype=object)
+
+    safe_title = np.array([
+        t if str(t).strip() else (f"ETSY {lid}" if str(lid).strip() else h.replace("-", " ").title())
+        for t, lid, h in zip(title, listing_id, handle)
+    ], dtype=object)
+
+    if "PRICE" in etsy.columns:
+        default_price = price_cells(apply_markup_series(etsy["PRICE"], markup_pct)).to_numpy(dtype=object)
+    else:
+        default_price = np.full(n, "", dtype=object)
+    _lap(report, "listings")
+
+    # ----- Ảnh: quét IMAGE cols theo hàng, tối đa 20/listing -----
+    if image_cols:
+        grid = etsy[image_cols].to_numpy(dtype=object).ravel()
+        img_pos = np.repeat(np.arange(n), len(image_cols))
+        present = pd.notna(grid)
+        img = pd.Series(grid[present], dtype=object)
+        img = _text(img).str.strip() if not img.empty else img
+        img_pos = img_pos[present]
+        nonempty = (img != "").to_numpy()
+        img = img.to_numpy(dtype=object)[nonempty]
+        img_pos = img_pos[nonempty]
+    else:
+        img = np.array([], dtype=object)
+        img_pos = np.array([], dtype=np.int64)
+    img_rank = pd.Series(img_pos).groupby(img_pos).cumcount().to_numpy()
+    keep_img = img_rank < 20
+    img, img_pos, img_rank = img[keep_img], img_pos[keep_img], img_rank[keep_img]
+    _lap(report, "images")
+
+    # ----- Option1 (+ "Default" nếu trống) -----
+    opt1_all = _explode_list_field(_col(etsy, "VARIATION 1 VALUES"))
+    opt1 = opt1_all[_keep_mask(opt1_all["val"].to_numpy())]
+    missing = np.setdiff1d(np.arange(n), opt1["pos"].to_numpy())
+    if len(missing):
+        opt1 = pd.concat([opt1, pd.DataFrame({"pos": missing, "val": "Default"})], ignore_index=True)
+        opt1 = opt1.sort_values("pos", kind="stable", ignore_index=True)
+    o1_pos = opt1["pos"].to_numpy()
+    o1_val = opt1["val"].to_numpy(dtype=object)
+    o1_digital = _is_digital_like_arr(o1_val)
+    _lap(report, "options")
+
+    # ----- SKU theo Option1: chỉ listing có SKU mới cần match -----
+    o1_sku = np.full(len(opt1), "", dtype=object)
+    skus = _explode_list_field(_col(etsy, "SKU"))
+    if not skus.empty:
+        s_pos = skus["pos"].to_numpy()
+        s_val = skus["val"].to_numpy(dtype=object)
+        all_val = opt1_all["val"].to_numpy(dtype=object)
+        o1_start, o1_count = _group_bounds(o1_pos, n)
+        s_start, s_count = _group_bounds(s_pos, n)
+        a_start, a_count = _group_bounds(opt1_all["pos"].to_numpy(), n)
+        for p in np.unique(s_pos):
+            a, c = o1_start[p], o1_count[p]
+            o1_sku[a:a + c] = _match_option_skus(
+                list(o1_val[a:a + c]),
+                list(all_val[a_start[p]:a_start[p] + a_count[p]]),
+                list(s_val[s_start[p]:s_start[p] + s_count[p]]),
+            )
+    _lap(report, "sku_match")
+
+    # ----- Giá theo Option1 -----
+    vprice = default_price[o1_pos]
+    if price_table:
+        mapped = price_table.lookup_array(o1_val)
+        if apply_markup_on_map:
+            mapped = _round2(mapped * (1 + float(markup_pct)/100.0))
+        else:
+            mapped = _round2(mapped)
+        hit = ~np.isnan(mapped)
+        vprice = vprice.copy()
+        vprice[hit] = mapped[hit]
+    vnum = pd.Series(vprice, dtype=object).replace("", np.nan).astype(float)
+    vcompare = price_cells(calc_compare_at_series(vnum, compare_at_markup_pct)).to_numpy(dtype=object)
+    _lap(report, "price")
+
+    # ----- Cross-join Option1 × Option2 -----
+    opt2 = _explode_list_field(_col(etsy, "VARIATION 2 VALUES"))
+    opt2 = opt2[_keep_mask(opt2["val"].to_numpy())]
+    o2_pos = opt2["pos"].to_numpy()
+    o2_val = opt2["val"].to_numpy(dtype=object)
+    o2_start, o2_count = _group_bounds(o2_pos, n)
+    reps = np.maximum(o2_count[o1_pos], 1)
+    vi = np.repeat(np.arange(len(o1_pos)), reps)            # dòng Option1 của từng biến thể
+    v_pos = o1_pos[vi]
+    offset = np.arange(len(vi)) - np.repeat(np.cumsum(reps) - reps, reps)
+    have_opt2 = o2_count[v_pos] > 0
+    o2_idx = np.where(have_opt2, o2_start[v_pos] + offset, 0)
+    v_o2 = np.where(have_opt2, o2_val[o2_idx] if len(o2_val) else None, None)
+
+    v_digital = o1_digital[vi].copy()
+    if have_opt2.any():
+        v_digital[have_opt2] |= opt2_truthy[v_pos[have_opt2]] & _is_digital_like_arr(v_o2[have_opt2])
+    sku_val = np.where(v_digital, "", o1_sku[vi]).astype(object)
+    _lap(report, "variants")
+
+    # ----- Catalog: listing / biến thể / ảnh → rows Shopify -----
+    o2_name_v = np.full(len(vi), np.nan, dtype=object)
+    o2_value_v = np.full(len(vi), np.nan, dtype=object)
+    o2_name_v[have_opt2] = opt2_name[v_pos[have_opt2]]
+    o2_value_v[have_opt2] = [str(v) if t else "" for v, t in zip(v_o2[have_opt2], opt2_truthy[v_pos[have_opt2]])]
+
+    catalog = CatalogTable(
+        n,
+        {"handle": handle, "title": safe_title, "body": desc, "vendor": vendor},
+        {
+            "product": v_pos,
+            "option1_name": opt1_name[v_pos],
+            "option1_value": np.array([str(v) for v in o1_val], dtype=object)[vi],
+            "option2_name": o2_name_v,
+            "option2_value": o2_value_v,
+            "sku": sku_val,
+            "price": vprice[vi],
+            "compare_at": vcompare[vi],
+        },
+        {"product": img_pos, "src": img, "position": img_rank + 1},
+    )
+    _lap(report, "catalog")
+    if as_catalog:
+        return catalog
+    out = catalog.to_shopify_rows()
+    _lap(report, "build")
+    return out
+
 def convert_etsy_to_shopify(
     file_like_or_path,
     vendor_text: str = "",
@@ -147,327 +1746,940 @@ def convert_etsy_to_shopify(
     variant_price_map: Optional[Dict[str, Any]] = None,
     apply_markup_on_map: bool = False,
     compare_at_markup_pct: float = 0.0,
+    workers: Optional[int] = 1,
+    report: Optional[ConversionReport] = None,
+    progress=None,
 ) -> pd.DataFrame:
     """
     Etsy CSV:
     - Giữ mọi biến thể (kể cả Digital/PNG/PDF...) — biến thể số → SKU rỗng
     - SKU biến thể vật lý: map theo Option1 với token-matching
-    - Nếu có variant_price_map: set giá theo Option1 (ưu tiên exact, rồi token), fallback dùng PRICE + markup
+    - Nếu có variant_price_map (dict hoặc PriceTable đã dựng sẵn): set giá theo Option1 (ưu tiên exact, rồi token),
+      fallback dùng PRICE + markup
     - Compare-at = Variant Price × (1 + compare_at_markup_pct/100) nếu % > 0
+    - file_like_or_path: đường dẫn / file upload / DataFrame đã đọc (read_etsy_csv)
+    - workers > 1 (None = số core): chia listing cho nhiều process, kết quả giống hệt chạy tuần tự
+    - report: ConversionReport được điền thời gian từng stage, số dòng, cache hit, peak RSS
+    - progress(done, total, rows): gọi sau mỗi lô listing (PROGRESS_BATCH_ROWS) với số listing đã xong / tổng
+      và rows Shopify của lô (chưa hoàn thiện, chỉ để xem trước — đừng sửa); raise ConversionCancelled để huỷ
     """
-    etsy = pd.read_csv(file_like_or_path, engine="python")
+    if report is not None:
+        report.skip()
+    etsy = read_etsy_csv(file_like_or_path)
+    _lap(report, "read")
+    return _convert_etsy_frame(etsy, vendor_text, markup_pct, variant_price_map, apply_markup_on_map,
+                               compare_at_markup_pct, workers, report, progress)
 
-    # 🔧 Chuẩn hoá header
-    etsy.columns = [str(c).strip().upper() for c in etsy.columns]
-    def getU(row, key, default=""):
-        return row.get(key, default)
+def _convert_etsy_frame(
+    etsy: pd.DataFrame,
+    vendor_text: str,
+    markup_pct: float,
+    variant_price_map: Optional[Dict[str, Any]],
+    apply_markup_on_map: bool,
+    compare_at_markup_pct: float,
+    workers: Optional[int],
+    report: Optional[ConversionReport],
+    progress=None,
+) -> pd.DataFrame:
+    """Phần sau bước đọc của convert_etsy_to_shopify (etsy: header đã upper, index gốc)."""
+    price_table = as_price_table(variant_price_map)
+    _lap(report, "price_map")
+    expand = partial(
+        _expand_etsy,
+        image_cols=_etsy_image_cols(etsy.columns), vendor_text=vendor_text, markup_pct=markup_pct,
+        price_table=price_table, apply_markup_on_map=apply_markup_on_map, compare_at_markup_pct=compare_at_markup_pct,
+    )
 
-    rows: List[Dict[str, Any]] = []
+    # Song song / theo lô: chia theo dòng listing (giữ index gốc → handle etsy-{idx+1} không đổi)
+    n_workers = min(_n_workers(workers), max(1, len(etsy) // PARALLEL_MIN_ROWS))
+    n_parts = n_workers if progress is None else max(n_workers, -(-len(etsy) // PROGRESS_BATCH_ROWS))
+    if n_parts <= 1:
+        df = expand(etsy, report=report)
+        if progress is not None:
+            progress(len(etsy), len(etsy), df)
+    else:
+        bounds = _split_ranges(np.ones(len(etsy)), n_parts)
+        parts = [etsy.iloc[a:b] for a, b in bounds]
+        on_part = None if progress is None else (lambda i, rows: progress(int(bounds[i][1]), len(etsy), rows))
+        run = partial(expand, report=report) if n_workers <= 1 else expand
+        df = pd.concat(_run_parts(run, parts, n_workers, on_part), ignore_index=True)
+        _lap(report, "expand" if n_workers > 1 else "concat")
+    df = _finish_frame(df)
+    _lap(report, "finish")
+    if report is not None:
+        report.params.setdefault("workers", n_workers)
+        _count_output(report, len(etsy), df)
+        report.finish()
+    return df
 
-    # Chuẩn hoá price map
-    def _norm_price(v):
-        p = parse_price(v)
-        return p if (p is not None and not (isinstance(p, float) and math.isnan(p))) else None
+def etsy_to_catalog(
+    file_like_or_path,
+    vendor_text: str = "",
+    markup_pct: float = 0.0,
+    variant_price_map: Optional[Dict[str, Any]] = None,
+    apply_markup_on_map: bool = False,
+    compare_at_markup_pct: float = 0.0,
+    workers: Optional[int] = 1,
+) -> CatalogTable:
+    """Như convert_etsy_to_shopify nhưng trả về CatalogTable (để ghi JSON / Parquet, hoặc to_shopify_rows)."""
+    etsy = read_etsy_csv(file_like_or_path)
+    expand = partial(
+        _expand_etsy,
+        image_cols=_etsy_image_cols(etsy.columns), vendor_text=vendor_text, markup_pct=markup_pct,
+        price_table=as_price_table(variant_price_map), apply_markup_on_map=apply_markup_on_map,
+        compare_at_markup_pct=compare_at_markup_pct, as_catalog=True,
+    )
+    n_workers = min(_n_workers(workers), max(1, len(etsy) // PARALLEL_MIN_ROWS))
+    if n_workers <= 1:
+        return expand(etsy)
+    parts = [etsy.iloc[a:b] for a, b in _split_ranges(np.ones(len(etsy)), n_workers)]
+    return CatalogTable.concat(_run_parts(expand, parts, n_workers))
 
-    map_exact = {}
-    map_token = {}
-    if variant_price_map:
-        for k, v in variant_price_map.items():
-            price_val = _norm_price(v)
-            if price_val is None:
-                continue
-            k_str = str(k).strip()
-            map_exact[k_str] = price_val
-            tk = option1_token(k_str)
-            if tk:
-                map_token[tk] = price_val
+# ================= Etsy → Shopify (streaming) =================
+ETSY_CHUNK_ROWS = 5000   # số listing mỗi chunk khi stream
 
-    # Ảnh
-    image_cols = [c for c in etsy.columns if re.fullmatch(r"IMAGE\d{1,2}", str(c).upper())]
-    if not image_cols:
-        image_cols = [c for c in etsy.columns if "IMAGE" in str(c).upper()]
-
-    for idx, r in etsy.iterrows():
-        title = getU(r, "TITLE", "")
-        desc  = getU(r, "DESCRIPTION", "")
-        price = getU(r, "PRICE", "")
-
-        # Ảnh
-        images = []
-        for c in image_cols:
-            v = r.get(c)
-            if pd.notna(v) and str(v).strip():
-                images.append(str(v).strip())
-        images = images[:20]
-
-        # Options
-        opt1_name = getU(r, "VARIATION 1 NAME") or getU(r, "VARIATION 1 TYPE") or "Option1"
-        opt2_name = getU(r, "VARIATION 2 NAME") or getU(r, "VARIATION 2 TYPE") or ""
-        opt1_all  = split_list_field(getU(r, "VARIATION 1 VALUES"))
-        opt2_all  = split_list_field(getU(r, "VARIATION 2 VALUES"))
-        skus_all  = split_list_field(getU(r, "SKU"))
-
-        def keep(v): return str(v).strip().lower() not in EXCLUDE_OPTIONS
-        opt1 = [v for v in opt1_all if keep(v)] or ["Default"]
-        opt2 = [v for v in opt2_all if keep(v)]
-        have_opt2 = len(opt2) > 0
-        if len(opt1) == 0:
-            continue
+def iter_etsy_to_shopify(
+    file_like_or_path,
+    vendor_text: str = "",
+    markup_pct: float = 0.0,
+    variant_price_map: Optional[Dict[str, Any]] = None,
+    apply_markup_on_map: bool = False,
+    compare_at_markup_pct: float = 0.0,
+    chunksize: int = ETSY_CHUNK_ROWS,
+    report: Optional[ConversionReport] = None,
+) -> Iterator[pd.DataFrame]:
+    """
+    Như convert_etsy_to_shopify nhưng đọc CSV theo chunk và yield từng khối rows Shopify
+    (cột cố định SHOPIFY_BASE_COLS) → bộ nhớ không phụ thuộc kích thước file.
+    report: stage cộng dồn qua các chunk; thời gian caller xử lý chunk không tính vào.
+    """
+    if report is not None:
+        report.skip()
+    price_table = as_price_table(variant_price_map)
+    _lap(report, "price_map")
+    image_cols = None
+    for etsy in iter_etsy_csv(file_like_or_path, chunksize):
+        _lap(report, "read")
+        if image_cols is None:
+            image_cols = _etsy_image_cols(etsy.columns)
+        df = _finish_frame(_expand_etsy(
+            etsy, image_cols, vendor_text, markup_pct, price_table,
+            apply_markup_on_map, compare_at_markup_pct, report,
+        ))
+        _lap(report, "finish")
+        _count_output(report, len(etsy), df)
+        yield df
+        if report is not None:
+            report.skip()
+    if report is not None:
+        report.finish()
 
-        # Map SKU theo Option1 (chỉ cho biến thể vật lý)
-        keep_mask1 = [keep(v) for v in opt1_all] if opt1_all else []
-        if opt1_all and len(skus_all) == len(opt1_all):
-            skus_by_pos = [s for s, k in zip(skus_all, keep_mask1) if k]
-        else:
-            skus_by_pos = skus_all[:len(opt1)]
-
-        token_to_sku = {sku_token(s): s for s in skus_all}
-        matched_skus: List[str] = []
-        used = set()
-        for i, o1 in enumerate(opt1):
-            if is_digital_like(o1):
-                matched_skus.append("")  # digital → SKU rỗng
-                continue
-            tok = option1_token(o1)
-            sku = token_to_sku.get(tok)
-            if sku is None:
-                found = None
-                for tk, val in token_to_sku.items():
-                    if tk in tok or tok in tk:
-                        if val not in used:
-                            found = val; break
-                sku = found
-            if sku is None:
-                sku = next((s for s in skus_by_pos if s not in used), "")
-            used.add(sku)
-            matched_skus.append(sku)
-
-        handle = slugify(title) or f"etsy-{idx+1}"
-        vendor = (vendor_text or getU(r, "VENDOR", "") or "")
-        default_price = apply_markup(price, markup_pct)
-
-        def base_row():
-            return {
-                "Handle": handle,
-                "Vendor": vendor,
-                "Published": DEFAULT_PUBLISHED,
-                "Variant Inventory Tracker": DEFAULT_INVENTORY_TRACKER,
-                "Variant Inventory Qty": DEFAULT_INVENTORY_QTY,
-                "Variant Inventory Policy": DEFAULT_INVENTORY_POLICY,
-                "Variant Fulfillment Service": DEFAULT_FULFILLMENT_SERVICE,
-                "Variant Requires Shipping": DEFAULT_REQUIRES_SHIPPING,
-                "Variant Taxable": DEFAULT_TAXABLE,
-                "Status": DEFAULT_STATUS,
-            }
+def write_shopify_csv(chunks: Iterable[pd.DataFrame], path_or_buf, encoding: str = "utf-8-sig") -> int:
+    """Ghi lần lượt từng khối rows ra CSV (header một lần, cột theo SHOPIFY_BASE_COLS). Trả số dòng đã ghi."""
+    def _write(fh) -> int:
+        total = 0
+        header = True
+        for chunk in chunks:
+            chunk.reindex(columns=SHOPIFY_BASE_COLS).to_csv(fh, index=False, header=header)
+            total += len(chunk)
+            header = False
+        if header:
+            pd.DataFrame(columns=SHOPIFY_BASE_COLS).to_csv(fh, index=False)
+        return total
+
+    if hasattr(path_or_buf, "write"):
+        return _write(path_or_buf)
+    with open(path_or_buf, "w", encoding=encoding, newline="") as fh:
+        return _write(fh)
+
+def convert_etsy_to_shopify_csv(file_like_or_path, out_path, chunksize: int = ETSY_CHUNK_ROWS, **kwargs) -> int:
+    """Etsy CSV → Shopify CSV trên đĩa theo kiểu stream. kwargs như convert_etsy_to_shopify."""
+    return write_shopify_csv(iter_etsy_to_shopify(file_like_or_path, chunksize=chunksize, **kwargs), out_path)
+
+# ================= Ghi CSV Shopify: chunk / nén / chia file =================
+SHOPIFY_IMPORT_MAX_BYTES = 15 * 1024 * 1024   # giới hạn file CSV import sản phẩm của Shopify
+CSV_WRITE_ROWS = 20000                        # số dòng mỗi lần render khi input là một DataFrame
+OUTPUT_COMPRESSIONS = (None, "gzip", "zip")
+
+def _iter_frames(rows, chunk_rows: int) -> Iterator[pd.DataFrame]:
+    """DataFrame → cắt thành khối chunk_rows dòng; iterable các DataFrame → giữ nguyên."""
+    if isinstance(rows, pd.DataFrame):
+        for a in range(0, len(rows), chunk_rows):
+            yield rows.iloc[a:a + chunk_rows]
+        return
+    yield from rows
+
+def _record_ends(data: bytes) -> np.ndarray:
+    """Offset (sau '\\n') kết thúc từng record CSV; '\\n' nằm trong ô có ngoặc kép (số '"' đứng trước lẻ) bị bỏ qua."""
+    arr = np.frombuffer(data, dtype=np.uint8)
+    nl = np.flatnonzero(arr == 10)
+    quotes = arr == 34
+    if quotes.any():
+        odd = np.bitwise_xor.accumulate(quotes.view(np.uint8))
+        nl = nl[odd[nl] == 0]
+    return nl + 1
 
-        def resolve_variant_price(option1_value: str):
-            if not map_exact and not map_token:
-                return default_price
-            if option1_value in map_exact:
-                p = map_exact[option1_value]
-                return round(p * (1 + float(markup_pct)/100.0), 2) if apply_markup_on_map else round(p, 2)
-            tok = option1_token(option1_value)
-            if tok and tok in map_token:
-                p = map_token[tok]
-                return round(p * (1 + float(markup_pct)/100.0), 2) if apply_markup_on_map else round(p, 2)
-            return default_price
-
-        v_idx = 0
-        for i, o1 in enumerate(opt1):
-            o1_sku = matched_skus[i] if i < len(matched_skus) else ""
-            vprice = resolve_variant_price(str(o1)) if variant_price_map else default_price
-            vcompare = calc_compare_at(vprice, compare_at_markup_pct)
-
-            if have_opt2:
-                for o2 in opt2:
-                    row = base_row()
-                    if v_idx == 0:
-                        listing_id = getU(r, "LISTING ID", "")
-                        safe_title = title if str(title).strip() else (f"ETSY {listing_id}" if str(listing_id).strip() else handle.replace("-", " ").title())
-                        row.update({"Title": safe_title, "Body (HTML)": desc})
-                        if images:
-                            row["Image Src"] = images[0]; row["Image Position"] = 1
-
-                    sku_val = "" if (is_digital_like(o1) or (opt2_name and is_digital_like(o2))) else (str(o1_sku) if o1_sku is not None else "")
-
-                    row.update({
-                        "Option1 Name": str(opt1_name),
-                        "Option1 Value": str(o1),
-                        "Option2 Name": str(opt2_name) if opt2_name else "",
-                        "Option2 Value": str(o2) if opt2_name else "",
-                        "Variant SKU": sku_val,
-                        "Variant Price": vprice,
-                        "Variant Compare At Price": vcompare,
-                    })
-                    rows.append(row); v_idx += 1
+def _part_names(out_path: str, n_parts: int, compression: Optional[str]) -> List[str]:
+    """shopify.csv → shopify.csv | shopify_part1.csv, shopify_part2.csv... (+ .gz nếu gzip)."""
+    stem = out_path
+    for ext in (".zip", ".gz", ".csv"):
+        if stem.lower().endswith(ext):
+            stem = stem[:-len(ext)]
+    if compression == "zip":
+        stem = os.path.basename(stem)
+    ext = ".csv.gz" if compression == "gzip" else ".csv"
+    if n_parts == 1:
+        return [stem + ext]
+    return [f"{stem}_part{i}{ext}" for i in range(1, n_parts + 1)]
+
+def archive_path(out_path: str) -> str:
+    """Đường dẫn file .zip tương ứng out_path (khi compression='zip')."""
+    return _part_names(out_path, 1, None)[0][:-len(".csv")] + ".zip"
+
+class _CsvPartWriter:
+    """
+    Ghi bytes CSV ra các part tạm, mở part mới khi vượt max_bytes.
+    Chỉ cắt giữa các khối handle → một handle không bao giờ nằm ở 2 file.
+    """
+
+    def __init__(self, out_path: str, header: bytes, max_bytes: Optional[int], compression: Optional[str]):
+        self.out_path = out_path
+        self.header = header
+        self.max_bytes = max_bytes
+        self.compression = compression
+        self.parts: List[Dict[str, Any]] = []   # {"tmp", "rows", "bytes"}
+        self._fh = None
+
+    def _open(self) -> None:
+        self.close_part()
+        tmp = f"{self.out_path}.part{len(self.parts) + 1}.tmp"
+        self._fh = gzip.open(tmp, "wb") if self.compression == "gzip" else open(tmp, "wb")
+        self._fh.write(self.header)
+        self.parts.append({"tmp": tmp, "rows": 0, "bytes": len(self.header)})
+
+    def close_part(self) -> None:
+        if self._fh is not None:
+            self._fh.close()
+            self._fh = None
+
+    def write_blocks(self, data: bytes, ends: np.ndarray, rows: np.ndarray) -> None:
+        """
+        data = nhiều khối handle liền nhau; ends[i] / rows[i] = offset byte / số dòng tích luỹ ở cuối khối i.
+        Ghi tham lam: mỗi lần lấy nhiều khối nhất còn vừa part hiện tại (khối quá lớn vẫn đi riêng một part).
+        """
+        start, done_rows, i, n = 0, 0, 0, len(ends)
+        while i < n:
+            if self._fh is None:
+                self._open()
+            part = self.parts[-1]
+            if self.max_bytes is None:
+                j = n
             else:
-                row = base_row()
-                if v_idx == 0:
-                    listing_id = getU(r, "LISTING ID", "")
-                    safe_title = title if str(title).strip() else (f"ETSY {listing_id}" if str(listing_id).strip() else handle.replace("-", " ").title())
-                    row.update({"Title": safe_title, "Body (HTML)": desc})
-                    if images:
-                        row["Image Src"] = images[0]; row["Image Position"] = 1
-
-                sku_val = "" if is_digital_like(o1) else (str(o1_sku) if o1_sku is not None else "")
-                row.update({
-                    "Option1 Name": str(opt1_name),
-                    "Option1 Value": str(o1),
-                    "Variant SKU": sku_val,
-                    "Variant Price": vprice,
-                    "Variant Compare At Price": vcompare,
-                })
-                rows.append(row); v_idx += 1
-
-        for pos, url in enumerate(images[1:], start=2):
-            rows.append({"Handle": handle, "Image Src": url, "Image Position": pos})
-
-    return _finalize(rows)
+                room = self.max_bytes - part["bytes"]
+                j = int(np.searchsorted(ends, start + room, side="right"))
+                if j <= i:
+                    if part["rows"]:
+                        self._open()
+                        continue
+                    j = i + 1
+            end, end_rows = int(ends[j - 1]), int(rows[j - 1])
+            self._fh.write(data[start:end])
+            part["bytes"] += end - start
+            part["rows"] += end_rows - done_rows
+            start, done_rows, i = end, end_rows, j
+
+    def finish(self) -> List[Dict[str, Any]]:
+        """Đổi part tạm sang tên cuối (hoặc gom vào .zip). Trả [{"file", "name", "rows", "bytes"}]."""
+        if not self.parts:
+            self._open()                       # không có dòng nào → vẫn ghi file chỉ có header
+        self.close_part()
+        names = _part_names(self.out_path, len(self.parts), self.compression)
+        if self.compression == "zip":
+            target = archive_path(self.out_path)
+            with zipfile.ZipFile(target, "w", compression=zipfile.ZIP_DEFLATED) as zf:
+                for part, name in zip(self.parts, names):
+                    zf.write(part["tmp"], arcname=name)
+                    os.remove(part["tmp"])
+            return [{"file": target, "name": name, "rows": p["rows"], "bytes": p["bytes"]}
+                    for p, name in zip(self.parts, names)]
+        for part, name in zip(self.parts, names):
+            os.replace(part["tmp"], name)
+        return [{"file": name, "name": os.path.basename(name), "rows": p["rows"], "bytes": p["bytes"]}
+                for p, name in zip(self.parts, names)]
+
+    def abort(self) -> None:
+        self.close_part()
+        for part in self.parts:
+            if os.path.exists(part["tmp"]):
+                os.remove(part["tmp"])
+
+def _group_handles(rows):
+    """Gom các dòng cùng Handle lại cạnh nhau (thứ tự handle xuất hiện, sort ổn định); iterator giữ nguyên."""
+    if isinstance(rows, (list, tuple)):
+        frames = [f for f in rows if len(f)]
+        if not frames:
+            return rows
+        handles = pd.concat([f["Handle"] for f in frames], ignore_index=True)
+        codes = pd.factorize(handles, sort=False, use_na_sentinel=False)[0]
+        if not (np.diff(codes) < 0).any():
+            return rows
+        rows = pd.concat(frames, ignore_index=True)
+    if not isinstance(rows, pd.DataFrame) or rows.empty:
+        return rows
+    codes = pd.factorize(rows["Handle"], sort=False, use_na_sentinel=False)[0]
+    if (np.diff(codes) < 0).any():
+        rows = rows.iloc[np.argsort(codes, kind="stable")]
+    return rows
+
+def write_shopify_csv_parts(
+    rows,
+    out_path: str,
+    max_bytes: Optional[int] = None,
+    compression: Optional[str] = None,
+    encoding: str = "utf-8-sig",
+    chunk_rows: int = CSV_WRITE_ROWS,
+    report: Optional[ConversionReport] = None,
+) -> List[Dict[str, Any]]:
+    """
+    Ghi rows Shopify (DataFrame hoặc iterable các DataFrame, vd iter_etsy_to_shopify) ra đĩa theo từng khối:
+    - max_bytes: chia thành nhiều file import, mỗi file ≤ max_bytes (tính cả header), không cắt ngang một handle;
+      một handle lớn hơn max_bytes vẫn nằm trọn một file. DataFrame / list các DataFrame có dòng cùng Handle
+      nằm rải rác (vd title trùng, gộp nhiều file) được gom lại theo thứ tự handle xuất hiện (sort ổn định);
+      iterator (stream) không gom được → handle đã ghi mà xuất hiện lại thì ValueError.
+    - compression: None | "gzip" (mỗi part một .csv.gz) | "zip" (mọi part trong một .zip, xem archive_path).
+    Mỗi part có header riêng (và BOM nếu utf-8-sig). Trả danh sách part: file, name, rows, bytes (chưa nén).
+    report: thêm stage 'encode' (render CSV) và 'write' (ghi / nén).
+    """
+    if compression not in OUTPUT_COMPRESSIONS:
+        raise ValueError(f"compression phải là một trong {OUTPUT_COMPRESSIONS}")
+    if max_bytes is not None and max_bytes <= 0:
+        max_bytes = None
+    body_encoding = "utf-8" if encoding.lower().replace("_", "-") == "utf-8-sig" else encoding
+    header = pd.DataFrame(columns=SHOPIFY_BASE_COLS).to_csv(index=False).encode(encoding)
+    if max_bytes is not None:
+        rows = _group_handles(rows)
+    writer = _CsvPartWriter(out_path, header, max_bytes, compression)
+
+    # Khối handle cuối mỗi chunk chưa ghi ngay: có thể còn tiếp ở chunk sau
+    pending, pending_rows, pending_handle = b"", 0, None
+    closed = set()   # handle đã ghi xong (chia file: không được xuất hiện lại)
+    try:
+        for chunk in _iter_frames(rows, chunk_rows):
+            if chunk.empty:
+                continue
+            if report is not None:
+                report.skip()
+            chunk = chunk.reindex(columns=SHOPIFY_BASE_COLS)
+            data = chunk.to_csv(index=False, header=False).encode(body_encoding)
+            row_ends = _record_ends(data)
+            _lap(report, "encode")
+            handles = chunk["Handle"].to_numpy(dtype=object)
+            if pending_rows and handles[0] != pending_handle:
+                writer.write_blocks(pending, np.array([len(pending)]), np.array([pending_rows]))
+                closed.add(pending_handle)
+                pending, pending_rows = b"", 0
+            starts = np.flatnonzero(np.r_[True, handles[1:] != handles[:-1]])
+            if max_bytes is not None:
+                heads = handles[starts]
+                if closed.intersection(heads) or len(set(heads)) != len(heads):
+                    again = [h for i, h in enumerate(heads) if h in closed or h in heads[:i]]
+                    raise ValueError(f"Dòng cùng Handle không liền nhau, sẽ bị tách sang file khác: {again[:5]}")
+                closed.update(heads[:-1])
+            # Ghép pending (cùng handle với dòng đầu) vào khối đầu, ghi mọi khối trừ khối cuối
+            data = pending + data
+            block_ends = np.r_[row_ends[starts[1:] - 1], row_ends[-1]] + len(pending)
+            block_rows = np.r_[starts[1:], len(chunk)] + pending_rows
+            if len(block_ends) > 1:
+                writer.write_blocks(data, block_ends[:-1], block_rows[:-1])
+                cut, cut_rows = int(block_ends[-2]), int(block_rows[-2])
+            else:
+                cut, cut_rows = 0, 0
+            pending = data[cut:]
+            pending_rows = int(block_rows[-1]) - cut_rows
+            pending_handle = handles[-1]
+            _lap(report, "write")
+        if report is not None:
+            report.skip()
+        if pending_rows:
+            writer.write_blocks(pending, np.array([len(pending)]), np.array([pending_rows]))
+        parts = writer.finish()
+        if report is not None:
+            report.lap("write")
+            report.add(output_files=len({p["file"] for p in parts}), output_bytes=sum(p["bytes"] for p in parts))
+            report.finish()
+        return parts
+    except BaseException:
+        writer.abort()
+        raise
 
 # ================= TikTok → Shopify =================
-def convert_tiktok_to_shopify(
-    file_like_or_path,
-    vendor_text: str = "",
-    markup_pct: float = 0.0,
-    compare_at_markup_pct: float = 0.0,
-) -> pd.DataFrame:
-    """Đọc CSV hoặc XLSX TikTok; gom ảnh; sinh rows chuẩn Shopify."""
-    name = getattr(file_like_or_path, 'name', '')
-    if name and name.lower().endswith('.csv'):
-        tt = pd.read_csv(file_like_or_path)
-    elif name and name.lower().endswith(('.xlsx', '.xls')):
-        tt = pd.read_excel(file_like_or_path)
-    else:
-        p = str(file_like_or_path).lower()
-        if p.endswith('.csv'):
-            tt = pd.read_csv(file_like_or_path)
-        else:
-            tt = pd.read_excel(file_like_or_path)
+TIKTOK_URL_SPLIT = r"[, \t\r\n]+"
 
-    tt.columns = [str(c).strip() for c in tt.columns]
+def _resolve_tiktok_columns(columns) -> Dict[str, Any]:
+    """Dò cột TikTok theo tên ứng viên (header đã strip)."""
+    columns = list(columns)
 
     def pick(*cands):
         for c in cands:
-            if c in tt.columns:
+            if c in columns:
                 return c
         return None
 
-    title_col = pick("Product Name", "Title", "Name", "Product Title")
-    desc_col  = pick("Product description", "Description", "Product Description")
     price_col = pick("Price", "Sale Price", "Selling Price", "SKU Price", "Unit Price")
     if price_col is None:
-        for c in tt.columns:
+        for c in columns:
             if "price" in c.lower():
                 price_col = c; break
+    return {
+        "title": pick("Product Name", "Title", "Name", "Product Title"),
+        "desc": pick("Product description", "Description", "Product Description"),
+        "price": price_col,
+        "sku": pick("SKU ID", "Seller SKU", "SKU", "Merchant SKU", "Model Number"),
+        "images": [c for c in columns if str(c).lower().startswith("image") or "Main Image" in c or "Images" in c],
+        "opt1_name": pick("Variant 1 Name", "Option1 Name", "Attribute 1 Name", "Spec 1 Name"),
+        "opt1_value": pick("Variant 1 Value", "Option1 Value", "Attribute 1 Value", "Spec 1 Value"),
+        "opt2_name": pick("Variant 2 Name", "Option2 Name", "Attribute 2 Name", "Spec 2 Name"),
+        "opt2_value": pick("Variant 2 Value", "Option2 Value", "Attribute 2 Value", "Spec 2 Value"),
+        "product_id": pick("Product ID", "SPU ID", "Parent ID", "Item ID"),
+    }
 
-    sku_col = pick("SKU ID", "Seller SKU", "SKU", "Merchant SKU", "Model Number")
-    image_cols = [c for c in tt.columns if str(c).lower().startswith("image") or "Main Image" in c or "Images" in c]
-    opt1_name_col  = pick("Variant 1 Name", "Option1 Name", "Attribute 1 Name", "Spec 1 Name")
-    opt1_value_col = pick("Variant 1 Value", "Option1 Value", "Attribute 1 Value", "Spec 1 Value")
-    opt2_name_col  = pick("Variant 2 Name", "Option2 Name", "Attribute 2 Name", "Spec 2 Name")
-    opt2_value_col = pick("Variant 2 Value", "Option2 Value", "Attribute 2 Value", "Spec 2 Value")
-    product_id_col = pick("Product ID", "SPU ID", "Parent ID", "Item ID")
-
-    if product_id_col is None:
-        handle_source_col = title_col
-        tt["_product_key_"] = tt[handle_source_col].astype(str)
+def _tiktok_group_codes(tt: pd.DataFrame, cols: Dict[str, Any]):
+    """_product_key_ và mã nhóm theo đúng thứ tự groupby (sort theo key); key NaN bị groupby bỏ → -1."""
+    key_col = cols["product_id"] if cols["product_id"] is not None else cols["title"]
+    keys = tt[key_col].astype(str)
+    codes = keys.groupby(keys).ngroup().fillna(-1).to_numpy(dtype=np.int64)
+    return keys, codes
+
+def _tiktok_titles_handles(tt: pd.DataFrame, cols: Dict[str, Any], keys: pd.Series, g_first: np.ndarray):
+    """Title (chuỗi) và handle của từng nhóm, lấy theo dòng đầu nhóm g_first."""
+    g_key = keys.to_numpy(dtype=object)[g_first]
+    if cols["title"]:
+        g_title = np.array([str(v) for v in tt[cols["title"]].to_numpy(dtype=object)[g_first]], dtype=object)
     else:
-        tt["_product_key_"] = tt[product_id_col].astype(str)
-
-    rows: List[Dict[str, Any]] = []
-    for key, g in tt.groupby("_product_key_"):
-        g0 = g.iloc[0]
-        title = str(g0.get(title_col, "")) if title_col else ""
-        desc  = g0.get(desc_col, "") if desc_col else ""
-        handle = slugify(title) if title else f"tiktok-{key}"
-        vendor = vendor_text or ""
-
-        # Ảnh
-        images: List[str] = []
-        for col in image_cols:
-            vals = g[col].dropna().astype(str).unique().tolist()
-            for v in vals:
-                parts = re.split(r"[, \t\r\n]+", v.strip())
-                for pth in parts:
-                    if pth and pth.startswith("http"):
-                        images.append(pth)
-        seen = set(); uniq = []
-        for u in images:
-            if u not in seen:
-                uniq.append(u); seen.add(u)
-        images = uniq[:20]
-
-        has_var = False
-        if opt1_value_col and g[opt1_value_col].notna().any():
-            has_var = True
-        if opt2_value_col and g[opt2_value_col].notna().any():
-            has_var = True
-
-        def base_row():
-            return {
-                "Handle": handle,
-                "Vendor": vendor,
-                "Published": DEFAULT_PUBLISHED,
-                "Variant Inventory Tracker": DEFAULT_INVENTORY_TRACKER,
-                "Variant Inventory Qty": DEFAULT_INVENTORY_QTY,
-                "Variant Inventory Policy": DEFAULT_INVENTORY_POLICY,
-                "Variant Fulfillment Service": DEFAULT_FULFILLMENT_SERVICE,
-                "Variant Requires Shipping": DEFAULT_REQUIRES_SHIPPING,
-                "Variant Taxable": DEFAULT_TAXABLE,
-                "Status": DEFAULT_STATUS,
-            }
+        g_title = np.full(len(g_first), "", dtype=object)
+    g_handle = np.array([slugify(tl) if tl else f"tiktok-{k}" for tl, k in zip(g_title, g_key)], dtype=object)
+    return g_title, g_handle
 
-        if not has_var:
-            gprice = g0.get(price_col, np.nan) if price_col else np.nan
-            gsku   = g0.get(sku_col, "") if sku_col else ""
-            vprice = round(parse_price(gprice) * (1 + float(markup_pct)/100.0), 2) if pd.notna(gprice) else ""
-            vcompare = calc_compare_at(vprice, compare_at_markup_pct)
-
-            row = base_row()
-            row.update({
-                "Title": title,
-                "Body (HTML)": desc,
-                "Option1 Name": "Title",
-                "Option1 Value": "Default Title",
-                "Variant SKU": str(gsku) if pd.notna(gsku) else "",
-                "Variant Price": vprice,
-                "Variant Compare At Price": vcompare,
-            })
-            if images:
-                row["Image Src"] = images[0]; row["Image Position"] = 1
-            rows.append(row)
-            for pos, url in enumerate(images[1:], start=2):
-                rows.append({"Handle": handle, "Image Src": url, "Image Position": pos})
-        else:
-            v_index = 0
-            for _, rr in g.iterrows():
-                v1_name = rr.get(opt1_name_col, "Option1") if opt1_name_col else "Option1"
-                v1_value = rr.get(opt1_value_col, "Default")
-                v2_name = rr.get(opt2_name_col, "") if opt2_name_col else ""
-                v2_value = rr.get(opt2_value_col, "")
-                gprice = rr.get(price_col, np.nan) if price_col else np.nan
-                vsku = rr.get(sku_col, "")
-
-                vprice = round(parse_price(gprice) * (1 + float(markup_pct)/100.0), 2) if pd.notna(gprice) else ""
-                vcompare = calc_compare_at(vprice, compare_at_markup_pct)
-
-                row = base_row()
-                if v_index == 0:
-                    row.update({"Title": title, "Body (HTML)": desc})
-                    if images:
-                        row["Image Src"] = images[0]; row["Image Position"] = 1
-                row.update({
-                    "Option1 Name": str(v1_name) if pd.notna(v1_name) else "Option1",
-                    "Option1 Value": str(v1_value) if pd.notna(v1_value) else "Default",
-                    "Variant SKU": str(vsku) if pd.notna(vsku) else "",
-                    "Variant Price": vprice,
-                    "Variant Compare At Price": vcompare,
-                })
-                if pd.notna(v2_name) and str(v2_name).strip():
-                    row["Option2 Name"] = str(v2_name)
-                    row["Option2 Value"] = str(v2_value) if pd.notna(v2_value) else ""
-                rows.append(row); v_index += 1
-            for pos, url in enumerate(images[1:], start=2):
-                rows.append({"Handle": handle, "Image Src": url, "Image Position": pos})
-
-    return _finalize(rows)
+def _tiktok_row_handles(tt: pd.DataFrame, cols: Dict[str, Any]) -> np.ndarray:
+    """Handle của từng dòng TikTok (None cho dòng không thuộc nhóm nào, vd key NaN)."""
+    keys, codes = _tiktok_group_codes(tt, cols)
+    out = np.full(len(tt), None, dtype=object)
+    valid = codes >= 0
+    if not valid.any():
+        return out
+    _, g_first = np.unique(codes[valid], return_index=True)
+    g_first = np.flatnonzero(valid)[g_first]
+    _, g_handle = _tiktok_titles_handles(tt, cols, keys, g_first)
+    out[valid] = g_handle[codes[valid]]
+    return out
+
+def _tiktok_images(tt: pd.DataFrame, image_cols: List[str], codes: np.ndarray) -> pd.DataFrame:
+    """
+    Gom ảnh cho mọi product trong một lượt: (code, url, rank) — theo thứ tự cột ảnh rồi thứ tự dòng,
+    bỏ trùng, tối đa 20/product.
+    """
+    parts = []
+    for ci, col in enumerate(image_cols):
+        vals = tt[col].to_numpy(dtype=object)
+        ok = pd.notna(vals) & (codes >= 0)
+        if ok.any():
+            parts.append(pd.DataFrame({"code": codes[ok], "col": ci, "row": np.flatnonzero(ok),
+                                       "val": _text(pd.Series(vals[ok], dtype=object)).to_numpy(dtype=object)}))
+    if not parts:
+        return pd.DataFrame({"code": np.array([], dtype=np.int64), "url": np.array([], dtype=object),
+                             "rank": np.array([], dtype=np.int64)})
+    cells = pd.concat(parts, ignore_index=True)
+    cells = cells.iloc[np.lexsort((cells["row"].to_numpy(), cells["col"].to_numpy(), cells["code"].to_numpy()))]
+    cells = cells.drop_duplicates(["code", "col", "val"])
+    urls = cells["val"].str.strip().str.split(TIKTOK_URL_SPLIT, regex=True)
+    urls = pd.DataFrame({"code": cells["code"].to_numpy(), "url": urls.to_numpy()}).explode("url")
+    urls = urls[urls["url"].notna() & urls["url"].astype(str).str.startswith("http")]
+    urls = urls.drop_duplicates(["code", "url"])
+    urls["rank"] = urls.groupby("code").cumcount()
+    return urls[urls["rank"] < 20].reset_index(drop=True)
+
+def _expand_tiktok(
+    tt: pd.DataFrame,
+    cols: Dict[str, Any],
+    vendor_text: str,
+    markup_pct: float,
+    compare_at_markup_pct: float,
+    report: Optional[ConversionReport] = None,
+    as_catalog: bool = False,
+):
+    """
+    Bung TikTok (header đã strip) thành rows Shopify không cần vòng lặp groupby:
+    nhóm theo _product_key_ bằng ngroup, has_var bằng grouped any, ảnh gom một lượt, rồi qua CatalogTable.
+    report: ghi thời gian từng bước. as_catalog: trả về CatalogTable thay cho rows Shopify.
+    """
+    desc_col, price_col, sku_col = cols["desc"], cols["price"], cols["sku"]
+    opt1_name_col, opt1_value_col = cols["opt1_name"], cols["opt1_value"]
+    opt2_name_col, opt2_value_col = cols["opt2_name"], cols["opt2_value"]
+    image_cols = cols["images"]
+
+    tt = tt.reset_index(drop=True)
+    keys, codes = _tiktok_group_codes(tt, cols)
+    rows_sorted = np.argsort(np.where(codes < 0, np.iinfo(np.int64).max, codes), kind="stable")
+    rows_sorted = rows_sorted[codes[rows_sorted] >= 0]
+    if len(rows_sorted) == 0:
+        return CatalogTable.empty() if as_catalog else pd.DataFrame(columns=SHOPIFY_BASE_COLS)
+    r_code = codes[rows_sorted]
+    is_first = np.r_[True, r_code[1:] != r_code[:-1]]
+    g_first = rows_sorted[is_first]                     # g.iloc[0] của từng nhóm
+    ng = len(g_first)
+
+    # ----- Cấp product -----
+    def at(col, rows, default):
+        if col is None:
+            return np.full(len(rows), default, dtype=object)
+        return tt[col].to_numpy(dtype=object)[rows]
+
+    g_title, g_handle = _tiktok_titles_handles(tt, cols, keys, g_first)
+    g_desc = at(desc_col, g_first, "")
+    vendor = vendor_text or ""
+
+    has_var = np.zeros(ng, dtype=bool)
+    for c in (opt1_value_col, opt2_value_col):
+        if c:
+            has_var |= tt[c].notna().groupby(codes).any().reindex(range(ng), fill_value=False).to_numpy()
+    _lap(report, "groups")
+
+    # ----- Giá + compare-at cho mọi dòng một lần; ô giá gốc trống → '' -----
+    if price_col:
+        vprices = apply_markup_series(tt[price_col], markup_pct)
+        price_all = vprices.astype(object).where(tt[price_col].notna(), "").to_numpy(dtype=object)
+        compare_all = price_cells(calc_compare_at_series(vprices, compare_at_markup_pct)).to_numpy(dtype=object)
+    else:
+        price_all = compare_all = np.full(len(tt), "", dtype=object)
+    _lap(report, "price")
+
+    # ----- Dòng biến thể: cả nhóm nếu has_var, ngược lại chỉ dòng đầu -----
+    emit = has_var[r_code] | is_first
+    v_rows = rows_sorted[emit]
+    v_code = r_code[emit]
+    v_var = has_var[v_code]
+    nv = len(v_rows)
+
+    def text_or(col, default):
+        vals = at(col, v_rows, default)
+        isna = pd.isna(vals)
+        out = np.array([default if m else str(v) for v, m in zip(vals, isna)], dtype=object)
+        return out, isna
+
+    sku, _ = text_or(sku_col, "")
+    o1_name, _ = text_or(opt1_name_col, "Option1")
+    o1_value, _ = text_or(opt1_value_col, "Default")
+    o1_name = np.where(v_var, o1_name, "Title")
+    o1_value = np.where(v_var, o1_value, "Default Title")
+
+    o2_name = np.full(nv, np.nan, dtype=object)
+    o2_value = np.full(nv, np.nan, dtype=object)
+    has_o2 = np.zeros(nv, dtype=bool)
+    if opt2_name_col:
+        raw = at(opt2_name_col, v_rows, "")
+        has_o2 = v_var & np.array([pd.notna(v) and bool(str(v).strip()) for v in raw], dtype=bool)
+        o2_name[has_o2] = [str(v) for v in raw[has_o2]]
+        o2v, _ = text_or(opt2_value_col, "")
+        o2_value[has_o2] = o2v[has_o2]
+    _lap(report, "variants")
+
+    # ----- Ảnh -----
+    imgs = _tiktok_images(tt, image_cols, codes)
+    i_code = imgs["code"].to_numpy(dtype=np.int64)
+    i_url = imgs["url"].to_numpy(dtype=object)
+    i_rank = imgs["rank"].to_numpy(dtype=np.int64)
+    _lap(report, "images")
+
+    # ----- Catalog: product / biến thể / ảnh → rows Shopify -----
+    catalog = CatalogTable(
+        ng,
+        {"handle": g_handle, "title": g_title, "body": g_desc, "vendor": vendor},
+        {
+            "product": v_code,
+            "option1_name": o1_name,
+            "option1_value": o1_value,
+            "option2_name": o2_name,
+            "option2_value": o2_value,
+            "sku": sku,
+            "price": price_all[v_rows],
+            "compare_at": compare_all[v_rows],
+        },
+        {"product": i_code, "src": i_url, "position": i_rank + 1},
+    )
+    _lap(report, "catalog")
+    if as_catalog:
+        return catalog
+    out = catalog.to_shopify_rows()
+    _lap(report, "build")
+    return out
+
+def convert_tiktok_to_shopify(
+    file_like_or_path,
+    vendor_text: str = "",
+    markup_pct: float = 0.0,
+    compare_at_markup_pct: float = 0.0,
+    workers: Optional[int] = 1,
+    cache_dir: Optional[str] = None,
+    report: Optional[ConversionReport] = None,
+    progress=None,
+) -> pd.DataFrame:
+    """
+    Đọc CSV hoặc XLSX TikTok (hoặc DataFrame đã đọc, xem read_tiktok); gom ảnh; sinh rows chuẩn Shopify.
+    workers > 1 (None = số core): chia theo product cho nhiều process, kết quả giống hệt chạy tuần tự.
+    cache_dir: thư mục cache Parquet cho XLSX (xem read_tiktok).
+    report: ConversionReport được điền thời gian từng stage, số dòng, cache hit, peak RSS.
+    progress(done, total, rows): như convert_etsy_to_shopify, đơn vị là product (nhóm _product_key_).
+    """
+    if report is not None:
+        report.skip()
+    tt = read_tiktok(file_like_or_path, cache_dir=cache_dir)
+    _lap(report, "read")
+    return _convert_tiktok_frame(tt, vendor_text, markup_pct, compare_at_markup_pct, workers, report, progress)
+
+def _convert_tiktok_frame(
+    tt: pd.DataFrame,
+    vendor_text: str,
+    markup_pct: float,
+    compare_at_markup_pct: float,
+    workers: Optional[int],
+    report: Optional[ConversionReport],
+    progress=None,
+) -> pd.DataFrame:
+    """Phần sau bước đọc của convert_tiktok_to_shopify (tt: header đã strip)."""
+    cols = SCHEMAS.resolve("tiktok", list(tt.columns))
+    _lap(report, "columns")
+    expand = partial(_expand_tiktok, cols=cols, vendor_text=vendor_text, markup_pct=markup_pct,
+                     compare_at_markup_pct=compare_at_markup_pct)
+
+    # Song song / theo lô: chia theo nhóm _product_key_ liền nhau (thứ tự groupby), cả nhóm nằm trọn một phần
+    n_workers = min(_n_workers(workers), max(1, len(tt) // PARALLEL_MIN_ROWS))
+    n_parts = n_workers if progress is None else max(n_workers, -(-len(tt) // PROGRESS_BATCH_ROWS))
+    sizes = np.array([])
+    if n_parts > 1 or progress is not None:
+        _, codes = _tiktok_group_codes(tt, cols)
+        sizes = np.bincount(codes[codes >= 0])
+    if len(sizes) == 0 or n_parts <= 1:
+        n_workers = 1
+        df = expand(tt, report=report)
+        if progress is not None:
+            progress(len(sizes), len(sizes), df)
+    else:
+        bounds = _split_ranges(sizes, n_parts)
+        parts = [tt[(codes >= lo) & (codes < hi)] for lo, hi in bounds]
+        on_part = None if progress is None else (lambda i, rows: progress(int(bounds[i][1]), len(sizes), rows))
+        run = partial(expand, report=report) if n_workers <= 1 else expand
+        df = pd.concat(_run_parts(run, parts, n_workers, on_part), ignore_index=True)
+        _lap(report, "expand" if n_workers > 1 else "concat")
+    df = _finish_frame(df)
+    _lap(report, "finish")
+    if report is not None:
+        report.params.setdefault("workers", n_workers)
+        _count_output(report, len(tt), df)
+        report.finish()
+    return df
+
+def tiktok_to_catalog(
+    file_like_or_path,
+    vendor_text: str = "",
+    markup_pct: float = 0.0,
+    compare_at_markup_pct: float = 0.0,
+    workers: Optional[int] = 1,
+    cache_dir: Optional[str] = None,
+) -> CatalogTable:
+    """Như convert_tiktok_to_shopify nhưng trả về CatalogTable (để ghi JSON / Parquet, hoặc to_shopify_rows)."""
+    tt = read_tiktok(file_like_or_path, cache_dir=cache_dir)
+    cols = SCHEMAS.resolve("tiktok", list(tt.columns))
+    expand = partial(_expand_tiktok, cols=cols, vendor_text=vendor_text, markup_pct=markup_pct,
+                     compare_at_markup_pct=compare_at_markup_pct, as_catalog=True)
+    n_workers = min(_n_workers(workers), max(1, len(tt) // PARALLEL_MIN_ROWS))
+    if n_workers <= 1:
+        return expand(tt)
+    _, codes = _tiktok_group_codes(tt, cols)
+    sizes = np.bincount(codes[codes >= 0])
+    if len(sizes) == 0:
+        return expand(tt)
+    parts = [tt[(codes >= lo) & (codes < hi)] for lo, hi in _split_ranges(sizes, n_workers)]
+    return CatalogTable.concat(_run_parts(expand, parts, n_workers))
+
+# ================= Incremental: chỉ convert handle mới / thay đổi =================
+DELTA_VERSION = 1   # tăng khi logic convert đổi → lần sau mọi handle bị coi là changed
+DEFAULT_FEED = "default"
+
+class FingerprintStore:
+    """
+    SQLite lưu fingerprint từng handle của lần convert trước, tách theo feed (vd mỗi shop / nguồn một feed).
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        folder = os.path.dirname(os.path.abspath(path))
+        os.makedirs(folder, exist_ok=True)
+        self._conn = sqlite3.connect(path, timeout=30)
+        with self._conn:
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS fingerprints ("
+                "feed TEXT NOT NULL, handle TEXT NOT NULL, fingerprint TEXT NOT NULL, updated_at REAL NOT NULL, "
+                "PRIMARY KEY (feed, handle))"
+            )
+
+    def load(self, feed: str = DEFAULT_FEED) -> Dict[str, str]:
+        return dict(self._conn.execute("SELECT handle, fingerprint FROM fingerprints WHERE feed = ?", (feed,)))
+
+    def save(self, feed: str, fingerprints: Dict[str, str], removed: Iterable[str] = ()) -> None:
+        """Ghi fingerprint mới (new/changed) và xoá handle đã bị gỡ, trong một transaction."""
+        now = time.time()
+        with self._conn:
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO fingerprints (feed, handle, fingerprint, updated_at) VALUES (?, ?, ?, ?)",
+                ((feed, h, fp, now) for h, fp in fingerprints.items()),
+            )
+            self._conn.executemany("DELETE FROM fingerprints WHERE feed = ? AND handle = ?", ((feed, h) for h in removed))
+
+    def clear(self, feed: str = DEFAULT_FEED) -> None:
+        """Quên feed → lần sau convert lại toàn bộ."""
+        with self._conn:
+            self._conn.execute("DELETE FROM fingerprints WHERE feed = ?", (feed,))
+
+    def close(self) -> None:
+        self._conn.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+def _params_fingerprint(source: str, columns, params: Dict[str, Any]) -> bytes:
+    """Hash tham số convert + danh sách cột nguồn (đổi markup, vendor, bảng giá hay schema → convert lại hết)."""
+    payload = json.dumps(
+        {"version": DELTA_VERSION, "source": source, "columns": [str(c) for c in columns], "params": params},
+        sort_keys=True, ensure_ascii=False, default=str,
+    )
+    return hashlib.sha1(payload.encode("utf-8")).digest()
+
+def handle_fingerprints(src: pd.DataFrame, handles: np.ndarray, params_fp: bytes) -> Dict[str, str]:
+    """
+    Fingerprint mỗi handle = sha1(tham số + hash các dòng nguồn thuộc handle, theo thứ tự dòng).
+    handles[i] = handle của dòng i (None → dòng không sinh rows, bỏ qua).
+    """
+    valid = np.array([h is not None for h in handles], dtype=bool)
+    if not valid.any():
+        return {}
+    row_hash = pd.util.hash_pandas_object(src.astype(object), index=False).to_numpy(dtype="<u8")[valid]
+    h = handles[valid]
+    order = np.argsort(h, kind="stable")
+    h, row_hash = h[order], row_hash[order]
+    starts = np.flatnonzero(np.r_[True, h[1:] != h[:-1]])
+    ends = np.r_[starts[1:], len(h)]
+    return {h[a]: hashlib.sha1(params_fp + row_hash[a:b].tobytes()).hexdigest() for a, b in zip(starts, ends)}
+
+def diff_fingerprints(current: Dict[str, str], previous: Dict[str, str]) -> Dict[str, Any]:
+    """So với lần trước: new / changed / removed (danh sách handle), unchanged (số lượng)."""
+    new = [h for h in current if h not in previous]
+    changed = [h for h in current if h in previous and previous[h] != current[h]]
+    removed = sorted(h for h in previous if h not in current)
+    return {"new": new, "changed": changed, "removed": removed, "unchanged": len(current) - len(new) - len(changed)}
+
+def convert_incremental(
+    file_like_or_path,
+    source: str,
+    store: FingerprintStore,
+    feed: str = DEFAULT_FEED,
+    vendor_text: str = "",
+    markup_pct: float = 0.0,
+    variant_price_map: Optional[Dict[str, Any]] = None,
+    apply_markup_on_map: bool = False,
+    compare_at_markup_pct: float = 0.0,
+    workers: Optional[int] = 1,
+    cache_dir: Optional[str] = None,
+    commit: bool = True,
+    report: Optional[ConversionReport] = None,
+    progress=None,
+):
+    """
+    Chỉ convert listing Etsy / product TikTok có handle mới hoặc thay đổi so với lần trước (cùng feed trong store).
+    source = 'etsy' | 'tiktok'. Listing không đổi bị bỏ qua; rows của handle được convert giống hệt convert đầy đủ.
+    Trả (df, delta): delta = {"new", "changed", "removed", "unchanged", "fingerprints"} —
+    "removed" là handle có ở lần trước nhưng không còn trong file (Shopify CSV không xoá được, tự xử lý).
+    commit=False: chưa lưu fingerprint; gọi store.save(feed, delta["fingerprints"], delta["removed"]) sau khi import xong.
+    progress: như convert_etsy_to_shopify, chỉ tính phần cần convert.
+    """
+    if source not in ("etsy", "tiktok"):
+        raise ValueError("source phải là 'etsy' hoặc 'tiktok'")
+    if report is not None:
+        report.skip()
+    if source == "etsy":
+        src = read_etsy_csv(file_like_or_path)
+        _lap(report, "read")
+        handles = _etsy_handles(src)
+        params = dict(vendor_text=vendor_text, markup_pct=float(markup_pct), variant_price_map=variant_price_map,
+                      apply_markup_on_map=bool(apply_markup_on_map), compare_at_markup_pct=float(compare_at_markup_pct))
+    else:
+        src = read_tiktok(file_like_or_path, cache_dir=cache_dir)
+        _lap(report, "read")
+        handles = _tiktok_row_handles(src, SCHEMAS.resolve("tiktok", list(src.columns)))
+        params = dict(vendor_text=vendor_text, markup_pct=float(markup_pct),
+                      compare_at_markup_pct=float(compare_at_markup_pct))
+
+    current = handle_fingerprints(src, handles, _params_fingerprint(source, src.columns, params))
+    delta = diff_fingerprints(current, store.load(feed))
+    todo = set(delta["new"]) | set(delta["changed"])
+    delta["fingerprints"] = {h: current[h] for h in todo}
+    subset = src[pd.Series(handles, dtype=object).isin(todo).to_numpy()]   # giữ index gốc → etsy-{idx+1} không đổi
+    _lap(report, "fingerprint")
+
+    if source == "etsy":
+        df = _convert_etsy_frame(subset, vendor_text, markup_pct, variant_price_map, apply_markup_on_map,
+                                 compare_at_markup_pct, workers, report, progress)
+    else:
+        df = _convert_tiktok_frame(subset, vendor_text, markup_pct, compare_at_markup_pct, workers, report, progress)
+    if commit:
+        store.save(feed, delta["fingerprints"], delta["removed"])
+    if report is not None:
+        report.params.setdefault("feed", feed)
+        report.add(delta_new=len(delta["new"]), delta_changed=len(delta["changed"]),
+                   delta_removed=len(delta["removed"]), delta_unchanged=delta["unchanged"])
+        report.finish()
+    return df, delta
+
+# ================= Gộp nhiều file: handle không trùng giữa các file =================
+class HandleRegistry:
+    """
+    Index handle toàn cục khi gộp nhiều file vào một file import.
+    Handle đã thuộc file khác → đổi thành handle-2, handle-3, … (số nhỏ nhất chưa dùng); trong cùng một file
+    giữ nguyên như convert đơn lẻ. Kết quả chỉ phụ thuộc thứ tự đăng ký file.
+    Tra cứu / cấp suffix O(1) mỗi handle nhờ dict + bộ đếm suffix theo handle gốc, không quét lại index.
+    """
+
+    def __init__(self):
+        self._owner: Dict[str, str] = {}
+        self._next_suffix: Dict[str, int] = {}
+        self._generated = set()   # handle do registry cấp (không phải handle gốc của file nào)
+        self.renamed: Dict[str, Dict[str, str]] = {}   # owner → {handle cũ: handle mới}
+
+    def __len__(self) -> int:
+        return len(self._owner)
+
+    def __contains__(self, handle) -> bool:
+        return handle in self._owner
+
+    def _free(self, base: str) -> str:
+        n = self._next_suffix.get(base, 2)
+        while f"{base}-{n}" in self._owner:
+            n += 1
+        self._next_suffix[base] = n + 1
+        return f"{base}-{n}"
+
+    def claim(self, handles, owner: str) -> np.ndarray:
+        """Đăng ký các handle (unique, theo thứ tự xuất hiện) của owner → mảng handle cuối cùng cùng thứ tự."""
+        renamed = self.renamed.setdefault(owner, {})
+        out = np.empty(len(handles), dtype=object)
+        for i, h in enumerate(handles):
+            prev = self._owner.get(h)
+            if prev is None or (prev == owner and h not in self._generated):
+                self._owner[h] = owner
+                out[i] = h
+                continue
+            new = renamed.get(h)
+            if new is None:
+                new = renamed[h] = self._free(h)
+                self._owner[new] = owner
+                self._generated.add(new)
+            out[i] = new
+        return out
+
+    def apply(self, df: pd.DataFrame, owner: str) -> pd.DataFrame:
+        """Đổi cột Handle của rows Shopify theo registry (trả frame mới nếu có handle bị đổi)."""
+        if df.empty:
+            return df
+        codes, uniques = pd.factorize(df["Handle"], sort=False)
+        final = self.claim(uniques, owner)
+        if all(a == b for a, b in zip(uniques, final)):
+            return df
+        df = df.copy()
+        df["Handle"] = final[codes]
+        return df
+
+def dedupe_handles(frames: List[pd.DataFrame], owners: List[str],
+                   registry: Optional[HandleRegistry] = None) -> List[pd.DataFrame]:
+    """
+    Rows Shopify của nhiều file (theo thứ tự gộp) → cùng danh sách với handle trùng giữa các file đã được đổi.
+    owners: tên riêng từng file; danh sách đổi tên nằm ở registry.renamed.
+    """
+    registry = registry if registry is not None else HandleRegistry()
+    return [registry.apply(df, owner) for df, owner in zip(frames, owners)]
+
+# ================= Output gọn: dtype category / boolean, xem trước nhanh =================
+# Cột lặp nhiều (vài giá trị cho cả file) → category; cờ True/False → boolean (ô trống = <NA>);
+# cột số (giá số lẫn '', vị trí ảnh) → float. Chỉ đổi dtype: CSV ghi ra giống hệt bản object.
+LEAN_CATEGORY_COLS = [
+    "Vendor", "Option1 Name", "Option1 Value", "Option2 Name", "Option2 Value",
+    "Variant Inventory Tracker", "Variant Inventory Qty", "Variant Inventory Policy", "Variant Fulfillment Service",
+    "Status",
+]
+LEAN_BOOL_COLS = ["Published", "Variant Requires Shipping", "Variant Taxable"]
+LEAN_FLOAT_COLS = ["Variant Price", "Variant Compare At Price", "Image Position"]
+LEAN_CATEGORY_MAX_RATIO = 0.5   # số giá trị khác nhau / số dòng vượt mức này → category không lợi, giữ nguyên
+PREVIEW_SOURCE_ROWS = 200
+
+def frame_memory(df: pd.DataFrame) -> Dict[str, int]:
+    """Bộ nhớ từng cột (bytes, tính cả chuỗi Python được trỏ tới)."""
+    return {c: int(v) for c, v in df.memory_usage(index=False, deep=True).items()}
+
+def _numeric_or_blank(s: pd.Series) -> bool:
+    """Chỉ gồm số, '' và NaN (vd Variant Price: ô giá trống là '')."""
+    return all(v == "" if isinstance(v, str) else isinstance(v, (int, float, np.number)) and not isinstance(v, bool)
+               for v in s.dropna())
+
+def lean_shopify_frame(df: pd.DataFrame, report: Optional[ConversionReport] = None) -> pd.DataFrame:
+    """
+    Rows Shopify → cùng dữ liệu với dtype gọn (LEAN_*_COLS), không sửa df gốc.
+    report: thêm stage 'lean' và report.memory = bộ nhớ từng cột trước / sau.
+    """
+    if report is not None:
+        report.skip()
+    before = frame_memory(df) if report is not None else {}
+    out = df.copy(deep=False)
+    for c in out.columns:
+        s = out[c]
+        if isinstance(s.dtype, pd.CategoricalDtype) or s.empty:
+            continue
+        kind = pd.api.types.infer_dtype(s, skipna=True)
+        if c in LEAN_BOOL_COLS and kind == "boolean":
+            out[c] = s.astype("boolean")
+        elif c in LEAN_FLOAT_COLS and kind in ("integer", "floating", "mixed-integer-float"):
+            out[c] = s.astype("float64")
+        elif c in LEAN_FLOAT_COLS and kind == "mixed" and _numeric_or_blank(s):
+            out[c] = pd.to_numeric(s.where(s.map(type) != str), errors="coerce").astype("float64")   # '' → NaN
+        elif c in LEAN_CATEGORY_COLS + LEAN_BOOL_COLS + LEAN_FLOAT_COLS and kind in ("string", "empty") \
+                and s.nunique(dropna=True) <= len(s) * LEAN_CATEGORY_MAX_RATIO:
+            out[c] = s.astype("category")
+    if report is not None:
+        after = frame_memory(out)
+        report.memory = {
+            "before_bytes": sum(before.values()),
+            "after_bytes": sum(after.values()),
+            "columns": {c: {"dtype": str(out[c].dtype), "before": before[c], "after": after[c]} for c in out.columns},
+        }
+        report.lap("lean")
+        report.finish()
+    return out
+
+def preview_shopify(file_like_or_path, source: str, n_rows: int = PREVIEW_SOURCE_ROWS, **params) -> pd.DataFrame:
+    """
+    Rows Shopify của n_rows dòng nguồn đầu tiên, chỉ đọc phần đầu file (CSV: một chunk, XLSX: n_rows dòng)
+    → hiện được preview trước khi convert cả file xong.
+    Etsy: khớp phần đầu kết quả đầy đủ. TikTok: product còn dòng nằm sau n_rows có thể thiếu biến thể.
+    params: như convert_etsy_to_shopify / convert_tiktok_to_shopify.
+    """
+    if source == "etsy":
+        chunks = iter_etsy_csv(file_like_or_path, n_rows)
+        etsy = next(chunks, None)
+        chunks.close()
+        _rewind(file_like_or_path)
+        if etsy is None:
+            return pd.DataFrame(columns=SHOPIFY_BASE_COLS)
+        return convert_etsy_to_shopify(etsy, **params)
+    tt = read_tiktok(file_like_or_path, nrows=n_rows)
+    _rewind(file_like_or_path)
+    return convert_tiktok_to_shopify(tt, **params)
@@ -0,0 +1,351 @@
+# images.py — kiểm tra & dedupe Image Src sau khi convert (asyncio HEAD, pool kết nối theo host, cache SQLite có TTL)
+import asyncio
+import math
+import os
+import socket
+import sqlite3
+import ssl
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Dict, Any, Optional, Iterable
+from urllib.parse import quote, urljoin, urlsplit, urlunsplit
+
+import numpy as np
+import pandas as pd
+
+IMAGE_CHECK_CONCURRENCY = 64    # tổng số request đồng thời
+IMAGE_CHECK_PER_HOST = 6        # số kết nối tối đa mỗi host (CDN hay chặn khi mở quá nhiều)
+IMAGE_CHECK_TIMEOUT = 10.0      # giây cho mỗi lần kết nối + đọc header
+IMAGE_CHECK_RETRIES = 1         # thử lại khi lỗi mạng / timeout (không thử lại khi server trả mã lỗi)
+IMAGE_CHECK_MAX_REDIRECTS = 5
+IMAGE_DNS_WORKERS = 8           # thread phân giải DNS (mỗi host chỉ phân giải một lần mỗi lượt kiểm tra)
+IMAGE_CACHE_TTL = 7 * 24 * 3600
+IMAGE_CHECK_USER_AGENT = "shopify-converter-image-check/1.0"
+IMAGE_CACHE_DB = os.path.join(os.path.expanduser("~"), ".shopify_converter", "image_checks.sqlite")
+
+REDIRECT_CODES = {301, 302, 303, 307, 308}
+HEAD_UNSUPPORTED = {403, 405, 501}   # vài CDN không cho HEAD → thử GET 1 byte
+URL_PATH_SAFE = "/%:@!$&'()*+,;=-._~"
+URL_QUERY_SAFE = URL_PATH_SAFE + "?"
+
+
+# ================= Chuẩn hoá URL =================
+def normalize_image_url(url) -> str:
+    """
+    Chuẩn hoá để so trùng: strip, '//host' → https, scheme/host chữ thường, bỏ port mặc định và #fragment,
+    encode ký tự đặc biệt trong path/query (ký tự đã encode giữ nguyên). Không phải http(s) → chỉ strip.
+    """
+    if url is None or (isinstance(url, float) and math.isnan(url)):
+        return ""
+    s = str(url).strip()
+    if s.startswith("//"):
+        s = "https:" + s
+    try:
+        parts = urlsplit(s)
+        port = parts.port
+    except ValueError:
+        return s
+    scheme = parts.scheme.lower()
+    if scheme not in ("http", "https") or not parts.hostname:
+        return s
+    host = parts.hostname.lower()
+    if ":" in host:
+        host = f"[{host}]"
+    if port and port != (443 if scheme == "https" else 80):
+        host = f"{host}:{port}"
+    if parts.username:
+        host = f"{parts.username}{':' + parts.password if parts.password else ''}@{host}"
+    path = quote(parts.path or "/", safe=URL_PATH_SAFE)
+    query = quote(parts.query, safe=URL_QUERY_SAFE)
+    return urlunsplit((scheme, host, path, query, ""))
+
+
+# ================= Cache kết quả kiểm tra =================
+class ImageCheckCache:
+    """
+    SQLite lưu kết quả kiểm tra từng URL (đã chuẩn hoá). Kết quả quá ttl giây coi như chưa kiểm tra.
+    Lỗi mạng (không có mã HTTP) không được lưu → lần sau kiểm tra lại.
+    """
+
+    def __init__(self, path: str = IMAGE_CACHE_DB, ttl: float = IMAGE_CACHE_TTL):
+        self.path = path
+        self.ttl = ttl
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self._conn = sqlite3.connect(path, timeout=30)
+        with self._conn:
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS image_checks ("
+                "url TEXT PRIMARY KEY, ok INTEGER NOT NULL, status INTEGER, content_type TEXT, checked_at REAL NOT NULL)"
+            )
+
+    def get_many(self, urls: Iterable[str]) -> Dict[str, Dict[str, Any]]:
+        urls = list(urls)
+        fresh_after = time.time() - self.ttl
+        out = {}
+        for a in range(0, len(urls), 500):   # giới hạn số tham số của SQLite
+            batch = urls[a:a + 500]
+            rows = self._conn.execute(
+                f"SELECT url, ok, status, content_type FROM image_checks "
+                f"WHERE checked_at >= ? AND url IN ({','.join('?' * len(batch))})",
+                [fresh_after] + batch,
+            )
+            for url, ok, status, ctype in rows:
+                out[url] = {"ok": bool(ok), "status": status, "content_type": ctype or "", "error": ""}
+        return out
+
+    def put_many(self, results: Dict[str, Dict[str, Any]]) -> None:
+        now = time.time()
+        with self._conn:
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO image_checks (url, ok, status, content_type, checked_at) VALUES (?, ?, ?, ?, ?)",
+                ((u, int(r["ok"]), r["status"], r.get("content_type", ""), now)
+                 for u, r in results.items() if r.get("status") is not None),
+            )
+
+    def purge(self) -> int:
+        """Xoá kết quả đã hết hạn → số dòng đã xoá."""
+        with self._conn:
+            return self._conn.execute("DELETE FROM image_checks WHERE checked_at < ?",
+                                      (time.time() - self.ttl,)).rowcount
+
+    def close(self) -> None:
+        self._conn.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+# ================= HTTP HEAD bất đồng bộ, giữ kết nối theo host =================
+class _HostPool:
+    """
+    Kết nối keep-alive tới một (scheme, host, port), tối đa limit request cùng lúc.
+    DNS phân giải một lần; host không phân giải / không kết nối được → mọi URL còn lại của host lỗi ngay.
+    """
+
+    def __init__(self, scheme: str, host: str, port: int, limit: int, ssl_ctx):
+        self.scheme, self.host, self.port = scheme, host, port
+        self.sem = asyncio.Semaphore(limit)
+        self.idle: List[tuple] = []
+        self.ssl_ctx = ssl_ctx if scheme == "https" else None
+        self.addr: Optional[str] = None
+        self.dead: Optional[BaseException] = None
+        self._resolve_lock = asyncio.Lock()
+
+    async def _address(self, timeout: float) -> str:
+        async with self._resolve_lock:
+            if self.addr is None and self.dead is None:
+                try:
+                    infos = await asyncio.wait_for(asyncio.get_running_loop().getaddrinfo(
+                        self.host, self.port, type=socket.SOCK_STREAM), timeout)
+                    self.addr = infos[0][4][0]
+                except (OSError, asyncio.TimeoutError) as e:
+                    self.dead = e
+        if self.dead is not None:
+            raise self.dead
+        return self.addr
+
+    async def _connect(self, timeout: float):
+        addr = await self._address(timeout)
+        try:
+            return await asyncio.wait_for(asyncio.open_connection(
+                addr, self.port, ssl=self.ssl_ctx, server_hostname=self.host if self.ssl_ctx else None), timeout)
+        except ConnectionRefusedError as e:
+            self.dead = e
+            raise
+
+    def _host_header(self) -> str:
+        default = 443 if self.scheme == "https" else 80
+        host = f"[{self.host}]" if ":" in self.host else self.host
+        return host if self.port == default else f"{host}:{self.port}"
+
+    async def request(self, method: str, target: str, timeout: float) -> tuple:
+        """→ (status, headers chữ thường). HEAD dùng lại kết nối; GET (1 byte) đóng kết nối sau khi đọc header."""
+        extra = "Range: bytes=0-0\r\nConnection: close\r\n" if method == "GET" else "Connection: keep-alive\r\n"
+        payload = (f"{method} {target} HTTP/1.1\r\nHost: {self._host_header()}\r\n"
+                   f"User-Agent: {IMAGE_CHECK_USER_AGENT}\r\nAccept: image/*,*/*;q=0.8\r\n{extra}\r\n").encode("latin-1")
+        async with self.sem:
+            while True:
+                reused = bool(self.idle)
+                reader, writer = self.idle.pop() if reused else await self._connect(timeout)
+                try:
+                    writer.write(payload)
+                    await writer.drain()
+                    head = await asyncio.wait_for(reader.readuntil(b"\r\n\r\n"), timeout)
+                except (ConnectionError, asyncio.IncompleteReadError) as e:
+                    writer.close()
+                    if reused:      # server đã đóng kết nối rảnh → mở kết nối mới, không tính là lỗi
+                        continue
+                    raise ConnectionError(str(e) or type(e).__name__)
+                except BaseException:
+                    writer.close()
+                    raise
+                break
+        lines = head.decode("latin-1").split("\r\n")
+        version, status = lines[0].split(" ", 2)[:2]
+        headers = {}
+        for line in lines[1:]:
+            if ":" in line:
+                k, v = line.split(":", 1)
+                headers[k.strip().lower()] = v.strip()
+        conn = headers.get("connection", "").lower()
+        keep = method == "HEAD" and conn != "close" and (version != "HTTP/1.0" or conn == "keep-alive")
+        if keep:
+            self.idle.append((reader, writer))
+        else:
+            writer.close()
+        return int(status), headers
+
+    def close(self) -> None:
+        for _, writer in self.idle:
+            writer.close()
+        self.idle.clear()
+
+
+class ImageChecker:
+    """Kiểm tra nhiều URL đồng thời: HEAD (GET 1 byte nếu server không cho HEAD), theo redirect, giới hạn theo host."""
+
+    def __init__(self, concurrency: int = IMAGE_CHECK_CONCURRENCY, per_host: int = IMAGE_CHECK_PER_HOST,
+                 timeout: float = IMAGE_CHECK_TIMEOUT, retries: int = IMAGE_CHECK_RETRIES,
+                 ssl_context: Optional[ssl.SSLContext] = None):
+        self.concurrency = concurrency
+        self.per_host = per_host
+        self.timeout = timeout
+        self.retries = retries
+        self.ssl_context = ssl_context
+        self._pools: Dict[tuple, _HostPool] = {}
+
+    def _pool(self, parts) -> _HostPool:
+        scheme = parts.scheme.lower()
+        key = (scheme, parts.hostname, parts.port or (443 if scheme == "https" else 80))
+        if key not in self._pools:
+            ctx = self.ssl_context or ssl.create_default_context()
+            self._pools[key] = _HostPool(key[0], key[1], key[2], self.per_host, ctx)
+        return self._pools[key]
+
+    async def _check_once(self, url: str) -> Dict[str, Any]:
+        for _ in range(IMAGE_CHECK_MAX_REDIRECTS + 1):
+            parts = urlsplit(url)
+            if parts.scheme.lower() not in ("http", "https") or not parts.hostname:
+                return {"ok": False, "status": None, "content_type": "", "error": "URL không hợp lệ"}
+            target = (parts.path or "/") + (f"?{parts.query}" if parts.query else "")
+            pool = self._pool(parts)
+            status, headers = await pool.request("HEAD", target, self.timeout)
+            if status in HEAD_UNSUPPORTED:
+                status, headers = await pool.request("GET", target, self.timeout)
+            if status in REDIRECT_CODES and headers.get("location"):
+                url = urljoin(url, headers["location"])
+                continue
+            return {"ok": 200 <= status < 300, "status": status,
+                    "content_type": headers.get("content-type", ""), "error": ""}
+        return {"ok": False, "status": status, "content_type": "", "error": "quá nhiều redirect"}
+
+    async def _check(self, url: str, gate: asyncio.Semaphore) -> Dict[str, Any]:
+        async with gate:
+            for attempt in range(self.retries + 1):
+                try:
+                    return await self._check_once(url)
+                except (OSError, asyncio.TimeoutError, ValueError, ssl.SSLError) as e:
+                    error = f"{type(e).__name__}: {e}".rstrip(": ")
+        return {"ok": False, "status": None, "content_type": "", "error": error}
+
+    async def check_many(self, urls: List[str]) -> Dict[str, Dict[str, Any]]:
+        gate = asyncio.Semaphore(self.concurrency)
+        try:
+            results = await asyncio.gather(*(self._check(u, gate) for u in urls))
+        finally:
+            for pool in self._pools.values():
+                pool.close()
+            self._pools.clear()
+        return dict(zip(urls, results))
+
+
+def _run(coro):
+    """Như asyncio.run nhưng không chờ các lệnh DNS bị timeout còn treo trong thread khi kết thúc."""
+    loop = asyncio.new_event_loop()
+    executor = ThreadPoolExecutor(max_workers=IMAGE_DNS_WORKERS, thread_name_prefix="image-dns")
+    loop.set_default_executor(executor)
+    try:
+        return loop.run_until_complete(coro)
+    finally:
+        executor.shutdown(wait=False, cancel_futures=True)
+        loop.close()
+
+
+def check_image_urls(urls: Iterable[str], cache: Optional[ImageCheckCache] = None, **checker_kwargs) -> Dict[str, Dict[str, Any]]:
+    """
+    URL (đã chuẩn hoá, không trùng) → {url: {"ok", "status", "content_type", "error", "cached"}}.
+    URL có trong cache còn hạn không bị kiểm tra lại. Chạy event loop riêng (gọi từ thread nào cũng được).
+    """
+    urls = list(dict.fromkeys(u for u in urls if u))
+    known = cache.get_many(urls) if cache is not None else {}
+    todo = [u for u in urls if u not in known]
+    fresh = _run(ImageChecker(**checker_kwargs).check_many(todo)) if todo else {}
+    if cache is not None and fresh:
+        cache.put_many(fresh)
+    return {u: {**known[u], "cached": True} if u in known else {**fresh[u], "cached": False} for u in urls}
+
+
+# ================= Stage sau convert: chuẩn hoá / dedupe / kiểm tra Image Src =================
+def check_shopify_images(df: pd.DataFrame, cache: Optional[ImageCheckCache] = None, probe: bool = True,
+                         drop_broken: bool = False, report=None, **checker_kwargs):
+    """
+    Rows Shopify → (rows mới, tóm tắt). Image Src được chuẩn hoá; ảnh trùng trong cùng handle bị bỏ
+    (dòng ảnh phụ bị xoá, dòng biến thể chỉ để trống ô ảnh) và Image Position của handle đó được đánh lại.
+    probe: kiểm tra URL (mỗi URL một lần dù dùng ở nhiều handle); drop_broken: bỏ luôn ảnh lỗi.
+    Tóm tắt: {"images", "unique", "duplicates", "checked", "cached", "broken": {url: mã HTTP / lỗi}}.
+    report: ConversionReport — thêm stage 'images' và các số đếm images_*.
+    """
+    summary = {"images": 0, "unique": 0, "duplicates": 0, "checked": 0, "cached": 0, "broken": {}}
+    if df.empty or "Image Src" not in df.columns:
+        return df, summary
+    if report is not None:
+        report.skip()
+    raw = df["Image Src"].to_numpy(dtype=object)
+    has = np.array([isinstance(v, str) and v.strip() != "" for v in raw], dtype=bool)
+    norm = raw.copy()
+    norm[has] = [normalize_image_url(v) for v in raw[has]]
+    pos = np.flatnonzero(has)
+    summary["images"] = len(pos)
+    dup = pd.DataFrame({"h": df["Handle"].to_numpy(dtype=object)[pos], "u": norm[pos]}).duplicated().to_numpy()
+    summary["duplicates"] = int(dup.sum())
+    remove = np.zeros(len(df), dtype=bool)
+    remove[pos[dup]] = True
+
+    unique_urls = list(dict.fromkeys(norm[pos]))
+    summary["unique"] = len(unique_urls)
+    if probe and unique_urls:
+        results = check_image_urls(unique_urls, cache=cache, **checker_kwargs)
+        summary["checked"] = sum(not r["cached"] for r in results.values())
+        summary["cached"] = sum(r["cached"] for r in results.values())
+        summary["broken"] = {u: r["status"] or r["error"] for u, r in results.items() if not r["ok"]}
+        if drop_broken and summary["broken"]:
+            broken = pd.Series(norm[pos], dtype=object).isin(list(summary["broken"])).to_numpy()
+            remove[pos[broken]] = True
+
+    out = df.copy()
+    src = norm
+    changed_handles = set(out["Handle"].to_numpy(dtype=object)[remove])
+    if remove.any():
+        image_only = out["Status"].isna().to_numpy() if "Status" in out.columns else np.zeros(len(out), dtype=bool)
+        src = src.copy()
+        src[remove] = np.nan
+        pos_col = out["Image Position"].to_numpy(dtype=float).copy()
+        pos_col[remove] = np.nan
+        # đánh lại Image Position 1..k cho các handle có ảnh bị bỏ
+        handles = out["Handle"].to_numpy(dtype=object)
+        redo = pd.Series(handles, dtype=object).isin(list(changed_handles)).to_numpy() & has & ~remove
+        if redo.any():
+            pos_col[redo] = pd.Series(handles[redo], dtype=object).groupby(handles[redo], sort=False).cumcount().to_numpy() + 1
+        out["Image Src"] = src
+        out["Image Position"] = pos_col
+        out = out[~(remove & image_only)].reset_index(drop=True)
+    else:
+        out["Image Src"] = src
+    if report is not None:
+        report.lap("images")
+        report.add(images=summary["images"], images_unique=summary["unique"],
+                   images_duplicates=summary["duplicates"], images_broken=len(summary["broken"]))
+    return out, summary
@@ -0,0 +1,134 @@
+# jobs.py — chạy convert nền (thread) cho app: tiến độ, huỷ, preview từng phần
+import shutil
+import tempfile
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Dict, Any, Optional
+
+import pandas as pd
+
+from converter import ConversionCancelled
+
+JOB_WORKERS = 2           # số job chạy cùng lúc (mỗi job vẫn có thể tự dùng process pool qua workers=)
+JOB_TTL_SECONDS = 3600    # job đã xong quá lâu → dọn, kể cả thư mục output tạm
+PREVIEW_ROWS = 200
+
+
+class ConversionJob:
+    """
+    Một lần convert chạy nền. fn(progress=..., preview=..., workdir=...) làm toàn bộ việc (đọc, convert,
+    ghi output vào workdir) và truyền progress xuống converter: progress(done, total, rows) — xem convert_etsy_to_shopify.
+    preview(rows): preview tạm trước lô đầu (vd preview_shopify), rows của lô đầu thật sẽ thay thế.
+    status: pending → running → done | error | cancelled.
+    """
+
+    def __init__(self, fn, label: str = ""):
+        self.id = uuid.uuid4().hex
+        self.label = label
+        self.status = "pending"
+        self.done = 0
+        self.total = 0
+        self.result: Any = None
+        self.error: Optional[BaseException] = None
+        self.created = time.time()
+        self.finished: Optional[float] = None
+        self.workdir = tempfile.mkdtemp(prefix="shopify_job_")
+        self._fn = fn
+        self._cancel = threading.Event()
+        self._lock = threading.Lock()
+        self._preview: List[pd.DataFrame] = []
+        self._preview_rows = 0
+        self._early = False     # preview hiện tại là preview tạm (chưa có lô thật nào)
+
+    def _progress(self, done: int, total: int, rows: Optional[pd.DataFrame] = None) -> None:
+        if self._cancel.is_set():
+            raise ConversionCancelled()
+        with self._lock:
+            self.done, self.total = int(done), int(total)
+            if rows is not None and len(rows) and self._early:
+                self._preview, self._preview_rows, self._early = [], 0, False
+            if rows is not None and len(rows) and self._preview_rows < PREVIEW_ROWS:
+                head = rows.iloc[:PREVIEW_ROWS - self._preview_rows]
+                self._preview.append(head)
+                self._preview_rows += len(head)
+
+    def _early_preview(self, rows: pd.DataFrame) -> None:
+        with self._lock:
+            if not self._preview and len(rows):
+                self._preview = [rows.iloc[:PREVIEW_ROWS]]
+                self._preview_rows = len(self._preview[0])
+                self._early = True
+
+    def run(self) -> None:
+        if self._cancel.is_set():
+            self.status = "cancelled"
+            self.finished = time.time()
+            return
+        self.status = "running"
+        try:
+            self.result = self._fn(progress=self._progress, preview=self._early_preview, workdir=self.workdir)
+            self.status = "done"
+        except ConversionCancelled:
+            self.status = "cancelled"
+        except Exception as e:
+            self.error = e
+            self.status = "error"
+        finally:
+            self.finished = time.time()
+
+    def cancel(self) -> None:
+        """Dừng ở lần báo tiến độ kế tiếp (giữa hai lô); job chưa chạy thì bỏ luôn."""
+        self._cancel.set()
+
+    @property
+    def running(self) -> bool:
+        return self.status in ("pending", "running")
+
+    @property
+    def fraction(self) -> float:
+        return min(1.0, self.done / self.total) if self.total else 0.0
+
+    def preview(self) -> pd.DataFrame:
+        """Rows Shopify đầu tiên đã sinh ra (tối đa PREVIEW_ROWS) trong lúc job đang chạy."""
+        with self._lock:
+            parts = list(self._preview)
+        return pd.concat(parts, ignore_index=True) if parts else pd.DataFrame()
+
+    def elapsed(self) -> float:
+        return (self.finished or time.time()) - self.created
+
+    def cleanup(self) -> None:
+        shutil.rmtree(self.workdir, ignore_errors=True)
+
+
+class JobManager:
+    """Giữ các job theo id, chạy trên thread pool; job xong quá JOB_TTL_SECONDS bị dọn khi submit job mới."""
+
+    def __init__(self, max_workers: int = JOB_WORKERS, ttl: float = JOB_TTL_SECONDS):
+        self._pool = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="convert-job")
+        self._jobs: Dict[str, ConversionJob] = {}
+        self._lock = threading.Lock()
+        self.ttl = ttl
+
+    def submit(self, fn, label: str = "") -> ConversionJob:
+        self.prune()
+        job = ConversionJob(fn, label)
+        with self._lock:
+            self._jobs[job.id] = job
+        self._pool.submit(job.run)
+        return job
+
+    def get(self, job_id: Optional[str]) -> Optional[ConversionJob]:
+        with self._lock:
+            return self._jobs.get(job_id) if job_id else None
+
+    def prune(self) -> None:
+        now = time.time()
+        with self._lock:
+            old = [j for j in self._jobs.values() if j.finished and now - j.finished > self.ttl]
+            for job in old:
+                del self._jobs[job.id]
+        for job in old:
+            job.cleanup()
@@ -0,0 +1,404 @@
+# shopify_push.py — đẩy thẳng rows Shopify lên Admin API (REST) thay cho upload CSV: theo lô, đồng thời,
+# giới hạn tốc độ kiểu leaky bucket, thử lại có backoff, checkpoint để chạy tiếp sau khi dừng giữa chừng
+import hashlib
+import json
+import math
+import os
+import random
+import threading
+import time
+import urllib.error
+import urllib.parse
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Dict, Any, Optional
+
+import numpy as np
+import pandas as pd
+
+SHOPIFY_API_VERSION = "2024-07"
+PUSH_CONCURRENCY = 4         # số request đồng thời (bucket mới là thứ giới hạn tốc độ thật)
+PUSH_BATCH_SIZE = 50         # số product mỗi lô: xong lô mới báo tiến độ (điểm dừng khi huỷ)
+PUSH_BUCKET_SIZE = 40        # bucket REST chuẩn của Shopify: 40 request, rò 2 request/giây
+PUSH_LEAK_RATE = 2.0
+PUSH_RETRIES = 4             # thử lại khi 429 / 5xx / lỗi mạng (xem _call, _create); 4xx khác (vd 422) là lỗi dữ liệu → không thử lại
+PUSH_BACKOFF = 1.0           # giây, nhân đôi mỗi lần thử lại (+ jitter), tối đa PUSH_BACKOFF_MAX
+PUSH_BACKOFF_MAX = 30.0
+PUSH_TIMEOUT = 30.0
+PUSH_USER_AGENT = "shopify-converter-push/1.0"
+CALL_LIMIT_HEADER = "X-Shopify-Shop-Api-Call-Limit"   # vd "32/40": mức bucket phía server
+
+RETRY_CODES = {429}                     # server chưa xử lý request → gửi lại ngay
+UNSURE_CODES = {500, 502, 503, 504}     # có thể đã xử lý rồi mới lỗi → POST tạo: tra theo handle rồi mới gửi lại
+
+
+class PushError(Exception):
+    """Request lỗi sau khi đã hết số lần thử lại (hoặc lỗi không đáng thử lại)."""
+
+    def __init__(self, message: str, status: Optional[int] = None):
+        super().__init__(message)
+        self.status = status
+
+
+# ================= Rows Shopify → payload product =================
+def _cell(v) -> Optional[str]:
+    """NaN / '' → None, còn lại chuỗi đã strip."""
+    if v is None or (isinstance(v, float) and math.isnan(v)):
+        return None
+    s = str(v).strip()
+    return s or None
+
+def _flag(v, default: bool) -> bool:
+    if isinstance(v, (bool, np.bool_)):
+        return bool(v)
+    s = _cell(v)
+    return default if s is None else s.lower() in ("true", "1", "yes")
+
+def shopify_products(df: pd.DataFrame) -> List[Dict[str, Any]]:
+    """
+    Gom rows Shopify (output của convert_*_to_shopify) theo Handle thành payload POST /products.json,
+    giữ thứ tự handle xuất hiện. Dòng có Option1 Value là biến thể, dòng có Image Src là ảnh (kể cả dòng biến thể đầu).
+    """
+    if df.empty:
+        return []
+    cols = {c: df[c].to_numpy(dtype=object) for c in df.columns}
+    codes, handles = pd.factorize(df["Handle"].astype(str), sort=False)
+    order = np.argsort(codes, kind="stable")
+    bounds = np.searchsorted(codes[order], np.arange(len(handles) + 1))
+    out = []
+    for k, handle in enumerate(handles):
+        rows = order[bounds[k]:bounds[k + 1]]
+        first = rows[0]
+        product: Dict[str, Any] = {
+            "handle": handle,
+            "title": _cell(cols["Title"][first]) or handle,
+            "body_html": _cell(cols["Body (HTML)"][first]) or "",
+            "vendor": _cell(cols["Vendor"][first]) or "",
+            "status": _cell(cols["Status"][first]) or "draft",
+            "published": _flag(cols["Published"][first], False),
+        }
+        variants, images = [], []
+        opt_names = [_cell(cols["Option1 Name"][first]), None]
+        for i in rows:
+            src = _cell(cols["Image Src"][i])
+            if src:
+                pos = _cell(cols["Image Position"][i])
+                images.append({"src": src, "position": int(float(pos)) if pos else len(images) + 1})
+            if _cell(cols["Option1 Value"][i]) is None:
+                continue
+            v = {
+                "option1": _cell(cols["Option1 Value"][i]),
+                "sku": _cell(cols["Variant SKU"][i]) or "",
+                "inventory_management": _cell(cols["Variant Inventory Tracker"][i]),
+                "inventory_policy": _cell(cols["Variant Inventory Policy"][i]) or "deny",
+                "fulfillment_service": _cell(cols["Variant Fulfillment Service"][i]) or "manual",
+                "requires_shipping": _flag(cols["Variant Requires Shipping"][i], True),
+                "taxable": _flag(cols["Variant Taxable"][i], True),
+            }
+            if _cell(cols["Option2 Name"][i]):
+                opt_names[1] = opt_names[1] or _cell(cols["Option2 Name"][i])
+                v["option2"] = _cell(cols["Option2 Value"][i]) or ""
+            for key, col in (("price", "Variant Price"), ("compare_at_price", "Variant Compare At Price")):
+                if _cell(cols[col][i]):
+                    v[key] = _cell(cols[col][i])
+            variants.append(v)
+        product["options"] = [{"name": n} for n in opt_names if n]
+        product["variants"] = variants
+        product["images"] = images
+        out.append({"product": product})
+    return out
+
+
+# ================= Giới hạn tốc độ =================
+class LeakyBucket:
+    """
+    Bucket phía client mô phỏng bucket của Shopify: mỗi request thêm 1, rò leak_rate/giây;
+    acquire() chờ tới khi còn chỗ. sync() căn lại theo header call-limit server trả về, throttle() khi bị 429.
+    Dùng chung giữa các thread.
+    """
+
+    def __init__(self, capacity: float = PUSH_BUCKET_SIZE, leak_rate: float = PUSH_LEAK_RATE):
+        self.capacity = float(capacity)
+        self.leak_rate = float(leak_rate)
+        self.level = 0.0
+        self.waited = 0.0
+        self._last = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _leak(self, now: float) -> None:
+        self.level = max(0.0, self.level - (now - self._last) * self.leak_rate)
+        self._last = now
+
+    def acquire(self) -> None:
+        while True:
+            with self._lock:
+                self._leak(time.monotonic())
+                if self.level + 1 <= self.capacity:
+                    self.level += 1
+                    return
+                wait = (self.level + 1 - self.capacity) / self.leak_rate
+                self.waited += wait
+            time.sleep(wait)
+
+    def sync(self, header: Optional[str]) -> None:
+        """header 'used/cap' → level không thấp hơn mức server báo."""
+        try:
+            used, cap = (float(x) for x in str(header).split("/"))
+        except (TypeError, ValueError):
+            return
+        with self._lock:
+            self._leak(time.monotonic())
+            self.capacity = cap
+            self.level = max(self.level, used)
+
+    def throttle(self) -> None:
+        with self._lock:
+            self._leak(time.monotonic())
+            self.level = self.capacity
+
+
+# ================= Checkpoint =================
+def payload_digest(payload: Dict[str, Any]) -> str:
+    """Chữ ký nội dung payload: product đổi (giá, ảnh, biến thể...) → chữ ký khác → đẩy lại."""
+    return hashlib.sha1(json.dumps(payload, sort_keys=True, ensure_ascii=False).encode("utf-8")).hexdigest()
+
+
+class PushCheckpoint:
+    """
+    File JSON lines ghi product đã đẩy xong: shop, handle, id product Shopify, chữ ký payload.
+    Chạy lại với cùng file → chỉ bỏ qua handle đã đẩy lên đúng shop đó với đúng payload đó; shop khác hoặc
+    product đã đổi thì đẩy lại (id đã biết → cập nhật thay vì tạo mới).
+    shop: để trống thì ShopifyPusher.push điền shop của nó. Chỉ append, ghi ngay khi từng product xong
+    → dừng giữa chừng (kể cả kill) không tạo trùng khi chạy lại.
+    """
+
+    def __init__(self, path: Optional[str], shop: str = ""):
+        self.path = path
+        self.shop = shop
+        self._records: Dict[tuple, Dict[str, Any]] = {}   # (shop, handle) → {"id", "digest"}
+        self._lock = threading.Lock()
+        if path and os.path.exists(path):
+            with open(path, encoding="utf-8") as f:
+                for line in f:
+                    line = line.strip()
+                    if line:
+                        rec = json.loads(line)
+                        self._records[(rec.get("shop", ""), rec["handle"])] = {"id": rec.get("id"),
+                                                                               "digest": rec.get("digest")}
+
+    @property
+    def done(self) -> Dict[str, Dict[str, Any]]:
+        """handle → {"id", "digest"} đã đẩy lên shop hiện tại."""
+        return {h: rec for (shop, h), rec in self._records.items() if shop == self.shop}
+
+    def __contains__(self, handle: str) -> bool:
+        return (self.shop, handle) in self._records
+
+    def __len__(self) -> int:
+        return len(self.done)
+
+    def is_current(self, handle: str, digest: str) -> bool:
+        """Handle đã đẩy lên shop này với đúng payload này."""
+        rec = self._records.get((self.shop, handle))
+        return rec is not None and rec["digest"] == digest
+
+    def product_id(self, handle: str) -> Any:
+        return (self._records.get((self.shop, handle)) or {}).get("id")
+
+    def add(self, handle: str, product_id: Any = None, digest: Optional[str] = None) -> None:
+        with self._lock:
+            self._records[(self.shop, handle)] = {"id": product_id, "digest": digest}
+            if not self.path:
+                return
+            os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+            with open(self.path, "a", encoding="utf-8") as f:
+                rec = {"shop": self.shop, "handle": handle, "id": product_id, "digest": digest}
+                f.write(json.dumps(rec, ensure_ascii=False) + "\n")
+
+
+# ================= Đẩy lên Admin API =================
+class ShopifyPusher:
+    """
+    Đẩy từng product lên {base_url}/admin/api/{api_version} (header X-Shopify-Access-Token): product chưa có trên
+    shop → POST products.json; đã có (id trong checkpoint, hoặc tra được theo handle) → PUT products/{id}.json.
+    Đẩy lại cùng dữ liệu hay đẩy delta incremental vì vậy không tạo product trùng (Shopify tự thêm hậu tố cho
+    handle trùng). base_url cấu hình được (vd http://127.0.0.1:8000 cho mock server khi test).
+    push() chạy theo lô PUSH_BATCH_SIZE trên thread pool; mọi thread dùng chung một LeakyBucket.
+    """
+
+    def __init__(self, base_url: str, token: str, api_version: str = SHOPIFY_API_VERSION,
+                 concurrency: int = PUSH_CONCURRENCY, batch_size: int = PUSH_BATCH_SIZE,
+                 bucket: Optional[LeakyBucket] = None, retries: int = PUSH_RETRIES,
+                 backoff: float = PUSH_BACKOFF, timeout: float = PUSH_TIMEOUT):
+        base_url = base_url.rstrip("/")
+        if "://" not in base_url:
+            base_url = "https://" + base_url
+        self.shop = base_url
+        self.api = f"{base_url}/admin/api/{api_version}"
+        self.url = f"{self.api}/products.json"
+        self.token = token
+        self.concurrency = max(1, int(concurrency))
+        self.batch_size = max(1, int(batch_size))
+        self.bucket = bucket or LeakyBucket()
+        self.retries = retries
+        self.backoff = backoff
+        self.timeout = timeout
+        self._lock = threading.Lock()
+        self._stats = {"requests": 0, "retries": 0, "throttled": 0, "lookups": 0}
+
+    def _count(self, key: str) -> None:
+        with self._lock:
+            self._stats[key] += 1
+
+    def _delay(self, attempt: int, retry_after: Optional[str] = None) -> float:
+        try:
+            if retry_after:
+                return max(0.0, float(retry_after))
+        except ValueError:
+            pass
+        return min(PUSH_BACKOFF_MAX, self.backoff * 2 ** attempt) * (0.5 + random.random() / 2)
+
+    def _request(self, method: str, url: str, body: Optional[bytes] = None) -> Dict[str, Any]:
+        headers = {"Accept": "application/json", "X-Shopify-Access-Token": self.token, "User-Agent": PUSH_USER_AGENT}
+        if body is not None:
+            headers["Content-Type"] = "application/json"
+        self.bucket.acquire()
+        self._count("requests")
+        req = urllib.request.Request(url, data=body, headers=headers, method=method)
+        with urllib.request.urlopen(req, timeout=self.timeout) as resp:
+            self.bucket.sync(resp.headers.get(CALL_LIMIT_HEADER))
+            return json.loads(resp.read() or b"{}")
+
+    def _call(self, fn):
+        """
+        Chạy fn() (một request) với thử lại: 429 / 5xx / timeout / lỗi mạng → chờ backoff rồi gọi lại fn.
+        fn tự quyết định gửi lại thế nào (xem _create); 4xx khác → PushError ngay.
+        """
+        attempt = 0
+        while True:
+            try:
+                return fn(attempt)
+            except urllib.error.HTTPError as e:
+                self.bucket.sync(e.headers.get(CALL_LIMIT_HEADER))
+                detail = e.read()[:500].decode("utf-8", "replace")
+                if e.code in RETRY_CODES:
+                    self._count("throttled")
+                    self.bucket.throttle()
+                elif e.code not in UNSURE_CODES:
+                    raise PushError(f"HTTP {e.code}: {detail}", e.code) from None
+                if attempt >= self.retries:
+                    raise PushError(f"HTTP {e.code}: {detail}", e.code) from None
+                delay = self._delay(attempt, e.headers.get("Retry-After"))
+            except (urllib.error.URLError, OSError) as e:
+                if attempt >= self.retries:
+                    raise PushError(str(getattr(e, "reason", e))) from None
+                delay = self._delay(attempt)
+            attempt += 1
+            self._count("retries")
+            time.sleep(delay)
+
+    def _find(self, handle: str) -> Optional[Dict[str, Any]]:
+        """Product đã có trên shop với handle này (GET /products.json?handle=) hoặc None."""
+        self._count("lookups")
+        url = f"{self.url}?{urllib.parse.urlencode({'handle': handle, 'fields': 'id,handle'})}"
+        res = self._call(lambda _: self._request("GET", url))
+        return next((p for p in res.get("products") or [] if p.get("handle") == handle), None)
+
+    def _create(self, payload: Dict[str, Any]) -> Dict[str, Any]:
+        """
+        POST tạo product không idempotent: chỉ gửi lại ngay khi chắc server chưa xử lý (429, connection refused).
+        5xx / timeout / lỗi mạng khác → server có thể đã tạo rồi mới lỗi, nên tra theo handle trước,
+        chỉ gửi lại khi chưa có (có rồi → coi như đã tạo, dùng id tra được).
+        """
+        body = json.dumps(payload, ensure_ascii=False).encode("utf-8")
+        handle = payload["product"]["handle"]
+        unsure = [False]   # lần gửi trước có thể đã được server ghi nhận
+
+        def attempt(_):
+            if unsure[0]:
+                found = self._find(handle)
+                if found is not None:
+                    return {"product": found}
+            try:
+                return self._request("POST", self.url, body)
+            except urllib.error.HTTPError as e:
+                unsure[0] = unsure[0] or e.code in UNSURE_CODES
+                raise
+            except (urllib.error.URLError, OSError) as e:
+                unsure[0] = unsure[0] or not isinstance(getattr(e, "reason", e), ConnectionRefusedError)
+                raise
+
+        return self._call(attempt)
+
+    def _update(self, product_id: Any, payload: Dict[str, Any]) -> Dict[str, Any]:
+        """PUT products/{id}.json: ghi đè cùng dữ liệu nên gửi lại an toàn sau 5xx / timeout."""
+        body = json.dumps({"product": {**payload["product"], "id": product_id}}, ensure_ascii=False).encode("utf-8")
+        return self._call(lambda _: self._request("PUT", f"{self.api}/products/{product_id}.json", body))
+
+    def _push_one(self, payload: Dict[str, Any], checkpoint: PushCheckpoint):
+        """(handle, lỗi hoặc None, 'created' | 'updated')."""
+        handle = payload["product"]["handle"]
+        digest = payload_digest(payload)
+        try:
+            product_id = checkpoint.product_id(handle)
+            if product_id is None:
+                found = self._find(handle)
+                product_id = found and found.get("id")
+            res = None
+            if product_id is not None:
+                try:
+                    res = self._update(product_id, payload)
+                except PushError as e:
+                    if e.status != 404:    # product đã bị xoá trên shop → tạo lại
+                        raise
+            action = "updated" if res is not None else "created"
+            if res is None:
+                res = self._create(payload)
+        except PushError as e:
+            return handle, str(e), None
+        checkpoint.add(handle, (res.get("product") or {}).get("id"), digest)
+        return handle, None, action
+
+    def push(self, products: List[Dict[str, Any]], checkpoint: Optional[PushCheckpoint] = None,
+             progress=None) -> Dict[str, Any]:
+        """
+        products: payload từ shopify_products. checkpoint: bỏ qua handle đã đẩy đúng payload lên shop này,
+        ghi từng handle mới xong. progress(done, total): gọi sau mỗi lô; raise (vd ConversionCancelled) để dừng,
+        checkpoint vẫn giữ. Trả báo cáo: total / pushed (= created + updated) / created / updated / skipped /
+        failed {handle: lỗi} / seconds / products_per_sec / requests / ...
+        """
+        checkpoint = PushCheckpoint(None, self.shop) if checkpoint is None else checkpoint
+        checkpoint.shop = checkpoint.shop or self.shop
+        todo = [p for p in products if not checkpoint.is_current(p["product"]["handle"], payload_digest(p))]
+        report: Dict[str, Any] = {"total": len(products), "skipped": len(products) - len(todo),
+                                  "pushed": 0, "created": 0, "updated": 0, "failed": {}}
+        started = time.perf_counter()
+        waited = self.bucket.waited
+        before = dict(self._stats)
+        with ThreadPoolExecutor(max_workers=self.concurrency, thread_name_prefix="shopify-push") as pool:
+            for a in range(0, len(todo), self.batch_size):
+                batch = todo[a:a + self.batch_size]
+                for handle, err, action in pool.map(self._push_one, batch, [checkpoint] * len(batch)):
+                    if err is None:
+                        report["pushed"] += 1
+                        report[action] += 1
+                    else:
+                        report["failed"][handle] = err
+                if progress is not None:
+                    progress(min(a + self.batch_size, len(todo)), len(todo))
+        seconds = time.perf_counter() - started
+        report.update({k: v - before[k] for k, v in self._stats.items()})
+        report.update(
+            seconds=round(seconds, 3),
+            products_per_sec=round(report["pushed"] / seconds, 2) if seconds else None,
+            requests_per_sec=round(report["requests"] / seconds, 2) if seconds else None,
+            rate_limit_wait_seconds=round(self.bucket.waited - waited, 3),
+        )
+        return report
+
+
+def push_shopify_frame(df: pd.DataFrame, base_url: str, token: str, checkpoint_path: Optional[str] = None,
+                       progress=None, **pusher_kwargs) -> Dict[str, Any]:
+    """Rows Shopify → payload theo Handle → đẩy lên Admin API. pusher_kwargs: như ShopifyPusher."""
+    pusher = ShopifyPusher(base_url, token, **pusher_kwargs)
+    return pusher.push(shopify_products(df), PushCheckpoint(checkpoint_path, pusher.shop), progress)
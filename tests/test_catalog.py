@@ -0,0 +1,95 @@
+# CatalogTable: product / biến thể / ảnh theo cột — JSON, parquet và CSV Shopify phải cùng nội dung
+import io
+import json
+
+import numpy as np
+import pandas as pd
+import pytest
+
+import converter
+from bench import gen_etsy_export, gen_tiktok_export
+from converter import convert_etsy_to_shopify, convert_tiktok_to_shopify, etsy_to_catalog, tiktok_to_catalog
+
+PARAMS = dict(vendor_text="V", markup_pct=3, compare_at_markup_pct=5)
+
+
+def _etsy():
+    return io.StringIO(gen_etsy_export(300, seed=9).to_csv(index=False))
+
+
+def _tiktok():
+    f = io.StringIO(gen_tiktok_export(300, seed=9).astype(str).to_csv(index=False))
+    f.name = "tt.csv"
+    return f
+
+
+SOURCES = {
+    "etsy": (_etsy, etsy_to_catalog, convert_etsy_to_shopify),
+    "tiktok": (_tiktok, tiktok_to_catalog, convert_tiktok_to_shopify),
+}
+
+
+def _cell(v):
+    return None if v is None or (isinstance(v, float) and np.isnan(v)) else v
+
+
+@pytest.fixture(params=sorted(SOURCES))
+def pair(request):
+    make, to_catalog, convert = SOURCES[request.param]
+    return to_catalog(make(), **PARAMS), convert(make(), **PARAMS)
+
+
+def test_records_match_csv_rows(pair):
+    catalog, df = pair
+    records = catalog.to_records()
+    assert len(records) == len(catalog) == df["Handle"].nunique()
+    assert [r["handle"] for r in records] == list(pd.unique(df["Handle"]))
+
+    for rec, (handle, rows) in zip(records, df.groupby("Handle", sort=False)):
+        first = rows.iloc[0]
+        assert rec["handle"] == handle and rec["title"] == first["Title"]
+        assert rec["body"] == first["Body (HTML)"] and rec["vendor"] == first["Vendor"] == "V"
+        variants = rows[rows["Option1 Value"].notna()]
+        assert len(rec["variants"]) == len(variants)
+        for v, (_, row) in zip(rec["variants"], variants.iterrows()):
+            for field, col in converter.CATALOG_VARIANT_FIELDS.items():
+                assert _cell(v[field]) == _cell(row[col]), (handle, field)
+        images = rows[rows["Image Src"].notna()]
+        assert [(i["src"], i["position"]) for i in rec["images"]] == \
+            list(zip(images["Image Src"], images["Image Position"].astype(int)))
+
+
+def test_json_roundtrip(pair, tmp_path):
+    catalog, _ = pair
+    path = str(tmp_path / "catalog.json")
+    assert catalog.to_json(path) is None
+    assert json.loads(open(path, encoding="utf-8").read()) == json.loads(catalog.to_json())
+    assert json.loads(catalog.to_json()) == catalog.to_records()
+
+
+def test_parquet_tables(pair, tmp_path):
+    catalog, df = pair
+    paths = catalog.to_parquet(str(tmp_path / "shop"))
+    assert [p.rsplit("/", 1)[1] for p in paths] == ["shop.products.parquet", "shop.variants.parquet",
+                                                    "shop.images.parquet"]
+    products, variants, images = (pd.read_parquet(p) for p in paths)
+    assert list(products["handle"]) == list(pd.unique(df["Handle"]))
+    assert len(variants) == df["Option1 Value"].notna().sum()
+    assert len(images) == df["Image Src"].notna().sum()
+    assert set(variants["product"]) == set(products["product"]) and set(images["product"]) <= set(products["product"])
+    assert list(variants.columns) == ["product"] + list(converter.CATALOG_VARIANT_FIELDS)
+
+
+def test_concat_matches_workers(monkeypatch):
+    monkeypatch.setattr(converter, "PARALLEL_MIN_ROWS", 40)
+    for name, (make, to_catalog, _) in SOURCES.items():
+        serial = to_catalog(make(), **PARAMS)
+        par = to_catalog(make(), workers=3, **PARAMS)
+        assert par.to_records() == serial.to_records(), name
+        assert par.to_shopify_rows().equals(serial.to_shopify_rows()), name
+
+
+def test_empty_catalog():
+    empty = converter.CatalogTable.empty()
+    assert len(empty) == 0 and empty.to_records() == [] and empty.to_json() == "[]"
+    assert converter.CatalogTable.concat([empty, empty]).n_products == 0
@@ -0,0 +1,116 @@
+# Ghi CSV chia part: mỗi part ≤ max_bytes, không handle nào nằm ở 2 file, nối các part = to_csv
+import gzip
+import io
+import os
+import zipfile
+
+import pandas as pd
+import pytest
+
+from bench import gen_etsy_export
+from converter import (
+    SHOPIFY_BASE_COLS,
+    archive_path,
+    convert_etsy_to_shopify,
+    iter_etsy_to_shopify,
+    write_shopify_csv_parts,
+)
+
+BOM = "﻿"
+
+
+@pytest.fixture(scope="module")
+def rows():
+    src = gen_etsy_export(400, seed=3).to_csv(index=False)
+    return convert_etsy_to_shopify(io.StringIO(src)), src
+
+
+def _texts(parts):
+    out = []
+    for p in parts:
+        if p["file"].endswith(".zip"):
+            with zipfile.ZipFile(p["file"]) as zf:
+                out.append(zf.read(p["name"]).decode("utf-8"))
+        elif p["file"].endswith(".gz"):
+            with gzip.open(p["file"], "rb") as fh:
+                out.append(fh.read().decode("utf-8"))
+        else:
+            with open(p["file"], "rb") as fh:
+                out.append(fh.read().decode("utf-8"))
+    return out
+
+
+def _joined(texts):
+    header = texts[0][len(BOM):].split("\n", 1)[0] + "\n"
+    assert all(t.startswith(BOM + header) for t in texts)
+    return texts[0][len(BOM):] + "".join(t[len(BOM) + len(header):] for t in texts[1:])
+
+
+def _handles(text):
+    return set(pd.read_csv(io.StringIO(text.lstrip(BOM)), dtype=str, keep_default_na=False)["Handle"])
+
+
+def _frame(df):
+    return df.reindex(columns=SHOPIFY_BASE_COLS).to_csv(index=False)
+
+
+@pytest.mark.parametrize("chunk_rows", [7, 20000])
+def test_split_respects_size_and_handles(rows, tmp_path, chunk_rows):
+    df, _ = rows
+    max_bytes = 40_000
+    parts = write_shopify_csv_parts(df, str(tmp_path / "out.csv"), max_bytes=max_bytes, chunk_rows=chunk_rows)
+    assert len(parts) > 3
+    texts = _texts(parts)
+    assert all(p["bytes"] <= max_bytes and os.path.getsize(p["file"]) == p["bytes"] for p in parts)
+    assert [p["name"] for p in parts] == [f"out_part{i}.csv" for i in range(1, len(parts) + 1)]
+    seen = [_handles(t) for t in texts]
+    assert all(not (a & b) for i, a in enumerate(seen) for b in seen[i + 1:])
+    assert _joined(texts) == _frame(df)
+    assert sum(p["rows"] for p in parts) == len(df)
+
+
+def test_scattered_handles_are_grouped_before_split(tmp_path):
+    base = pd.DataFrame({c: "" for c in SHOPIFY_BASE_COLS}, index=range(6))
+    base["Handle"] = ["a", "b", "a", "c", "b", "a"]
+    base["Title"] = ["x" * 30, "y" * 30, "", "z" * 30, "", 'multi\n"line"']
+    parts = write_shopify_csv_parts([base.iloc[:3], base.iloc[3:]], str(tmp_path / "s.csv"), max_bytes=400)
+    texts = _texts(parts)
+    seen = [_handles(t) for t in texts]
+    assert all(not (a & b) for i, a in enumerate(seen) for b in seen[i + 1:])
+    grouped = base.iloc[[0, 2, 5, 1, 4, 3]]
+    assert _joined(texts) == _frame(grouped)
+
+
+def test_scattered_handles_in_a_stream_are_rejected(tmp_path):
+    base = pd.DataFrame({c: "" for c in SHOPIFY_BASE_COLS}, index=range(3))
+    base["Handle"] = ["a", "b", "a"]
+    with pytest.raises(ValueError, match="Handle"):
+        write_shopify_csv_parts(iter([base.iloc[:2], base.iloc[2:]]), str(tmp_path / "s.csv"), max_bytes=10_000)
+    assert os.listdir(tmp_path) == []
+    # không chia file → giữ nguyên thứ tự, không kiểm tra
+    parts = write_shopify_csv_parts(iter([base.iloc[:2], base.iloc[2:]]), str(tmp_path / "one.csv"))
+    assert _joined(_texts(parts)) == _frame(base)
+
+
+def test_stream_matches_frame(rows, tmp_path):
+    df, src = rows
+    parts = write_shopify_csv_parts(iter_etsy_to_shopify(io.StringIO(src), chunksize=37),
+                                    str(tmp_path / "st.csv"), max_bytes=40_000)
+    assert _joined(_texts(parts)) == _frame(df)
+
+
+@pytest.mark.parametrize("compression", ["gzip", "zip"])
+def test_compressed_part_names(rows, tmp_path, compression):
+    df, _ = rows
+    out = str(tmp_path / "shop.csv")
+    parts = write_shopify_csv_parts(df, out, max_bytes=40_000, compression=compression)
+    names = [f"shop_part{i}.csv" + (".gz" if compression == "gzip" else "") for i in range(1, len(parts) + 1)]
+    assert [p["name"] for p in parts] == names
+    if compression == "zip":
+        assert {p["file"] for p in parts} == {archive_path(out)} and archive_path(out).endswith("shop.zip")
+        assert sorted(os.listdir(tmp_path)) == ["shop.zip"]
+    else:
+        assert sorted(os.listdir(tmp_path)) == sorted(names)
+    assert _joined(_texts(parts)) == _frame(df)
+    single = write_shopify_csv_parts(df, str(tmp_path / "one.csv"), compression=compression)
+    assert [p["name"] for p in single] == ["one.csv" + (".gz" if compression == "gzip" else "")]
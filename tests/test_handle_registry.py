@@ -0,0 +1,43 @@
+# HandleRegistry / dedupe_handles: handle trùng giữa các file gộp → -2, -3…; trong cùng file giữ nguyên
+import pandas as pd
+
+from converter import HandleRegistry, dedupe_handles
+
+
+def _rows(*handles):
+    return pd.DataFrame({"Handle": list(handles), "Title": [f"t{i}" for i in range(len(handles))]})
+
+
+def test_cross_file_collisions_renamed():
+    a = _rows("mug", "mug", "tee")
+    b = _rows("mug", "cap", "mug")
+    c = _rows("mug", "tee")
+    reg = HandleRegistry()
+    out = dedupe_handles([a, b, c], ["a.csv", "b.csv", "c.csv"], reg)
+
+    assert list(out[0]["Handle"]) == ["mug", "mug", "tee"]        # file đầu giữ nguyên, lặp trong file không đổi
+    assert list(out[1]["Handle"]) == ["mug-2", "cap", "mug-2"]
+    assert list(out[2]["Handle"]) == ["mug-3", "tee-2"]
+    assert reg.renamed == {"a.csv": {}, "b.csv": {"mug": "mug-2"}, "c.csv": {"mug": "mug-3", "tee": "tee-2"}}
+    assert len(reg) == 6 and "mug-3" in reg
+    assert out[0] is a                                              # không đổi gì → không copy
+    assert list(b["Handle"]) == ["mug", "cap", "mug"]              # frame gốc không bị sửa
+
+
+def test_suffix_skips_existing_handles():
+    out = dedupe_handles([_rows("mug", "mug-2"), _rows("mug")], ["a", "b"])
+    assert list(out[1]["Handle"]) == ["mug-3"]
+
+
+def test_generated_handle_not_taken_by_same_owner():
+    # b được cấp mug-2; file c có handle gốc mug-2 → vẫn phải đổi, không nhập vào rows của b
+    out = dedupe_handles([_rows("mug"), _rows("mug"), _rows("mug-2")], ["a", "b", "c"])
+    assert [list(df["Handle"]) for df in out] == [["mug"], ["mug-2"], ["mug-2-2"]]
+
+
+def test_registry_reused_across_calls_and_empty_frames():
+    reg = HandleRegistry()
+    dedupe_handles([_rows("mug")], ["a"], reg)
+    out = dedupe_handles([_rows(), _rows("mug")], ["empty", "b"], reg)
+    assert out[0].empty and list(out[1]["Handle"]) == ["mug-2"]
+    assert list(reg.claim(["mug", "cap"], "b")) == ["mug-2", "cap"]   # cùng owner → cùng tên đã cấp
@@ -0,0 +1,111 @@
+# Kiểm tra ảnh qua server HTTP giả lập: HEAD, redirect, 405 → GET, DNS lỗi, cache TTL, dedupe / bỏ ảnh lỗi
+import threading
+from collections import Counter
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from images import ImageCheckCache, check_image_urls, check_shopify_images, normalize_image_url
+
+
+class _Cdn(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    hits: Counter = Counter()
+
+    def log_message(self, *args):
+        pass
+
+    def _send(self, code, headers=None, body=b""):
+        self.send_response(code)
+        for k, v in (headers or {}).items():
+            self.send_header(k, v)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        if body:
+            self.wfile.write(body)
+
+    def do_HEAD(self):
+        self.hits[("HEAD", self.path)] += 1
+        if self.path == "/ok.jpg":
+            self._send(200, {"Content-Type": "image/jpeg"})
+        elif self.path == "/old.jpg":
+            self._send(301, {"Location": "/ok.jpg"})
+        elif self.path == "/nohead.png":
+            self._send(405)
+        else:
+            self._send(404)
+
+    def do_GET(self):
+        self.hits[("GET", self.path)] += 1
+        if self.path == "/nohead.png":
+            self._send(206, {"Content-Type": "image/png", "Content-Range": "bytes 0-0/10"}, b"x")
+        else:
+            self._send(404)
+
+
+@pytest.fixture
+def cdn():
+    _Cdn.hits = Counter()
+    srv = ThreadingHTTPServer(("127.0.0.1", 0), _Cdn)
+    threading.Thread(target=srv.serve_forever, daemon=True).start()
+    yield f"http://127.0.0.1:{srv.server_port}"
+    srv.shutdown()
+
+
+def test_normalize_image_url():
+    assert normalize_image_url(" //CDN.Example.com:443/a b.jpg#x ") == "https://cdn.example.com/a%20b.jpg"
+    assert normalize_image_url("HTTP://Host:80/p%20q.jpg?s=1") == "http://host/p%20q.jpg?s=1"
+    assert normalize_image_url(np.nan) == ""
+
+
+def test_statuses_redirect_and_head_fallback(cdn):
+    urls = [f"{cdn}/ok.jpg", f"{cdn}/old.jpg", f"{cdn}/missing.jpg", f"{cdn}/nohead.png"]
+    res = check_image_urls(urls, timeout=5)
+    assert {u.rsplit("/", 1)[1]: (r["ok"], r["status"]) for u, r in res.items()} == {
+        "ok.jpg": (True, 200), "old.jpg": (True, 200), "missing.jpg": (False, 404), "nohead.png": (True, 206)}
+    assert res[f"{cdn}/ok.jpg"]["content_type"] == "image/jpeg"
+    assert _Cdn.hits[("GET", "/nohead.png")] == 1 and _Cdn.hits[("GET", "/ok.jpg")] == 0
+
+
+def test_dns_failure_is_reported_not_raised():
+    res = check_image_urls(["http://no-such-host.invalid/a.jpg"], timeout=5, retries=0)
+    r = res["http://no-such-host.invalid/a.jpg"]
+    assert r["ok"] is False and r["status"] is None and r["error"]
+
+
+def test_cache_hit_within_ttl_skips_probe(cdn, tmp_path):
+    url = f"{cdn}/missing.jpg"
+    with ImageCheckCache(str(tmp_path / "c.sqlite"), ttl=3600) as cache:
+        first = check_image_urls([url], cache=cache, timeout=5)
+        second = check_image_urls([url], cache=cache, timeout=5)
+    assert first[url]["cached"] is False and second[url] == {**first[url], "cached": True}
+    assert _Cdn.hits[("HEAD", "/missing.jpg")] == 1
+    with ImageCheckCache(str(tmp_path / "c.sqlite"), ttl=0) as expired:
+        assert check_image_urls([url], cache=expired, timeout=5)[url]["cached"] is False
+    assert _Cdn.hits[("HEAD", "/missing.jpg")] == 2
+
+
+def test_check_shopify_images_dedupe_drop_and_renumber(cdn):
+    df = pd.DataFrame({
+        "Handle": ["a", "a", "a", "a", "b", "b"],
+        "Option1 Value": ["S", np.nan, np.nan, np.nan, "M", np.nan],
+        "Image Src": [f"{cdn}/ok.jpg", f"{cdn.upper()}/ok.jpg#zoom", f"{cdn}/missing.jpg", f"{cdn}/old.jpg",
+                      f"{cdn}/missing.jpg", f"{cdn}/ok.jpg"],
+        "Image Position": [1.0, 2.0, 3.0, 4.0, 1.0, 2.0],
+        "Status": ["draft", np.nan, np.nan, np.nan, "draft", np.nan],
+    })
+    out, summary = check_shopify_images(df, drop_broken=True, timeout=5)
+    assert (summary["images"], summary["unique"], summary["duplicates"]) == (6, 3, 1)
+    assert summary["broken"] == {f"{cdn}/missing.jpg": 404}
+    # a: bỏ dòng ảnh trùng và ảnh lỗi, đánh lại vị trí; b: dòng biến thể giữ lại, chỉ trống ô ảnh
+    assert out["Handle"].tolist() == ["a", "a", "b", "b"]
+    assert out["Image Src"].tolist()[:2] == [f"{cdn}/ok.jpg", f"{cdn}/old.jpg"]
+    assert pd.isna(out["Image Src"][2]) and out["Image Src"][3] == f"{cdn}/ok.jpg"
+    assert out["Image Position"].tolist()[:2] == [1.0, 2.0] and out["Image Position"][3] == 1.0
+    assert pd.isna(out["Image Position"][2])
+
+    kept, summary = check_shopify_images(df, probe=False)
+    assert len(kept) == 5 and summary["checked"] == 0 and summary["broken"] == {}
+    assert kept["Image Position"].tolist() == [1.0, 2.0, 3.0, 1.0, 2.0]
@@ -0,0 +1,86 @@
+# convert_incremental / FingerprintStore: chỉ convert handle mới / thay đổi, báo handle bị gỡ
+import io
+
+import pandas as pd
+import pytest
+
+from bench import gen_etsy_export
+from converter import FingerprintStore, convert_etsy_to_shopify, convert_incremental, slugify
+
+PARAMS = dict(vendor_text="V", markup_pct=3)
+
+
+@pytest.fixture
+def store(tmp_path):
+    with FingerprintStore(str(tmp_path / "delta" / "fp.sqlite")) as s:
+        yield s
+
+
+@pytest.fixture(scope="module")
+def etsy():
+    return gen_etsy_export(300, seed=5)
+
+
+def _csv(df):
+    return io.StringIO(df.to_csv(index=False))
+
+
+def _run(store, df, **kw):
+    return convert_incremental(_csv(df), "etsy", store, **PARAMS, **kw)
+
+
+def test_first_run_everything_new(store, etsy):
+    out, delta = _run(store, etsy)
+    full = convert_etsy_to_shopify(_csv(etsy), **PARAMS)
+    pd.testing.assert_frame_equal(out.reset_index(drop=True), full.reset_index(drop=True))
+    assert len(delta["new"]) == len(etsy) and delta["changed"] == delta["removed"] == []
+    assert delta["unchanged"] == 0
+
+    out, delta = _run(store, etsy)   # chạy lại y hệt → không còn gì để convert
+    assert out.empty
+    assert delta["new"] == delta["changed"] == delta["removed"] == [] and delta["unchanged"] == len(etsy)
+
+
+def test_changed_and_removed(store, etsy):
+    _run(store, etsy)
+    edited = etsy.copy()
+    edited.loc[3, "PRICE"] = "99.99"
+    edited = edited.drop(index=7)
+    out, delta = _run(store, edited)
+
+    changed, removed = slugify(etsy.loc[3, "TITLE"]), slugify(etsy.loc[7, "TITLE"])
+    assert delta["new"] == [] and delta["changed"] == [changed] and delta["removed"] == [removed]
+    assert delta["unchanged"] == len(etsy) - 2
+    assert set(out["Handle"]) == {changed}
+    full = convert_etsy_to_shopify(_csv(edited), **PARAMS)
+    expected = full[full["Handle"] == changed].reset_index(drop=True)
+    pd.testing.assert_frame_equal(out.reset_index(drop=True), expected)
+
+    assert changed in store.load() and removed not in store.load()
+
+
+def test_params_change_reconverts_all(store, etsy):
+    _run(store, etsy)
+    _, delta = convert_incremental(_csv(etsy), "etsy", store, vendor_text="V", markup_pct=5)
+    assert len(delta["changed"]) == len(etsy) and delta["unchanged"] == 0
+
+
+def test_commit_false_and_feeds(store, etsy):
+    _, delta = _run(store, etsy, commit=False)
+    assert store.load() == {}
+    _, again = _run(store, etsy, commit=False)
+    assert again["new"] == delta["new"]
+
+    store.save("default", delta["fingerprints"], delta["removed"])
+    assert store.load() == delta["fingerprints"]
+    assert store.load("shop-b") == {}   # feed khác độc lập
+    _, other = _run(store, etsy, feed="shop-b")
+    assert len(other["new"]) == len(etsy)
+
+    store.clear()
+    assert store.load() == {} and len(store.load("shop-b")) == len(etsy)
+
+
+def test_unknown_source(store, etsy):
+    with pytest.raises(ValueError):
+        convert_incremental(_csv(etsy), "amazon", store)
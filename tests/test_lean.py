@@ -0,0 +1,51 @@
+# Output gọn (lean_shopify_frame): chỉ đổi dtype, CSV ghi ra giống hệt bản gốc
+import io
+
+import pandas as pd
+import pytest
+
+from bench import gen_etsy_export, gen_tiktok_export
+from converter import (
+    LEAN_BOOL_COLS,
+    LEAN_CATEGORY_COLS,
+    LEAN_FLOAT_COLS,
+    ConversionReport,
+    convert_etsy_to_shopify,
+    convert_tiktok_to_shopify,
+    lean_shopify_frame,
+)
+
+
+def _csv(df):
+    return df.to_csv(index=False)
+
+
+@pytest.mark.parametrize("params", [{}, {"markup_pct": 10, "compare_at_markup_pct": 30, "vendor_text": "V"}])
+@pytest.mark.parametrize("source", ["etsy", "tiktok"])
+def test_lean_frame_writes_identical_csv(source, params):
+    if source == "etsy":
+        df = convert_etsy_to_shopify(io.StringIO(gen_etsy_export(500, seed=1).to_csv(index=False)), **params)
+    else:
+        df = convert_tiktok_to_shopify(gen_tiktok_export(500, seed=1).astype(str), **params)
+    report = ConversionReport(source)
+    lean = lean_shopify_frame(df, report)
+    assert _csv(lean) == _csv(df)
+    assert lean["Variant Price"].dtype == "float64"
+    assert isinstance(lean["Status"].dtype, pd.CategoricalDtype)
+    assert report.memory["after_bytes"] < report.memory["before_bytes"]
+    if params:
+        assert lean["Variant Compare At Price"].dtype == "float64"
+
+
+def test_lean_column_groups_do_not_overlap():
+    groups = [set(LEAN_CATEGORY_COLS), set(LEAN_BOOL_COLS), set(LEAN_FLOAT_COLS)]
+    assert all(not (a & b) for i, a in enumerate(groups) for b in groups[i + 1:])
+
+
+def test_lean_does_not_touch_input_or_unique_text():
+    df = pd.DataFrame({"Handle": ["a", "b", "c"], "Variant Price": [1.5, "", 2.0], "Published": [True, False, True]})
+    lean = lean_shopify_frame(df)
+    assert df["Variant Price"].dtype == object
+    assert lean["Variant Price"].isna().tolist() == [False, True, False]
+    assert str(lean["Published"].dtype) == "boolean"
+    assert not isinstance(lean["Handle"].dtype, pd.CategoricalDtype)
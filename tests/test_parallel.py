@@ -0,0 +1,58 @@
+# workers > 1: chia listing / product cho nhiều process, output phải giống hệt chạy tuần tự
+import io
+
+import pandas as pd
+import pytest
+
+import converter
+from bench import gen_etsy_export, gen_tiktok_export
+from converter import convert_etsy_to_shopify, convert_tiktok_to_shopify
+
+PARAMS = dict(vendor_text="V", markup_pct=3, compare_at_markup_pct=5)
+
+
+@pytest.fixture(autouse=True)
+def small_parts(monkeypatch):
+    monkeypatch.setattr(converter, "PARALLEL_MIN_ROWS", 40)   # file nhỏ cũng được chia
+
+
+@pytest.fixture(scope="module")
+def etsy_src():
+    return gen_etsy_export(1200, seed=4).to_csv(index=False)
+
+
+@pytest.fixture(scope="module")
+def tiktok_src():
+    return gen_tiktok_export(1200, seed=4).to_csv(index=False)
+
+
+def _tiktok(text, **kw):
+    f = io.StringIO(text)
+    f.name = "tt.csv"
+    return convert_tiktok_to_shopify(f, **PARAMS, **kw)
+
+
+@pytest.mark.parametrize("workers", [2, 3])
+def test_etsy_workers_identical(etsy_src, workers):
+    serial = convert_etsy_to_shopify(io.StringIO(etsy_src), variant_price_map={"XL": "30"}, **PARAMS)
+    par = convert_etsy_to_shopify(io.StringIO(etsy_src), variant_price_map={"XL": "30"}, workers=workers, **PARAMS)
+    pd.testing.assert_frame_equal(serial, par)
+    assert serial.to_csv(index=False) == par.to_csv(index=False)
+
+
+@pytest.mark.parametrize("workers", [2, 3])
+def test_tiktok_workers_identical(tiktok_src, workers):
+    serial = _tiktok(tiktok_src)
+    par = _tiktok(tiktok_src, workers=workers)
+    pd.testing.assert_frame_equal(serial, par)
+    assert serial.to_csv(index=False) == par.to_csv(index=False)
+
+
+def test_workers_with_progress_identical(etsy_src, monkeypatch):
+    monkeypatch.setattr(converter, "PROGRESS_BATCH_ROWS", 50)   # nhiều phần hơn số worker
+    calls = []
+    serial = convert_etsy_to_shopify(io.StringIO(etsy_src), **PARAMS)
+    par = convert_etsy_to_shopify(io.StringIO(etsy_src), workers=2,
+                                  progress=lambda done, total, rows: calls.append((done, total)), **PARAMS)
+    pd.testing.assert_frame_equal(serial, par)
+    assert len(calls) > 2 and calls[-1][0] == calls[-1][1]
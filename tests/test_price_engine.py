@@ -0,0 +1,72 @@
+# Price engine vector hoá phải cho đúng từng giá trị như parse_price / apply_markup / calc_compare_at
+import math
+import random
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from converter import (
+    apply_markup,
+    apply_markup_series,
+    calc_compare_at,
+    calc_compare_at_series,
+    parse_price,
+    parse_price_series,
+    price_cells,
+)
+
+EDGE = ["28.99", "1.234,56", "1,234.56", "US$12.50", "", "€ 9,99", "abc", "12", "0", "-5", "1.2.3", "inf", "nan",
+        "  7.5  ", "3.", "99999999999999999", "0.005", "1.005", "2.675", "1,5", None, np.nan]
+
+
+def _fuzz(n, seed):
+    rnd = random.Random(seed)
+    out = []
+    for _ in range(n):
+        v = rnd.choice([rnd.uniform(0, 2000), rnd.randint(0, 10**6) / 100, rnd.randint(0, 999) + 0.005])
+        fmt = rnd.choice(["{:.2f}", "{:.3f}", "{:,.2f}", "US${:.2f}", "{:.2f} USD", "{}"])
+        s = fmt.format(v)
+        if rnd.random() < 0.2:   # kiểu châu Âu: 1.234,56
+            s = s.replace(",", "X").replace(".", ",").replace("X", ".")
+        out.append(s)
+    return out + EDGE
+
+
+def _same(scalar, vector):
+    if scalar == "" or (isinstance(scalar, float) and math.isnan(scalar)):
+        return vector == "" or (isinstance(vector, float) and math.isnan(vector))
+    return scalar == vector
+
+
+@pytest.mark.parametrize("seed", [1, 2])
+def test_parse_price_series_matches_scalar(seed):
+    values = _fuzz(3000, seed)
+    got = parse_price_series(values).tolist()
+    assert all(_same(parse_price(v), g) for v, g in zip(values, got))
+
+
+def test_parse_price_series_numeric_input():
+    values = [12.5, 0.0, 1e16, 5e-05, -3.25, np.nan]
+    got = parse_price_series(pd.Series(values)).tolist()
+    assert all(_same(parse_price(v), g) for v, g in zip(values, got))
+
+
+@pytest.mark.parametrize("pct", [0, 10, 12.5, 33.333, -20, "15", "x"])
+def test_apply_markup_series_matches_scalar(pct):
+    values = _fuzz(2000, 7)
+    got = price_cells(apply_markup_series(values, pct)).tolist()
+    assert got == [apply_markup(v, pct) for v in values]
+
+
+@pytest.mark.parametrize("pct", [0, -5, 10, 30, 99.5, 100, 150, None])
+def test_calc_compare_at_series_matches_scalar(pct):
+    values = _fuzz(2000, 11)
+    got = price_cells(calc_compare_at_series(values, pct)).tolist()
+    assert got == [calc_compare_at(v, pct) for v in values]
+
+
+def test_half_cent_rounding_matches_python_round():
+    values = [f"{k}.{c:02d}5" for k in range(0, 50) for c in range(0, 100, 7)]
+    got = apply_markup_series(values, 0).tolist()
+    assert got == [apply_markup(v, 0) for v in values]
@@ -0,0 +1,71 @@
+# PriceTable: bảng giá biên dịch sẵn (nhãn → token → NaN), lưu / nạp JSON, dùng thay dict variant_price_map
+import io
+import json
+import math
+
+import pandas as pd
+import pytest
+
+from bench import gen_etsy_export
+from converter import PriceTable, as_price_table, convert_etsy_to_shopify, list_price_tables, parse_price_map
+
+PRICE_TEXT = """8 x 12" - 20 x 30cm (US$28.99)
+11x14 : 34.99
+A3 / 29.7 x 42cm - 35.99
+XL 31
+Digital Download (US$11.99)
+Broken line without price"""
+
+
+@pytest.fixture(scope="module")
+def table():
+    return PriceTable.from_text(PRICE_TEXT, name="posters")
+
+
+def test_lookup_exact_then_token_then_nan(table):
+    assert len(table) == 5
+    assert table.lookup('8 x 12" - 20 x 30cm') == 28.99          # nguyên nhãn
+    assert table.lookup('8x12 in') == 28.99                      # cùng token 8X12
+    assert table.lookup('11 x 14" - 27 x 35cm') == 34.99
+    assert math.isnan(table.lookup("5 x 7\""))                   # không có → NaN (converter dùng PRICE)
+    got = table.lookup_array(pd.Series(["XL", "S", "XL", None]).to_numpy(dtype=object))
+    assert got[0] == got[2] == 31.0 and math.isnan(got[1]) and math.isnan(got[3])
+
+
+def test_same_content_same_fingerprint(table):
+    other = PriceTable.from_mapping(parse_price_map(PRICE_TEXT), name="khác tên")
+    assert other == table and hash(other) == hash(table) and repr(other) == repr(table)
+    assert PriceTable.from_mapping({"XL": "32"}) != table
+    assert as_price_table(None) is None and as_price_table({"XL": "abc"}) is None
+    assert as_price_table(table) is table
+
+
+def test_save_load_roundtrip(tmp_path, table):
+    path = table.save(folder=str(tmp_path))
+    assert path == str(tmp_path / "posters.json")
+    assert list_price_tables(str(tmp_path)) == ["posters"]
+    assert PriceTable.load("posters", folder=str(tmp_path)) == table
+    assert PriceTable.load(path) == table
+
+    with pytest.raises(ValueError):
+        table.save("../ngoài", folder=str(tmp_path))
+    data = json.loads(open(path, encoding="utf-8").read())
+    data["version"] = 999
+    with pytest.raises(ValueError):
+        PriceTable.from_dict(data)
+
+
+@pytest.mark.parametrize("apply_markup_on_map", [False, True])
+def test_convert_table_matches_dict(table, apply_markup_on_map):
+    src = gen_etsy_export(400, seed=6).to_csv(index=False)
+    kw = dict(markup_pct=10, compare_at_markup_pct=20, apply_markup_on_map=apply_markup_on_map)
+    by_dict = convert_etsy_to_shopify(io.StringIO(src), variant_price_map=parse_price_map(PRICE_TEXT), **kw)
+    by_table = convert_etsy_to_shopify(io.StringIO(src), variant_price_map=table, **kw)
+    assert by_dict.to_csv(index=False) == by_table.to_csv(index=False)
+
+    plain = convert_etsy_to_shopify(io.StringIO(src), **kw)
+    xl = (by_table["Option1 Value"] == "XL").to_numpy()
+    assert xl.any()
+    expected = "34.1" if apply_markup_on_map else "31.0"
+    assert set(by_table.loc[xl, "Variant Price"].astype(str)) == {expected}
+    assert (by_table["Variant Price"] != plain["Variant Price"]).sum() >= xl.sum()
@@ -0,0 +1,71 @@
+# Ô toàn chữ số ('007', '0012') phải giữ nguyên qua mọi đường đọc: full (pyarrow), stream (C), preview
+import io
+
+import pandas as pd
+import pytest
+
+from converter import (
+    convert_etsy_to_shopify,
+    convert_tiktok_to_shopify,
+    iter_etsy_to_shopify,
+    preview_shopify,
+    read_csv_fast,
+    read_tiktok,
+)
+
+ETSY_CSV = (
+    "TITLE,DESCRIPTION,PRICE,SKU,VARIATION 1 NAME,VARIATION 1 VALUES,IMAGE1\n"
+    "007,Bond,0012.50,0012,Size,S,https://cdn/a.jpg\n"
+    "Poster,Desc,20,00123,Size,M,https://cdn/b.jpg\n"
+)
+TIKTOK_CSV = (
+    "Product Name,Product ID,Seller SKU,Price,Variant 1 Name,Variant 1 Value,Main Image\n"
+    "007,0001,0012,0012.50,Size,S,https://cdn/a.jpg\n"
+    "Poster,0002,00123,20,Size,M,https://cdn/b.jpg\n"
+)
+
+
+def _file(text, name):
+    f = io.BytesIO(text.encode("utf-8"))
+    f.name = name
+    return f
+
+
+def test_read_csv_fast_keeps_digit_strings():
+    df = read_csv_fast(_file(ETSY_CSV, "etsy.csv"))
+    assert df["TITLE"].tolist() == ["007", "Poster"]
+    assert df["SKU"].tolist() == ["0012", "00123"]
+    assert df["PRICE"].tolist() == ["0012.50", "20"]
+
+
+def test_read_csv_fast_matches_c_engine():
+    fast = read_csv_fast(_file(ETSY_CSV, "etsy.csv"))
+    c = pd.read_csv(_file(ETSY_CSV, "etsy.csv"), engine="c", dtype=str)
+    pd.testing.assert_frame_equal(fast, c)
+
+
+def test_etsy_full_stream_preview_agree():
+    full = convert_etsy_to_shopify(_file(ETSY_CSV, "etsy.csv"))
+    stream = pd.concat(list(iter_etsy_to_shopify(_file(ETSY_CSV, "etsy.csv"), chunksize=1)), ignore_index=True)
+    preview = preview_shopify(_file(ETSY_CSV, "etsy.csv"), "etsy")
+    for df in (full, stream, preview):
+        variants = df[df["Status"] == "draft"]
+        assert variants["Handle"].tolist()[0] == full["Handle"].iloc[0]
+        assert variants["Variant SKU"].tolist() == ["0012", "00123"]
+        assert variants["Title"].tolist()[0] == "007"
+    assert full["Handle"].tolist() == stream["Handle"].tolist() == preview["Handle"].tolist()
+    assert full["Handle"].iloc[0] == "007"
+
+
+@pytest.mark.parametrize("nrows", [None, 1])
+def test_tiktok_read_keeps_digit_strings(nrows):
+    tt = read_tiktok(_file(TIKTOK_CSV, "tt.csv"), nrows=nrows)
+    assert tt["Product Name"].tolist()[0] == "007"
+    assert tt["Seller SKU"].tolist()[0] == "0012"
+
+
+def test_tiktok_full_and_preview_agree():
+    full = convert_tiktok_to_shopify(_file(TIKTOK_CSV, "tt.csv"))
+    preview = preview_shopify(_file(TIKTOK_CSV, "tt.csv"), "tiktok")
+    pd.testing.assert_frame_equal(full, preview)
+    assert full.loc[full["Status"] == "draft", "Variant SKU"].tolist() == ["0012", "00123"]
@@ -0,0 +1,38 @@
+# .xls vẫn được nhận (cli SOURCE_EXTS, detect_source_type) → không đi qua openpyxl, dùng read_excel
+import shutil
+
+import pandas as pd
+import pytest
+
+from converter import convert_tiktok_to_shopify, detect_source_type, preview_shopify, read_tiktok
+
+ROWS = {
+    "Product Name": ["Ao thun", "Non"],
+    "Seller SKU": ["0012", "N1"],
+    "Price": ["100", "50"],
+    "Variant 1 Name": ["Size", "Size"],
+    "Variant 1 Value": ["S", "M"],
+    "Main Image": ["https://cdn/a.jpg", "https://cdn/n.jpg"],
+    "Ghi chu": ["x", "y"],
+}
+
+
+@pytest.fixture
+def xlsx_and_xls(tmp_path):
+    xlsx = tmp_path / "shop.xlsx"
+    pd.DataFrame(ROWS).to_excel(xlsx, index=False)
+    # read_excel nhận định dạng theo nội dung; openpyxl thì từ chối mọi file đuôi .xls
+    xls = tmp_path / "shop.xls"
+    shutil.copy(xlsx, xls)
+    return str(xlsx), str(xls)
+
+
+def test_xls_reads_like_xlsx(xlsx_and_xls, tmp_path):
+    xlsx, xls = xlsx_and_xls
+    assert detect_source_type(xls) == "tiktok"
+    pd.testing.assert_frame_equal(read_tiktok(xls), read_tiktok(xlsx))
+    assert "Ghi chu" not in read_tiktok(xls).columns
+    pd.testing.assert_frame_equal(convert_tiktok_to_shopify(xls, cache_dir=str(tmp_path / "c")),
+                                  convert_tiktok_to_shopify(xlsx))
+    pd.testing.assert_frame_equal(preview_shopify(xls, "tiktok", n_rows=1),
+                                  preview_shopify(xlsx, "tiktok", n_rows=1))
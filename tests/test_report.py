@@ -0,0 +1,37 @@
+# ConversionReport: thời gian + RSS theo từng stage (không phải peak cả process lặp lại cho mọi stage)
+import io
+
+import numpy as np
+import pytest
+
+from bench import gen_etsy_export
+from converter import ConversionReport, convert_etsy_to_shopify, current_rss_mb
+
+needs_proc = pytest.mark.skipif(current_rss_mb() is None, reason="cần /proc để đo RSS hiện tại")
+
+
+@needs_proc
+def test_stage_rss_delta_follows_allocations():
+    report = ConversionReport("etsy")
+    with report.stage("alloc"):
+        keep = np.ones(64 * 2**20 // 8)   # ~64MB, giữ lại sau stage
+    with report.stage("free"):
+        del keep
+    with report.stage("idle"):
+        pass
+    stages = report.finish().stages
+    assert stages["alloc"]["rss_delta_mb"] > 50
+    assert stages["free"]["rss_delta_mb"] < -50
+    assert abs(stages["idle"]["rss_delta_mb"]) < 5
+    assert stages["free"]["rss_mb"] < stages["alloc"]["rss_mb"]
+    assert report.peak_rss_mb >= stages["alloc"]["rss_mb"] - 1   # peak cả process, làm tròn khác nguồn
+
+
+def test_convert_fills_stages_and_counts():
+    src = io.StringIO(gen_etsy_export(300, seed=2).to_csv(index=False))
+    report = ConversionReport("etsy")
+    df = convert_etsy_to_shopify(src, report=report)
+    data = report.finish().to_dict()
+    assert data["counts"]["rows_out"] == len(df)
+    assert data["stages"] and all(v["calls"] >= 1 and v["seconds"] >= 0 for v in data["stages"].values())
+    assert {"rss_mb", "rss_delta_mb"} <= set(report.stages_frame().columns)
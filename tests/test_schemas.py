@@ -0,0 +1,99 @@
+# SchemaRegistry: cache theo chữ ký header (LRU) + mapping cột tự khai báo cho template lạ
+import io
+
+import pytest
+
+import converter
+from bench import gen_tiktok_export
+from converter import SCHEMAS, SchemaError, SchemaRegistry, convert_tiktok_to_shopify, header_signature
+
+RENAMED = {"Product Name": "Tên sản phẩm", "SKU Price": "Giá bán"}
+
+
+@pytest.fixture
+def tiktok():
+    return gen_tiktok_export(120, seed=8).astype(str)
+
+
+@pytest.fixture
+def clean_schemas():
+    SCHEMAS.clear_mappings()
+    yield SCHEMAS
+    SCHEMAS.clear_mappings()
+
+
+def _csv(df):
+    f = io.StringIO(df.to_csv(index=False))
+    f.name = "tt.csv"
+    return f
+
+
+def test_signature_depends_on_source_and_order():
+    assert header_signature("tiktok", ["a", "b"]) == header_signature("tiktok", ["a", "b"])
+    assert header_signature("tiktok", ["a", "b"]) != header_signature("tiktok", ["b", "a"])
+    assert header_signature("etsy", ["a", "b"]) != header_signature("tiktok", ["a", "b"])
+
+
+def test_lru_cache_stats(tiktok):
+    reg = SchemaRegistry(maxsize=2)
+    header = list(tiktok.columns)
+    first = reg.resolve("tiktok", header)
+    assert reg.resolve("tiktok", header) is first
+    reg.resolve("tiktok", header + ["x"])
+    reg.resolve("tiktok", header + ["y"])   # đẩy layout đầu ra khỏi cache
+    reg.resolve("tiktok", header)
+    assert reg.stats() == {"layouts": 2, "hits": 1, "misses": 4, "mappings": 0}
+
+
+def test_register_validates_fields():
+    reg = SchemaRegistry()
+    with pytest.raises(SchemaError):
+        reg.register("amazon", {"title": "Name"})
+    with pytest.raises(SchemaError):
+        reg.register("tiktok", {"tittle": "Name"})
+    reg.register("etsy", {"images": "Photo"}, name="một ảnh")
+    assert reg.mappings("etsy") == [("một ảnh", {"images": ["Photo"]})]
+
+
+def test_custom_tiktok_mapping(tiktok):
+    header = [RENAMED.get(c, c) for c in tiktok.columns]
+    reg = SchemaRegistry()
+    assert reg.check("tiktok", header) == ["thiếu cột cho field title"]
+    reg.register("tiktok", {"title": "Tên sản phẩm", "price": "Giá bán"}, name="shop-vn")
+    schema, name = reg.explain("tiktok", header)   # register xoá cache → dò lại với mapping
+    assert name == "shop-vn" and schema["title"] == "Tên sản phẩm" and schema["price"] == "Giá bán"
+    assert reg.check("tiktok", header) == []
+    assert reg.explain("tiktok", list(tiktok.columns))[1] is None   # header không có cột nêu → không áp
+
+
+def test_custom_etsy_mapping_images():
+    header = ["Name", "PRICE", "Photo A", "IMAGE1", "Photo B"]
+    reg = SchemaRegistry()
+    reg.register("etsy", {"TITLE": "Name", "images": ["Photo B", "Photo A"]})
+    assert reg.resolve("etsy", header) == {
+        "columns": {"Name": "TITLE", "PRICE": "PRICE", "Photo A": "IMAGE2", "Photo B": "IMAGE1"}}
+
+
+def test_save_load_mappings(tmp_path):
+    reg = SchemaRegistry()
+    reg.register("tiktok", {"title": "Tên sản phẩm"}, name="vn")
+    reg.register("etsy", {"TITLE": "Name", "images": ["Photo"]})
+    path = str(tmp_path / "mappings.json")
+    reg.save_mappings(path)
+    other = SchemaRegistry()
+    assert other.load_mappings(path) == 2
+    assert other.mappings("tiktok") == reg.mappings("tiktok")
+    assert other.mappings("etsy") == reg.mappings("etsy")
+
+
+def test_convert_with_registered_mapping(tiktok, clean_schemas, tmp_path):
+    expected = convert_tiktok_to_shopify(_csv(tiktok), markup_pct=5)
+    renamed = tiktok.rename(columns=RENAMED)
+    path = str(tmp_path / "renamed.csv")
+    renamed.to_csv(path, index=False)
+    assert converter.check_source_schema(path, "tiktok") == ["thiếu cột cho field title"]
+
+    clean_schemas.register("tiktok", {"title": "Tên sản phẩm", "price": "Giá bán"})
+    assert converter.check_source_schema(path, "tiktok") == []
+    got = convert_tiktok_to_shopify(_csv(renamed), markup_pct=5)
+    assert got.to_csv(index=False) == expected.to_csv(index=False)
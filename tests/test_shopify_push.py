@@ -0,0 +1,128 @@
+# Đẩy product: lỗi sau khi server đã tạo không dẫn tới tạo trùng; đẩy lại / đẩy delta cập nhật product đã có
+import json
+import re
+import socket
+import threading
+import urllib.parse
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+from shopify_push import LeakyBucket, PushCheckpoint, PushError, ShopifyPusher
+
+
+class _Shop(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    created: dict = {}
+    script: dict = {}   # handle → các phản hồi lần lượt cho POST
+    puts: list = []
+    posts = 0
+
+    def log_message(self, *args):
+        pass
+
+    def do_GET(self):
+        handle = urllib.parse.parse_qs(urllib.parse.urlparse(self.path).query)["handle"][0]
+        found = [{"id": self.created[handle], "handle": handle}] if handle in self.created else []
+        self._reply(200, {"products": found})
+
+    def do_POST(self):
+        product = json.loads(self.rfile.read(int(self.headers["Content-Length"])))["product"]
+        handle = product["handle"]
+        type(self).posts += 1
+        steps = self.script.get(handle) or []
+        step = steps.pop(0) if steps else "ok"
+        if step == "429":
+            return self._reply(429, {}, {"Retry-After": "0"})
+        if step == "503-before":
+            return self._reply(503, {})
+        self.created.setdefault(handle, 100 + len(self.created))
+        if step == "503-after":
+            return self._reply(503, {})
+        self._reply(201, {"product": {"id": self.created[handle], "handle": handle}})
+
+    def do_PUT(self):
+        product = json.loads(self.rfile.read(int(self.headers["Content-Length"])))["product"]
+        pid = int(re.search(r"/products/(\d+)\.json", self.path).group(1))
+        if pid not in self.created.values():
+            return self._reply(404, {"errors": "Not Found"})
+        self.puts.append((pid, product.get("title")))
+        self._reply(200, {"product": {"id": pid, "handle": product["handle"]}})
+
+    def _reply(self, code, obj, headers=None):
+        data = json.dumps(obj).encode()
+        self.send_response(code)
+        for k, v in (headers or {}).items():
+            self.send_header(k, v)
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+
+@pytest.fixture
+def shop():
+    _Shop.created, _Shop.script, _Shop.puts, _Shop.posts = {}, {}, [], 0
+    srv = ThreadingHTTPServer(("127.0.0.1", 0), _Shop)
+    threading.Thread(target=srv.serve_forever, daemon=True).start()
+    yield _Shop, f"http://127.0.0.1:{srv.server_port}"
+    srv.shutdown()
+
+
+def _products(*handles, title=""):
+    return [{"product": {"handle": h, "title": title or h}} for h in handles]
+
+
+def test_5xx_after_create_does_not_duplicate(shop):
+    state, url = shop
+    state.script = {"a": ["503-after"], "b": ["503-before", "503-before"], "c": ["429"]}
+    report = ShopifyPusher(url, "tok", backoff=0.001, bucket=LeakyBucket(40, 1000)).push(_products("a", "b", "c"))
+    assert report["pushed"] == 3 and not report["failed"]
+    assert sorted(state.created) == ["a", "b", "c"]
+    # mỗi product tra một lần trước khi tạo, thêm một lần trước mỗi lần gửi lại sau 5xx (a: 1, b: 2); 429 gửi lại thẳng
+    assert report["lookups"] == 3 + 3
+
+
+def test_connection_refused_retries_without_lookup():
+    sock = socket.socket()
+    sock.bind(("127.0.0.1", 0))
+    port = sock.getsockname()[1]
+    sock.close()
+    pusher = ShopifyPusher(f"http://127.0.0.1:{port}", "tok", backoff=0.001, retries=2)
+    with pytest.raises(PushError, match="refused"):
+        pusher._create(_products("z")[0])
+    assert pusher._stats["retries"] == 2 and pusher._stats["lookups"] == 0
+
+
+def test_repush_updates_instead_of_duplicating(shop, tmp_path):
+    state, url = shop
+    ck = str(tmp_path / "ck.jsonl")
+    pusher = ShopifyPusher(url, "tok", backoff=0.001)
+    first = pusher.push(_products("a", "b"), PushCheckpoint(ck, pusher.shop))
+    assert (first["created"], first["updated"]) == (2, 0)
+    # cùng payload, cùng shop → bỏ qua
+    again = pusher.push(_products("a", "b"), PushCheckpoint(ck, pusher.shop))
+    assert again["skipped"] == 2 and again["requests"] == 0
+    # product đổi → PUT theo id trong checkpoint, không tra, không POST
+    changed = pusher.push(_products("a", title="new"), PushCheckpoint(ck, pusher.shop))
+    assert (changed["updated"], changed["lookups"]) == (1, 0)
+    assert state.puts == [(state.created["a"], "new")] and state.posts == 2
+
+
+def test_checkpoint_is_per_shop_and_lookup_prevents_duplicates(shop, tmp_path):
+    state, url = shop
+    ck = str(tmp_path / "ck.jsonl")
+    ShopifyPusher(url, "tok").push(_products("a"), PushCheckpoint(ck, url))
+    # checkpoint của shop khác không làm bỏ qua handle; không checkpoint → tra theo handle rồi PUT
+    other = PushCheckpoint(ck, "https://other.myshopify.com")
+    assert "a" not in other
+    report = ShopifyPusher(url, "tok").push(_products("a", "b"))
+    assert (report["created"], report["updated"]) == (1, 1)
+    assert sorted(state.created) == ["a", "b"] and state.posts == 2
+
+
+def test_update_falls_back_to_create_when_product_was_deleted(shop, tmp_path):
+    state, url = shop
+    ck = str(tmp_path / "ck.jsonl")
+    PushCheckpoint(ck, url).add("gone", 999, "old")
+    report = ShopifyPusher(url, "tok").push(_products("gone"), PushCheckpoint(ck, url))
+    assert report["created"] == 1 and "gone" in state.created
@@ -0,0 +1,83 @@
+# SkuMatcher (index token + chuỗi con) phải cho đúng kết quả như cách quét tuyến tính cũ
+import random
+
+import pytest
+
+import converter
+from converter import SKU_INDEX_MIN_TOKENS, SkuMatcher, _match_option_skus, is_digital_like, option1_token, sku_token
+
+
+def linear_match(opt1, skus_all, skus_by_pos):
+    """Cách ghép cũ: token trùng → token chứa nhau (quét theo thứ tự) → SKU đầu tiên chưa dùng theo vị trí."""
+    token_to_sku = {sku_token(s): s for s in skus_all}
+    out, used = [], set()
+    for o1 in opt1:
+        if is_digital_like(o1):
+            out.append("")
+            continue
+        tok = option1_token(o1)
+        sku = token_to_sku.get(tok)
+        if sku is None:
+            sku = next((v for tk, v in token_to_sku.items() if (tk in tok or tok in tk) and v not in used), None)
+        if sku is None:
+            sku = next((s for s in skus_by_pos if s not in used), "")
+        used.add(sku)
+        out.append(sku)
+    return out
+
+
+def both(opt1, skus):
+    new = _match_option_skus(opt1, opt1, skus)
+    assert new == linear_match(opt1, skus, skus if len(skus) == len(opt1) else skus[:len(opt1)])
+    return new
+
+
+def test_exact_token():
+    assert both(["8x10", "11x14", "A4"], ["P_A4", "P_8X10", "P_11X14"]) == ["P_8X10", "P_11X14", "P_A4"]
+
+
+@pytest.mark.parametrize("opt", ["8x10", " 8 X 10 ", "8×10", 'Size 8x10"', "8x10 in"])
+def test_normalized_token(opt):
+    # hoa/thường, khoảng trắng, ký tự × và chữ thừa quanh kích thước đều về cùng token
+    assert both([opt, "A4"], ["poster_a4", "poster_8x10"]) == ["poster_8x10", "poster_a4"]
+
+
+def test_containing_token_takes_first_unused():
+    # 'A' không trùng token nào nhưng nằm trong cả 'A4' và 'A3' → lần lượt lấy theo thứ tự SKU
+    assert both(["A", "A", "A"], ["P_A4", "P_A3", "P_B2"]) == ["P_A4", "P_A3", "P_B2"]
+
+
+def test_ambiguous_duplicate_sku_tokens():
+    # Hai SKU cùng token: SKU sau đè SKU trước (như dict cũ); token trùng khớp không xét SKU đã dùng
+    assert both(["8x10", "8x10"], ["OLD_8X10", "NEW_8X10"]) == ["NEW_8X10", "NEW_8X10"]
+
+
+def test_no_match_falls_back_to_position_then_empty():
+    assert both(["Red", "Blue", "Green"], ["X1", "Y2"]) == ["X1", "Y2", ""]
+
+
+def test_digital_options_get_no_sku():
+    assert both(["Digital download", "8x10"], ["P_8X10", "P_A4"]) == ["", "P_8X10"]
+
+
+@pytest.mark.parametrize("n_skus", [5, SKU_INDEX_MIN_TOKENS + 20])
+def test_random_listings_match_linear_scan(n_skus):
+    # n_skus > SKU_INDEX_MIN_TOKENS → đi qua index chuỗi con thay cho quét thẳng
+    rng = random.Random(n_skus)
+    pieces = ["8x10", "11x14", "A4", "A3", "5x7", "XL", "L", "M", "S", "RED", "BLUE", "1", "12", ""]
+    for _ in range(300):
+        skus = [f"P{rng.randint(0, 9)}_{rng.choice(pieces)}{rng.choice(['', str(rng.randint(0, 30))])}"
+                for _ in range(rng.randint(1, n_skus))]
+        opt1 = [rng.choice(pieces + ["Digital download", "Color " + rng.choice(pieces)])
+                for _ in range(rng.randint(1, n_skus + 3))]
+        by_pos = skus[:len(opt1)]
+        matcher = SkuMatcher(skus, by_pos)
+        got = ["" if is_digital_like(o) else matcher.match(o) for o in opt1]
+        assert got == linear_match(opt1, skus, by_pos)
+
+
+def test_index_used_for_large_listings(monkeypatch):
+    monkeypatch.setattr(converter, "SKU_INDEX_MIN_TOKENS", 0)
+    matcher = SkuMatcher(["P_A4", "P_A3"])
+    assert [matcher.match("A"), matcher.match("A")] == ["P_A4", "P_A3"]
+    assert matcher._containing is not None
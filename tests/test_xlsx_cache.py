@@ -0,0 +1,39 @@
+# Cache Parquet của XLSX phải đổi theo mapping cột: khai báo mapping sau khi đã cache → không trả projection cũ
+import pandas as pd
+import pytest
+
+from converter import SCHEMAS, convert_tiktok_to_shopify
+
+
+@pytest.fixture
+def custom_xlsx(tmp_path):
+    path = tmp_path / "shop.xlsx"
+    pd.DataFrame({
+        "Product Name": ["Ao thun", "Non"],
+        "Gia": ["100", "50"],
+        "Seller SKU": ["A1", "N1"],
+        "Main Image": ["https://cdn/a.jpg", "https://cdn/n.jpg"],
+    }).to_excel(path, index=False)
+    yield str(path)
+    SCHEMAS.clear_mappings()
+
+
+def test_cache_follows_registered_mapping(custom_xlsx, tmp_path):
+    cache = str(tmp_path / "cache")
+    before = convert_tiktok_to_shopify(custom_xlsx, cache_dir=cache)
+    assert (before["Variant Price"].fillna("") == "").all()
+
+    SCHEMAS.register("tiktok", {"price": "Gia"})
+    cached = convert_tiktok_to_shopify(custom_xlsx, cache_dir=cache)
+    fresh = convert_tiktok_to_shopify(custom_xlsx)
+    assert cached["Variant Price"].tolist() == fresh["Variant Price"].tolist() != before["Variant Price"].tolist()
+    pd.testing.assert_frame_equal(cached, fresh)
+
+
+def test_cache_reused_for_same_mapping(custom_xlsx, tmp_path):
+    cache = tmp_path / "cache"
+    SCHEMAS.register("tiktok", {"price": "Gia"})
+    first = convert_tiktok_to_shopify(custom_xlsx, cache_dir=str(cache))
+    second = convert_tiktok_to_shopify(custom_xlsx, cache_dir=str(cache))
+    assert len(list(cache.glob("*.parquet"))) == 1
+    pd.testing.assert_frame_equal(first, second)